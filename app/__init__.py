@@ -1,3 +1,10 @@
+import os
+
+# Started before anything else is imported, so that every import is timed
+if os.getenv('STARTUP_PROFILE'):
+    from .startup import profile_imports
+    profile_imports()
+
 VERSION = '0.0.1'
 
 START_PAGE_TITLE_EN = 'Start census'
@@ -1,7 +1,4 @@
-from aiohttp import web
+from .workers import run
 
-from .app import create_app
 
-
-app = create_app()
-web.run_app(app, port=app['PORT'])
+run()
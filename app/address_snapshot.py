@@ -0,0 +1,222 @@
+import bisect
+import csv
+import heapq
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+from array import array
+
+from structlog import get_logger
+
+from . import metrics, normalise
+from .support_centres import postcode_key
+
+logger = get_logger('respondent-home')
+
+address_snapshot_lookups = metrics.registry.counter(
+    'address_snapshot_lookups_total', 'AIMS postcode searches made against the address snapshot, by result.',
+    ('result',))
+
+MAGIC = b'RHAS'
+VERSION = 1
+# Magic, version, epoch and the number of postcodes, followed by the postcode keys, the offsets of each
+# postcode's addresses and the addresses as tab separated uprn and formattedAddress lines
+header = struct.Struct('<4sH2x16sQ')
+EPOCH_SIZE = 16
+# Rows held in memory at once while building a snapshot. Each run of them is sorted and written to a temporary
+# file, and the runs are merged as the snapshot is written.
+RUN_SIZE = 200000
+
+
+def _little_endian(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def read_export(path):
+    """
+    Read (postcode, uprn, formattedAddress) rows from a CSV export of an AIMS epoch, with a header row naming
+    at least the postcode, uprn and formattedAddress columns.
+    """
+    with open(path, newline='', encoding='utf-8') as export_file:
+        for row in csv.DictReader(export_file):
+            yield row['postcode'], row['uprn'], row['formattedAddress']
+
+
+def _write_run(run, directory):
+    run.sort()
+    run_file = tempfile.TemporaryFile('w+', encoding='utf-8', newline='', dir=directory)
+    for key, _, uprn, row, formatted_address in run:
+        run_file.write(f'{key}\t{uprn}\t{row}\t{formatted_address}\n')
+    run_file.seek(0)
+    return run_file
+
+
+def _read_run(run_file):
+    for line in run_file:
+        key, uprn, row, formatted_address = line[:-1].split('\t', 3)
+        yield int(key), len(uprn), uprn, int(row), formatted_address
+
+
+def _sorted_runs(rows, directory, run_size):
+    """Temporary files of the valid rows, in runs of run_size sorted by postcode, uprn and position in rows"""
+    runs = []
+    run = []
+    for row, (postcode, uprn, formatted_address) in enumerate(rows):
+        postcode, error = normalise.check_postcode(postcode)
+        if error:
+            continue
+        # Tabs and line breaks would split a record
+        run.append((postcode_key(postcode), len(uprn), uprn, row, ' '.join(formatted_address.split())))
+        if len(run) == run_size:
+            runs.append(_write_run(run, directory))
+            run = []
+    if run:
+        runs.append(_write_run(run, directory))
+    return runs
+
+
+def build(rows, path, epoch, run_size=RUN_SIZE):
+    """
+    Write an address snapshot of the addresses at each postcode, in uprn order, for the given AIMS epoch.
+    Rows are sorted in runs of run_size written to temporary files beside path, which are merged into the
+    snapshot, so that an export of every address need not fit in memory. Where a uprn appears more than once at
+    a postcode, the last row is kept.
+
+    :param rows: (postcode, uprn, formattedAddress) tuples
+    :return: The number of postcodes written
+    """
+    epoch = epoch.encode('utf-8')
+    if len(epoch) > EPOCH_SIZE:
+        raise ValueError(f'epoch {epoch!r} is longer than the {EPOCH_SIZE} bytes an address snapshot can hold')
+    directory = os.path.dirname(os.path.abspath(path))
+    runs = _sorted_runs(rows, directory, run_size)
+    keys = array('Q')
+    offsets = array('Q', [0])
+    try:
+        with tempfile.TemporaryFile(dir=directory) as records:
+            def write(record):
+                key, _, uprn, _, formatted_address = record
+                records.write(f'{uprn}\t{formatted_address}\n'.encode('utf-8'))
+                if keys and keys[-1] == key:
+                    offsets[-1] = records.tell()
+                else:
+                    keys.append(key)
+                    offsets.append(records.tell())
+
+            last = None
+            for record in heapq.merge(*(_read_run(run) for run in runs)):
+                if last is not None and record[:3] != last[:3]:
+                    write(last)
+                last = record
+            if last is not None:
+                write(last)
+
+            records.seek(0)
+            with open(path, 'wb') as snapshot_file:
+                snapshot_file.write(header.pack(MAGIC, VERSION, epoch, len(keys)))
+                snapshot_file.write(_little_endian(keys).tobytes())
+                snapshot_file.write(_little_endian(offsets).tobytes())
+                shutil.copyfileobj(records, snapshot_file)
+    finally:
+        for run in runs:
+            run.close()
+    return len(keys)
+
+
+class AddressSnapshot:
+    """
+    The addresses at every postcode in an AIMS epoch, read from a file built by build().
+
+    The file is memory mapped read only, so the workers on a host share a single copy through the page cache
+    and only the pages holding the postcodes searched for are read. A search decodes only the addresses at
+    its postcode, and answers in the shape of an AIMS postcode response read by read_postcode_response.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as snapshot_file:
+            self._map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, epoch, count = header.unpack_from(self._map)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f'{path} is not an address snapshot')
+            self.epoch = epoch.rstrip(b'\0').decode('utf-8')
+            view = self._view = memoryview(self._map)
+            keys_end = header.size + 8 * count
+            offsets_end = keys_end + 8 * (count + 1)
+            if sys.byteorder == 'big':
+                self.keys = _little_endian(array('Q', view[header.size:keys_end]))
+                self.offsets = _little_endian(array('Q', view[keys_end:offsets_end]))
+            else:
+                self.keys = view[header.size:keys_end].cast('Q')
+                self.offsets = view[keys_end:offsets_end].cast('Q')
+            self._records = offsets_end
+        except Exception:
+            self.close()
+            raise
+
+    def __len__(self):
+        return len(self.keys)
+
+    def close(self):
+        # The map can only be closed once nothing is viewing it
+        for name in ('keys', 'offsets', '_view'):
+            values = getattr(self, name, None)
+            if isinstance(values, memoryview):
+                values.release()
+        self.keys = self.offsets = ()
+        self._map.close()
+
+    def postcode(self, postcode, limit=None):
+        """
+        :return: The AIMS postcode response for the addresses at postcode, or None when the postcode is not
+                 in the snapshot
+        """
+        try:
+            key = postcode_key(postcode)
+        except ValueError:
+            return None
+        position = bisect.bisect_left(self.keys, key)
+        if position == len(self.keys) or self.keys[position] != key:
+            address_snapshot_lookups.inc('miss')
+            return None
+        address_snapshot_lookups.inc('hit')
+        start = self._records + self.offsets[position]
+        end = self._records + self.offsets[position + 1]
+        lines = self._map[start:end].decode('utf-8').split('\n')[:-1]
+        addresses = []
+        for line in lines[:limit]:
+            uprn, formatted_address = line.split('\t', 1)
+            addresses.append({'uprn': uprn, 'formattedAddress': formatted_address})
+        return {'response': {'addresses': addresses, 'total': len(lines)}}
+
+
+def setup(app):
+    """
+    Open the address snapshot in ADDRESS_SNAPSHOT_FILE, used to answer postcode searches without calling AIMS,
+    for example during a surge. The snapshot is only used when it was built for ADDRESS_INDEX_EPOCH, so that
+    respondents are not offered addresses from another epoch.
+    """
+    if not app['ADDRESS_SNAPSHOT_FILE']:
+        return None
+    start = time.perf_counter()
+    snapshot = AddressSnapshot(app['ADDRESS_SNAPSHOT_FILE'])
+    if snapshot.epoch != app['ADDRESS_INDEX_EPOCH']:
+        logger.warn('address snapshot is for another epoch, searching AIMS instead',
+                    snapshot_epoch=snapshot.epoch, epoch=app['ADDRESS_INDEX_EPOCH'])
+        snapshot.close()
+        return None
+    logger.info('address snapshot opened', postcodes=len(snapshot), epoch=snapshot.epoch,
+                duration=round(time.perf_counter() - start, 3))
+
+    async def close_snapshot(app):
+        snapshot.close()
+
+    app.on_cleanup.append(close_snapshot)
+    return snapshot
@@ -1,31 +1,78 @@
 import types
 
+from collections import OrderedDict
+
 import aiohttp_jinja2
 import jinja2
 from aiohttp import BasicAuth, ClientSession, ClientTimeout, TCPConnector
-from aiohttp.client_exceptions import (ClientConnectionError,
-                                       ClientConnectorError,
-                                       ClientResponseError)
 from aiohttp.web import Application
 from aiohttp_utils import negotiation, routing
 from structlog import get_logger
 from app import i18n
 
 from . import config
+from . import eq_tokens
 from . import error_handlers
 from . import flash
 from . import google_analytics
+from . import health
+from . import idempotency
 from . import domains
+from . import json_codec
 from . import jwt
+from . import lookup_cache
+from . import metrics
+from . import negative_cache
+from . import rate_limit
 from . import routes
 from . import security
 from . import session
 from . import settings
+from . import startup
 from . import trace
-from .app_logging import logger_initial_config
+from . import tracing
+from .app_logging import logger_initial_config, parse_sample_rates
 
 logger = get_logger('respondent-home')
 
+template_loader = jinja2.PackageLoader('app', 'templates')
+template_extensions = ['app.i18n.i18n']
+
+
+class TemplateCache(jinja2.BytecodeCache):
+    """
+    Compiled templates kept in memory, so that every app created in this process, and every worker forked
+    from it, uses templates compiled once rather than compiling its own.
+    """
+    def __init__(self):
+        self.compiled = {}
+
+    def load_bytecode(self, bucket):
+        compiled = self.compiled.get(bucket.key)
+        if compiled is not None:
+            bucket.bytecode_from_string(compiled)
+
+    def dump_bytecode(self, bucket):
+        self.compiled[bucket.key] = bucket.bytecode_to_string()
+
+
+template_cache = TemplateCache()
+
+
+def compile_templates() -> int:
+    """Compile every template into the template cache, returning the number compiled"""
+    env = jinja2.Environment(loader=template_loader, extensions=template_extensions, bytecode_cache=template_cache)
+    env.install_gettext_translations(i18n, newstyle=True)
+    compiled = 0
+    for name in env.list_templates(extensions=['html']):
+        try:
+            env.get_template(name)
+        except jinja2.TemplateError:
+            logger.warn('could not compile template', template=name)
+            continue
+        compiled += 1
+    return compiled
+
 
 async def on_startup(app):
     # by limiting keep-alive, we help prevent errors during RHSvc scale-back.
@@ -38,21 +85,13 @@ async def on_cleanup(app):
 
 
 async def check_services(app: Application) -> bool:
-    for service_name in app.service_status_urls:
-        url = app.service_status_urls[service_name]
-        logger.info('making health check get request', url=url)
-        try:
-            async with app.http_session_pool.get(url) as resp:
-                resp.raise_for_status()
-        except (ClientConnectorError, ClientConnectionError,
-                ClientResponseError):
-            logger.error('failed to connect to required service',
-                         config=service_name,
-                         url=url)
-            return False
-    else:
-        logger.info('all required services are healthy')
-        return True
+    """Probe the required services now, rather than reporting the cached results"""
+    statuses = await app.health_checker.check()
+    return all(status.healthy for status in statuses.values())
+
+
+def render_json(request, data):
+    return json_codec.dumps_bytes(data)
 
 
 def jinja_filter_set_attributes(dictionary, attributes):
@@ -61,9 +100,9 @@ def jinja_filter_set_attributes(dictionary, attributes):
     return dictionary
 
 
-def create_app(config_name=None) -> Application:
+def load_config(config_name=None) -> config.Config:
     """
-    App factory. Sets up routes and all plugins.
+    The settings and the named configuration, or the one named by ENV.
     """
     app_config = config.Config()
     app_config.from_object(settings)
@@ -77,15 +116,37 @@ def create_app(config_name=None) -> Application:
         app_config.__setitem__(key, BasicAuth(*app_config[key]))
         for key in app_config if key.endswith('_AUTH') and not key == "GTM_AUTH"
     ]
+    return app_config
+
+
+def create_app(config_name=None, overrides=None) -> Application:
+    """
+    App factory. Sets up routes and all plugins.
+
+    :param overrides: Configuration values to use instead of the configured ones
+    """
+    startup_profile = startup.StartupProfile()
+    app_config = load_config(config_name)
+    config_name = (config_name or app_config['ENV'])
+    app_config.update(overrides or {})
+    startup_profile.mark('config')
+
+    session_middleware = session.setup(app_config)
+    startup_profile.mark('session')
+    middlewares = [
+        ('nonce', security.nonce_middleware),
+        ('session', session_middleware),
+        ('flash', flash.flash_middleware),
+        ('trace', trace.trace_middleware)
+    ]
+    if app_config['TRACING_EXPORTER']:
+        middlewares = tracing.trace_middlewares(middlewares)
+    else:
+        middlewares = [middleware for _, middleware in middlewares]
 
     app = Application(
         debug=settings.DEBUG,
-        middlewares=[
-            security.nonce_middleware,
-            session.setup(app_config),
-            flash.flash_middleware,
-            trace.trace_middleware
-        ],
+        middlewares=[metrics.metrics_middleware, *middlewares],
         router=routing.ResourceRouter(),
     )
 
@@ -95,6 +156,15 @@ def create_app(config_name=None) -> Application:
     # Store upper-cased configuration variables on app
     app.update(app_config)
 
+    # Select the JSON library used for outbound calls, sessions, responses and logs
+    json_codec.configure(app['JSON_CODEC'])
+
+    # Create the HTTP session pool before any other startup hook, as health checks, the outbox and warm-up use it
+    app.on_startup.append(on_startup)
+
+    # Report the metrics of every worker on the host from /metrics
+    app['worker_metrics'] = metrics.setup(app)
+
     # Store a dict of health check urls for required services
     app.service_status_urls = app_config.get_service_urls_mapped_with_path(
         path='/info',
@@ -103,39 +173,103 @@ def create_app(config_name=None) -> Application:
             'ADDRESS_INDEX_SVC_URL', 'AD_LOOK_UP_SVC_URL'
         ])
 
+    # Probe required services and Redis concurrently, refreshing the results in the background
+    redis_pool = getattr(session_middleware, 'redis_pool', None)
+    app.health_checker = health.setup(app, redis_pool=redis_pool)
+
+    # Limit access code entry before it reaches RHSvc, and answer recently rejected codes without asking again
+    app['uac_rate_limiter'] = rate_limit.setup(app, redis_pool=redis_pool)
+    app['invalid_uac_cache'] = negative_cache.setup(app, redis_pool=redis_pool)
+    app['submissions'] = idempotency.setup(app, redis_pool=redis_pool)
+
+    # Optional parts are only imported when their settings turn them on, so that they add nothing to startup otherwise
+    app['outbox'] = None
+    if app['OUTBOX_ENABLED']:
+        from . import outbox
+        app['outbox'] = outbox.setup(app, redis_pool=redis_pool)
+
+    # Cache AIMS postcode, fulfilment and support centre lookups
+    app['shared_cache'] = None
+    if app['SHARED_CACHE_FILE']:
+        from . import shared_cache
+        app['shared_cache'] = shared_cache.setup(app)
+    lookup_cache.setup(app, redis_pool=redis_pool, shared=app['shared_cache'])
+
+    # Find support centres and addresses at a postcode in this process, when there are snapshots of them
+    app['support_centre_index'] = None
+    if app['SUPPORT_CENTRES_FILE']:
+        from . import support_centres
+        app['support_centre_index'] = support_centres.setup(app)
+    app['address_snapshot'] = None
+    if app['ADDRESS_SNAPSHOT_FILE']:
+        from . import address_snapshot
+        app['address_snapshot'] = address_snapshot.setup(app)
+    startup_profile.mark('services')
+
+    # Watch for synchronous work holding up the event loop
+    if float(app['LOOP_MONITOR_INTERVAL']):
+        from . import loop_monitor
+        loop_monitor.setup(app)
+
     # Monkey patch the check_services function as a method to the app object
     app.check_services = types.MethodType(check_services, app)
 
     # Bind logger
     logger_initial_config(log_level=app['LOG_LEVEL'],
-                          ext_log_level=app['EXT_LOG_LEVEL'])
+                          ext_log_level=app['EXT_LOG_LEVEL'],
+                          use_queue=app['LOG_QUEUE'],
+                          sample_rates=parse_sample_rates(app['LOG_SAMPLE_RATES']),
+                          rate_limit=float(app['LOG_RATE_LIMIT']),
+                          rate_burst=float(app['LOG_RATE_BURST']),
+                          dropped_report_interval=float(app['LOG_DROPPED_REPORT_INTERVAL']))
+    startup_profile.mark('logging')
 
     # Set up routes
     routes.setup(app, url_path_prefix=app['URL_PATH_PREFIX'])
 
     # Use content negotiation middleware to render JSON responses
-    negotiation.setup(app)
+    negotiation.setup(app, renderers=OrderedDict([('application/json', render_json)]))
+    startup_profile.mark('routes')
 
     # Setup jinja2 environment
     env = aiohttp_jinja2.setup(
         app,
-        loader=jinja2.PackageLoader('app', 'templates'),
+        loader=template_loader,
         context_processors=[
             flash.context_processor, aiohttp_jinja2.request_processor,
             google_analytics.ga_ua_id_processor, domains.domain_processor, security.context_processor
         ],
-        extensions=['app.i18n.i18n'])
+        extensions=template_extensions,
+        bytecode_cache=template_cache)
 
     env.filters['setAttributes'] = jinja_filter_set_attributes
     env.install_gettext_translations(i18n, newstyle=True)
+    startup_profile.mark('templates')
+
+    # Record spans for handlers and rendering, and export them
+    if app['TRACING_EXPORTER']:
+        tracing.setup(app)
 
     # JWT KeyStore
-    app['key_store'] = jwt.key_store(app['JSON_SECRET_KEYS'])
+    key_store = jwt.key_store(app['JSON_SECRET_KEYS'])
+    startup_profile.mark('key_store')
+
+    # Encrypt EQ launch tokens off the event loop. app['key_store'] is whichever keys it has last loaded.
+    app['token_encrypter'] = eq_tokens.setup(app, key_store)
+    app['key_store'] = eq_tokens.CurrentKeyStore(app['token_encrypter'])
 
-    app.on_startup.append(on_startup)
     app.on_cleanup.append(on_cleanup)
+
+    # Fill the lookup caches in the background
+    app['warm_up'] = None
+    if app['WARM_UP_FILE']:
+        from . import warm_up
+        app['warm_up'] = warm_up.setup(app)
     app.on_response_prepare.append(security.on_prepare)
 
+    startup_profile.mark('hooks')
     logger.info('app setup complete', config=config_name)
+    if app['STARTUP_PROFILE']:
+        startup_profile.log(config=config_name)
 
     return app
@@ -1,149 +1,370 @@
+import atexit
 import os
 import sys
 import logging
 import structlog
 import time
-from collections import OrderedDict
+import traceback
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue
 from pythonjsonlogger import jsonlogger
 
+from . import json_codec
+
 service = 'rhui'
 
+# Attribute used to hand the structlog event dict to the formatter, so it need not walk the record
+STRUCTLOG_DATA = 'structlog_data'
+
 # Standard fields on logging records that we don't want directly inserted into the data dictionary
-ignored_fields = ('args', 'asctime', 'created', 'exc_info', 'exc_text',
-                  'filename', 'funcName', 'levelname', 'levelno', 'lineno',
-                  'module', 'msecs', 'message', 'msg', 'name', 'pathname',
-                  'process', 'processName', 'relativeCreated', 'stack_info',
-                  'thread', 'threadName', 'extra')
+ignored_fields = frozenset(('args', 'asctime', 'created', 'exc_info', 'exc_text',
+                            'filename', 'funcName', 'levelname', 'levelno', 'lineno',
+                            'module', 'msecs', 'message', 'msg', 'name', 'pathname',
+                            'process', 'processName', 'relativeCreated', 'stack_info',
+                            'thread', 'threadName', 'extra', STRUCTLOG_DATA))
+
+
+def render_to_log_kwargs(_, __, event_dict):
+    """
+    Like structlog.stdlib.render_to_log_kwargs, but also passes the event dict through as a single
+    record attribute. The individual keys are still set on the record for anything inspecting it.
+    """
+    event = event_dict.pop('event')
+    extra = dict(event_dict)
+    extra[STRUCTLOG_DATA] = event_dict
+    return {'msg': event, 'extra': extra}
+
+
+def safe_update(dict_target, dict_source, prefix='_'):
+    for key in dict_source:
+        new_key = key
+        while new_key in dict_target:
+            new_key = prefix + new_key
+        dict_target[new_key] = dict_source[key]
 
 
-class CustomJsonFormatter(jsonlogger.JsonFormatter):
+class CustomJsonFormatter(logging.Formatter):
+    """
+    Format records as a single line of JSON:
+
+    {"created", "service", "level", "event", "context", "data": {"source", ...record fields}}
+
+    Everything that does not change between records, such as where a source file lives and how it is shown,
+    is worked out once and cached.
+    """
     lib_dir = os.path.normpath(os.path.split(sys.executable)[0] + '/..')
     cw_dir = os.getcwd()
 
+    def __init__(self, json_serializer=None, json_default=None):
+        super().__init__()
+        self.json_serializer = json_serializer or json_codec.dumps
+        self.json_default = json_default or jsonlogger.JsonEncoder().default
+        self._files = {}
+        self._sources = {}
+        self._second = None
+        self._second_text = None
+
     def formatTime(self, record, datefmt=None):
+        # Return the creation time of the specified LogRecord with millisecond granularity.
+        # The seconds part only changes once a second, so it is formatted once and reused.
+        second = int(record.created)
+        if second != self._second:
+            self._second_text = time.strftime('%Y-%m-%dT%H:%M:%S', self.converter(record.created))
+            self._second = second
+        return '%s.%03d' % (self._second_text, record.msecs)
 
-        # Return the creation time of the specified LogRecord as formatted text, overriding the
-        # superclass version to ensure that millisecond granularity is recorded.
-
-        # The superclass version only has second granularity since that is all time.strftime provides.
-        # This method combines the millisecond parts of the time, with the formatted time (to second granularity)
-        # to provide a millisecond formatted result.
-
-        date_format = '%Y-%m-%dT%H:%M:%S'
-        msec_format = '%s.%03d'
-        ct = self.converter(record.created)
-        t = time.strftime(date_format, ct)
-        return msec_format % (t, record.msecs)
-
-    def add_fields(self, log_record, record, message_dict):
-        def map_into(dict_from, old_name, dict_into, new_name):
-            if old_name not in dict_from:
-                # No old name, ignore it.
-                return
-            if new_name in dict_into:
-                if dict_from[old_name] == dict_into[new_name]:
-                    # Delete the old name, it's identical.
-                    del dict_from[old_name]
-                # Othewise, leave both entries. We don't want to lose data.
-            else:
-                # Copy the record and delete the old one
-                dict_into[new_name] = dict_from[old_name]
-                del dict_from[old_name]
-
-        def extract(dict_from, name):
-            if name not in dict_from:
-                return None
-            else:
-                val = dict_from[name]
-                del dict_from[name]
-                return val
-
-        def safe_update(dict_target, dict_source, prefix='_'):
-            for key in dict_source:
-                new_key = key
-                while True:
-                    if new_key in dict_target:
-                        new_key = prefix + new_key
-                    else:
-                        dict_target[new_key] = dict_source[key]
-                        break
-
-        data = OrderedDict()
-        log_record.clear()
-
-        # # Created, Service, Level
-        log_record['created'] = record.asctime
-        log_record['service'] = service
-        log_record['level'] = record.levelname
-
-        # # Process the file name early, because we need it later
-        if record.pathname and record.pathname.startswith(self.cw_dir):
-            file_name = '(pwd)' + record.pathname[len(self.cw_dir):]
-            internal = True
-        elif record.pathname and record.pathname.startswith(self.lib_dir):
-            file_name = '(python)' + record.pathname[len(self.lib_dir):]
-            internal = False
+    def file_name(self, pathname):
+        """
+        Return the file name to show for a source path, and whether the path is part of this service.
+        """
+        try:
+            return self._files[pathname]
+        except KeyError:
+            pass
+        if pathname and pathname.startswith(self.cw_dir):
+            result = '(pwd)' + pathname[len(self.cw_dir):], True
+        elif pathname and pathname.startswith(self.lib_dir):
+            result = '(python)' + pathname[len(self.lib_dir):], False
         else:
-            file_name = '(no source)'
-            internal = True
+            result = '(no source)', True
+        self._files[pathname] = result
+        return result
 
-        # # Event
+    def source(self, record, file_name):
+        key = (record.name, record.module, file_name, record.lineno)
+        try:
+            return self._sources[key]
+        except KeyError:
+            logger_name = record.name or '(no logger)'
+            module = record.module or '(no module)'
+            line_no = str(record.lineno) if record.lineno else '(no line)'
+            source = self._sources[key] = ':'.join([logger_name, module, file_name, line_no])
+            return source
+
+    def format(self, record):
+        message = record.getMessage()
+        file_name, internal = self.file_name(record.pathname)
+
+        data = {'source': self.source(record, file_name)}
         if internal:
-            if message_dict:
-                if 'message' in message_dict:
-                    log_record['event'] = message_dict['message']
-                    del message_dict['message']
-                elif 'event' in message_dict:
-                    log_record['event'] = message_dict['event']
-                    del message_dict['event']
-                else:
-                    log_record['event'] = 'No event supplied'
-            else:
-                log_record['event'] = record.message
+            event = message
         else:
             # we can't rely on the library giving us a static string.
-            log_record['event'] = 'External from ' + record.name
+            event = 'External from ' + record.name
             # since we didn't use this, we must map it to data.
-            data['message'] = record.message
-
-        # # Context
-        # Currently, we don't have enough good data to use for a context
-        log_record['context'] = ''
-
-        # # Data
-        # Custom field - source
-        logger_name = record.name or '(no logger)'
-        module = record.module or '(no module)'
-        line_no = str(record.lineno) if record.lineno else '(no line)'
-        # Uses the file name from the section above
-        data['source'] = ':'.join([logger_name, module, file_name, line_no])
-
-        # Raw additions on the main record object
-        raw_data = {
-            k: v
-            for k, v in record.__dict__.items()
-            if (k not in ignored_fields
-                and not (hasattr(k, 'startswith') and k.startswith('_')))
-        }
-        safe_update(data, raw_data, 'raw_')
-        # Additions through the message dictionary
-        safe_update(data, message_dict, 'message_')
+            data['message'] = message
+
+        structlog_data = record.__dict__.get(STRUCTLOG_DATA)
+        if structlog_data is not None:
+            safe_update(data, structlog_data, 'raw_')
+        else:
+            safe_update(data, {
+                key: value
+                for key, value in record.__dict__.items()
+                if key not in ignored_fields and not key.startswith('_')
+            }, 'raw_')
         # Additions through the extra key of the main record object
         if hasattr(record, 'extra'):
             safe_update(data, record.extra, 'extra_')
-        log_record['data'] = data
+
+        if record.exc_info:
+            data.setdefault('exc_info', self.formatException(record.exc_info))
+        elif record.exc_text:
+            data.setdefault('exc_info', record.exc_text)
+        if record.stack_info:
+            data.setdefault('stack_info', self.formatStack(record.stack_info))
+
+        return self.json_serializer({
+            'created': self.formatTime(record),
+            'service': service,
+            'level': record.levelname,
+            'event': event,
+            # Currently, we don't have enough good data to use for a context
+            'context': '',
+            'data': data,
+        }, default=self.json_default)
+
+
+class FastCallerLogger(logging.Logger):
+    """
+    Logger that finds the calling frame outside logging and structlog by looking up each frame's file in a
+    cache, rather than testing every frame's module name against a list of prefixes on every call.
+    Frames in the modules named by the LoggerFactory's ignore_frame_names are skipped too.
+    """
+    skipped_modules = ('structlog', 'logging')
+
+    # Whether each file is in one of the skipped modules, by the skipped modules
+    skipped_files = {}
+
+    def __init__(self, name, level=logging.NOTSET):
+        super().__init__(name, level)
+        self._skipped_files = self.skipped_files.setdefault(self.skipped_modules, {})
+
+    def ignore_frame_names(self, names):
+        self.skipped_modules = tuple(dict.fromkeys((*FastCallerLogger.skipped_modules, *names)))
+        self._skipped_files = self.skipped_files.setdefault(self.skipped_modules, {})
+
+    def skip_frame(self, frame):
+        file_name = frame.f_code.co_filename
+        try:
+            return self._skipped_files[file_name]
+        except KeyError:
+            module_name = frame.f_globals.get('__name__') or '?'
+            skip = self._skipped_files[file_name] = module_name.startswith(self.skipped_modules)
+            return skip
+
+    def findCaller(self, stack_info=False, stacklevel=1):
+        """As Logger.findCaller, with stacklevel counting only the frames that are not skipped"""
+        frame = caller = sys._getframe(1)
+        for _ in range(max(stacklevel, 1)):
+            while frame.f_back is not None and self.skip_frame(frame):
+                frame = frame.f_back
+            if self.skip_frame(frame):
+                break
+            caller = frame
+            if frame.f_back is None:
+                break
+            frame = frame.f_back
+        stack = None
+        if stack_info:
+            stack = 'Stack (most recent call last):\n' + ''.join(traceback.format_stack(caller)).rstrip('\n')
+        return caller.f_code.co_filename, caller.f_lineno, caller.f_code.co_name, stack
+
+
+class LoggerFactory(structlog.stdlib.LoggerFactory):
+    """
+    structlog's LoggerFactory, passing ignore_frame_names on to FastCallerLogger. Unlike structlog's, it does not
+    change the logger class on construction, which logger_initial_config does instead.
+    """
+    def __init__(self, ignore_frame_names=None):
+        self._ignore = ignore_frame_names
+
+    def __call__(self, *args):
+        logger = super().__call__(*args)
+        if self._ignore and isinstance(logger, FastCallerLogger):
+            logger.ignore_frame_names(self._ignore)
+        return logger
+
+
+class LogQueueHandler(QueueHandler):
+    """
+    Hand records to the listener thread without formatting them first, so that neither
+    formatting nor writing to stdout happens on the event loop.
+    """
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class LogVolumeFilter(logging.Filter):
+    """
+    Thin out DEBUG and INFO records so that log volume grows more slowly than traffic.
+
+    Records whose event starts with one of the sample_rates prefixes are sampled, keeping 1 in every
+    1 / rate of them. All other DEBUG and INFO records then share a token bucket of rate_limit records per
+    second, holding up to rate_burst tokens. WARN and above are always kept.
+
+    The number of records dropped is logged every report_interval seconds, when there is something to report.
+    """
+    def __init__(self, sample_rates=None, rate_limit=0, rate_burst=None, report_interval=60, clock=time.monotonic):
+        super().__init__()
+        self.sample_every = {
+            prefix: max(1, int(round(1 / rate))) if rate > 0 else 0
+            for prefix, rate in (sample_rates or {}).items()
+        }
+        self.sample_prefixes = tuple(self.sample_every)
+        self.sample_counts = dict.fromkeys(self.sample_every, 0)
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst or rate_limit
+        self.tokens = self.rate_burst
+        self.report_interval = report_interval
+        self.clock = clock
+        self.last_refill = self.last_report = clock()
+        self.dropped_sampled = dict.fromkeys(self.sample_every, 0)
+        self.dropped_rate_limited = 0
+        self.reporting = False
+
+    def filter(self, record):
+        if self.reporting:
+            return True
+        self.report_dropped()
+        if record.levelno >= logging.WARNING:
+            return True
+        return self.sample(record) and self.take_token()
+
+    def sample(self, record):
+        event = record.msg
+        if not self.sample_prefixes or not isinstance(event, str) or not event.startswith(self.sample_prefixes):
+            return True
+        for prefix in self.sample_prefixes:
+            if event.startswith(prefix):
+                every = self.sample_every[prefix]
+                count = self.sample_counts[prefix]
+                self.sample_counts[prefix] = count + 1
+                if every and count % every == 0:
+                    return True
+                self.dropped_sampled[prefix] += 1
+                return False
+        return True
+
+    def take_token(self):
+        if not self.rate_limit:
+            return True
+        now = self.clock()
+        self.tokens = min(self.rate_burst, self.tokens + (now - self.last_refill) * self.rate_limit)
+        self.last_refill = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        self.dropped_rate_limited += 1
+        return False
+
+    def report_dropped(self):
+        now = self.clock()
+        if now - self.last_report < self.report_interval:
+            return
+        self.last_report = now
+        dropped_sampled = {prefix: count for prefix, count in self.dropped_sampled.items() if count}
+        if not dropped_sampled and not self.dropped_rate_limited:
+            return
+        dropped_rate_limited = self.dropped_rate_limited
+        self.dropped_sampled = dict.fromkeys(self.sample_every, 0)
+        self.dropped_rate_limited = 0
+        self.reporting = True
+        try:
+            structlog.get_logger('respondent-home').warn('log records dropped',
+                                                         dropped_sampled=dropped_sampled,
+                                                         dropped_rate_limited=dropped_rate_limited,
+                                                         report_interval=self.report_interval)
+        finally:
+            self.reporting = False
+
+
+def parse_sample_rates(sample_rates):
+    """
+    Parse 'event prefix=rate,other prefix=rate' into a dict of prefix to rate.
+    """
+    rates = {}
+    for item in (sample_rates or '').split(','):
+        if item.strip():
+            prefix, _, rate = item.rpartition('=')
+            rates[prefix.strip()] = float(rate)
+    return rates
+
+
+queue_listener = None
+# The root handler installed by logger_initial_config and the settings it was installed with
+root_handler = None
+root_handler_settings = None
+
+
+def stop_queue_listener():
+    global queue_listener
+    if queue_listener:
+        queue_listener.stop()
+        queue_listener = None
 
 
 def logger_initial_config(log_level=os.getenv('LOG_LEVEL', 'INFO'),
-                          ext_log_level=os.getenv('EXT_LOG_LEVEL', 'WARN')):
-    format = '(message) (asctime) (levelname) (pathname) (lineno) (module) (funcName)'
+                          ext_log_level=os.getenv('EXT_LOG_LEVEL', 'WARN'),
+                          use_queue=False,
+                          sample_rates=None,
+                          rate_limit=0,
+                          rate_burst=None,
+                          dropped_report_interval=60):
+    global queue_listener, root_handler, root_handler_settings
+
+    # Thread and multiprocessing names are not part of our log format, so don't look them up for every record
+    logging.logThreads = False
+    logging.logMultiprocessing = False
+    logging.setLoggerClass(FastCallerLogger)
+
     json_handler = logging.StreamHandler(sys.stdout)
-    json_handler.setFormatter(CustomJsonFormatter(format))
+    json_handler.setFormatter(CustomJsonFormatter())
 
-    logging.basicConfig(
-        handlers=[json_handler],
-        level=logging.getLevelName(ext_log_level),
-    )
+    root_logger = logging.getLogger()
+    volume_settings = (sample_rates, rate_limit, rate_burst, dropped_report_interval)
+    settings = (bool(use_queue), volume_settings if sample_rates or rate_limit else None)
+    # Configured again with other settings, such as by the app after the launcher configured logging for itself
+    if root_handler is not None and root_logger.handlers == [root_handler] and settings != root_handler_settings:
+        root_logger.removeHandler(root_handler)
+        stop_queue_listener()
+    if not root_logger.handlers:
+        if use_queue:
+            log_queue = Queue()
+            queue_listener = QueueListener(log_queue, json_handler)
+            queue_listener.start()
+            atexit.register(stop_queue_listener)
+            root_handler = LogQueueHandler(log_queue)
+        else:
+            root_handler = json_handler
+        if sample_rates or rate_limit:
+            # Filter before queueing, so that dropped records cost as little as possible
+            root_handler.addFilter(LogVolumeFilter(*volume_settings))
+        root_logger.addHandler(root_handler)
+        root_handler_settings = settings
+        root_logger.setLevel(logging.getLevelName(ext_log_level))
 
     structlog.configure(
         processors=[
@@ -152,10 +373,10 @@ def logger_initial_config(log_level=os.getenv('LOG_LEVEL', 'INFO'),
             # structlog.processors.StackInfoRenderer(),
             structlog.processors.format_exc_info,
             structlog.processors.UnicodeDecoder(),
-            structlog.stdlib.render_to_log_kwargs,
+            render_to_log_kwargs,
         ],
         context_class=dict,
-        logger_factory=structlog.stdlib.LoggerFactory(),
+        logger_factory=LoggerFactory(),
         wrapper_class=structlog.stdlib.BoundLogger,
         cache_logger_on_first_use=True,
     )
@@ -164,4 +385,6 @@ def logger_initial_config(log_level=os.getenv('LOG_LEVEL', 'INFO'),
     logger.setLevel(log_level)
     logger.info('logging configured',
                 log_level=log_level,
-                ext_log_level=ext_log_level)
+                ext_log_level=ext_log_level,
+                sample_rates=sample_rates,
+                rate_limit=rate_limit)
@@ -39,8 +39,35 @@ class BaseConfig:
 
     HOST = env('HOST')
     PORT = env('PORT')
+    WORKERS = env('WORKERS', default='1')
+    EVENT_LOOP = env('EVENT_LOOP', default='uvloop')
     LOG_LEVEL = env('LOG_LEVEL')
     EXT_LOG_LEVEL = env('EXT_LOG_LEVEL')
+    LOG_QUEUE = env('LOG_QUEUE', cast=bool, default=False)
+    LOG_SAMPLE_RATES = env('LOG_SAMPLE_RATES', default='')
+    LOG_RATE_LIMIT = env('LOG_RATE_LIMIT', default='0')
+    LOG_RATE_BURST = env('LOG_RATE_BURST', default='0')
+    LOG_DROPPED_REPORT_INTERVAL = env('LOG_DROPPED_REPORT_INTERVAL', default='60')
+
+    TRACING_EXPORTER = env('TRACING_EXPORTER', default='')
+    TRACING_FILE = env('TRACING_FILE', default='spans.jsonl')
+
+    HEALTH_CHECK_TIMEOUT = env('HEALTH_CHECK_TIMEOUT', default='2')
+    HEALTH_CHECK_TIMEOUTS = env('HEALTH_CHECK_TIMEOUTS', default='')
+    HEALTH_CHECK_INTERVAL = env('HEALTH_CHECK_INTERVAL', default='10')
+    HEALTH_CHECK_TTL = env('HEALTH_CHECK_TTL', default='30')
+
+    LOOP_MONITOR_INTERVAL = env('LOOP_MONITOR_INTERVAL', default='0.5')
+    LOOP_LAG_THRESHOLD = env('LOOP_LAG_THRESHOLD', default='0.1')
+    LOOP_WATCHDOG_TIMEOUT = env('LOOP_WATCHDOG_TIMEOUT', default='2')
+    LOOP_DEBUG = env('LOOP_DEBUG', cast=bool, default=False)
+
+    JSON_CODEC = env('JSON_CODEC', default='orjson')
+
+    STARTUP_PROFILE = env('STARTUP_PROFILE', cast=bool, default=False)
+
+    METRICS_DIR = env('METRICS_DIR', default='')
+    METRICS_WRITE_INTERVAL = env('METRICS_WRITE_INTERVAL', default='5')
 
     DOMAIN_URL_PROTOCOL = env('DOMAIN_URL_PROTOCOL', default='https://')
     DOMAIN_URL_EN = env('DOMAIN_URL_EN')
@@ -49,6 +76,45 @@ class BaseConfig:
     ACCOUNT_SERVICE_URL = env('ACCOUNT_SERVICE_URL')
     EQ_URL = env('EQ_URL')
     JSON_SECRET_KEYS = env('JSON_SECRET_KEYS')
+    EQ_TOKEN_EXECUTOR = env('EQ_TOKEN_EXECUTOR', default='thread')
+    EQ_TOKEN_WORKERS = env('EQ_TOKEN_WORKERS', default='2')
+    JSON_SECRET_KEYS_FILE = env('JSON_SECRET_KEYS_FILE', default='')
+    JSON_SECRET_KEYS_RELOAD_INTERVAL = env('JSON_SECRET_KEYS_RELOAD_INTERVAL', default='30')
+
+    RATE_LIMIT_UAC_IP = env('RATE_LIMIT_UAC_IP', default='30/60')
+    RATE_LIMIT_UAC_SESSION = env('RATE_LIMIT_UAC_SESSION', default='10/60')
+
+    INVALID_UAC_CACHE_TTL = env('INVALID_UAC_CACHE_TTL', default='300')
+    INVALID_UAC_CACHE_CAPACITY = env('INVALID_UAC_CACHE_CAPACITY', default='100000')
+    INVALID_UAC_FILTER_REFRESH = env('INVALID_UAC_FILTER_REFRESH', default='5')
+
+    IDEMPOTENCY_TTL = env('IDEMPOTENCY_TTL', default='600')
+    IDEMPOTENCY_WAIT = env('IDEMPOTENCY_WAIT', default='10')
+
+    AIMS_POSTCODE_CACHE_TTL = env('AIMS_POSTCODE_CACHE_TTL', default='3600')
+    FULFILMENT_CACHE_TTL = env('FULFILMENT_CACHE_TTL', default='3600')
+
+    SHARED_CACHE_FILE = env('SHARED_CACHE_FILE', default='')
+    SHARED_CACHE_SLOTS = env('SHARED_CACHE_SLOTS', default='4096')
+    SHARED_CACHE_SLOT_SIZE = env('SHARED_CACHE_SLOT_SIZE', default='16384')
+
+    AD_LOOKUP_CACHE_TTL = env('AD_LOOKUP_CACHE_TTL', default='86400')
+    AD_LOOKUP_CACHE_STALE_TTL = env('AD_LOOKUP_CACHE_STALE_TTL', default='604800')
+
+    SUPPORT_CENTRES_FILE = env('SUPPORT_CENTRES_FILE', default='')
+    POSTCODE_CENTROIDS_FILE = env('POSTCODE_CENTROIDS_FILE', default='')
+
+    ADDRESS_SNAPSHOT_FILE = env('ADDRESS_SNAPSHOT_FILE', default='')
+
+    WARM_UP_FILE = env('WARM_UP_FILE', default='')
+    WARM_UP_RATE = env('WARM_UP_RATE', default='5/1')
+    WARM_UP_INTERVAL = env('WARM_UP_INTERVAL', default='0')
+
+    OUTBOX_ENABLED = env('OUTBOX_ENABLED', cast=bool, default=False)
+    OUTBOX_BATCH_SIZE = env('OUTBOX_BATCH_SIZE', default='20')
+    OUTBOX_MAX_ATTEMPTS = env('OUTBOX_MAX_ATTEMPTS', default='10')
+    OUTBOX_BACKOFF = env('OUTBOX_BACKOFF', default='5')
+    OUTBOX_IDEMPOTENCY_TTL = env('OUTBOX_IDEMPOTENCY_TTL', default='600')
 
     RHSVC_URL = env('RHSVC_URL')
     RHSVC_AUTH = (env('RHSVC_USERNAME'), env('RHSVC_PASSWORD'))
@@ -71,6 +137,7 @@ class BaseConfig:
     ADDRESS_INDEX_SVC_URL = env('ADDRESS_INDEX_SVC_URL')
     ADDRESS_INDEX_SVC_AUTH = (env('ADDRESS_INDEX_SVC_USERNAME'), env('ADDRESS_INDEX_SVC_PASSWORD'))
     ADDRESS_INDEX_EPOCH = env('ADDRESS_INDEX_EPOCH', default='')
+    ADDRESS_INDEX_SVC_POSTCODE_LIMIT = env('ADDRESS_INDEX_SVC_POSTCODE_LIMIT', default='5000')
 
     AD_LOOK_UP_SVC_URL = env('AD_LOOK_UP_SVC_URL')
     AD_LOOK_UP_SVC_AUTH = (env('AD_LOOK_UP_SVC_USERNAME'), env('AD_LOOK_UP_SVC_PASSWORD'))
@@ -87,8 +154,35 @@ class DevelopmentConfig:
     env = Env()
     HOST = env.str('HOST', default='0.0.0.0')
     PORT = env.int('PORT', default='9092')
+    WORKERS = env.str('WORKERS', default='1')
+    EVENT_LOOP = env.str('EVENT_LOOP', default='uvloop')
     LOG_LEVEL = env('LOG_LEVEL', default='INFO')
     EXT_LOG_LEVEL = env('EXT_LOG_LEVEL', default='WARN')
+    LOG_QUEUE = env.bool('LOG_QUEUE', default=False)
+    LOG_SAMPLE_RATES = env.str('LOG_SAMPLE_RATES', default='')
+    LOG_RATE_LIMIT = env.str('LOG_RATE_LIMIT', default='0')
+    LOG_RATE_BURST = env.str('LOG_RATE_BURST', default='0')
+    LOG_DROPPED_REPORT_INTERVAL = env.str('LOG_DROPPED_REPORT_INTERVAL', default='60')
+
+    TRACING_EXPORTER = env.str('TRACING_EXPORTER', default='')
+    TRACING_FILE = env.str('TRACING_FILE', default='spans.jsonl')
+
+    HEALTH_CHECK_TIMEOUT = env.str('HEALTH_CHECK_TIMEOUT', default='2')
+    HEALTH_CHECK_TIMEOUTS = env.str('HEALTH_CHECK_TIMEOUTS', default='')
+    HEALTH_CHECK_INTERVAL = env.str('HEALTH_CHECK_INTERVAL', default='10')
+    HEALTH_CHECK_TTL = env.str('HEALTH_CHECK_TTL', default='30')
+
+    LOOP_MONITOR_INTERVAL = env.str('LOOP_MONITOR_INTERVAL', default='0.5')
+    LOOP_LAG_THRESHOLD = env.str('LOOP_LAG_THRESHOLD', default='0.1')
+    LOOP_WATCHDOG_TIMEOUT = env.str('LOOP_WATCHDOG_TIMEOUT', default='2')
+    LOOP_DEBUG = env.bool('LOOP_DEBUG', default=False)
+
+    JSON_CODEC = env.str('JSON_CODEC', default='orjson')
+
+    STARTUP_PROFILE = env.bool('STARTUP_PROFILE', default=False)
+
+    METRICS_DIR = env.str('METRICS_DIR', default='')
+    METRICS_WRITE_INTERVAL = env.str('METRICS_WRITE_INTERVAL', default='5')
 
     DOMAIN_URL_PROTOCOL = 'http://'
     DOMAIN_URL_EN = env.str('DOMAIN_URL_EN', default='localhost:9092')
@@ -100,6 +194,45 @@ class DevelopmentConfig:
     JSON_SECRET_KEYS = env.str(
         'JSON_SECRET_KEYS',
         default=None) or open('./tests/test_data/test_keys.json').read()
+    EQ_TOKEN_EXECUTOR = env.str('EQ_TOKEN_EXECUTOR', default='thread')
+    EQ_TOKEN_WORKERS = env.str('EQ_TOKEN_WORKERS', default='2')
+    JSON_SECRET_KEYS_FILE = env.str('JSON_SECRET_KEYS_FILE', default='')
+    JSON_SECRET_KEYS_RELOAD_INTERVAL = env.str('JSON_SECRET_KEYS_RELOAD_INTERVAL', default='30')
+
+    RATE_LIMIT_UAC_IP = env.str('RATE_LIMIT_UAC_IP', default='30/60')
+    RATE_LIMIT_UAC_SESSION = env.str('RATE_LIMIT_UAC_SESSION', default='10/60')
+
+    INVALID_UAC_CACHE_TTL = env.str('INVALID_UAC_CACHE_TTL', default='300')
+    INVALID_UAC_CACHE_CAPACITY = env.str('INVALID_UAC_CACHE_CAPACITY', default='100000')
+    INVALID_UAC_FILTER_REFRESH = env.str('INVALID_UAC_FILTER_REFRESH', default='5')
+
+    IDEMPOTENCY_TTL = env.str('IDEMPOTENCY_TTL', default='600')
+    IDEMPOTENCY_WAIT = env.str('IDEMPOTENCY_WAIT', default='10')
+
+    AIMS_POSTCODE_CACHE_TTL = env.str('AIMS_POSTCODE_CACHE_TTL', default='3600')
+    FULFILMENT_CACHE_TTL = env.str('FULFILMENT_CACHE_TTL', default='3600')
+
+    SHARED_CACHE_FILE = env.str('SHARED_CACHE_FILE', default='')
+    SHARED_CACHE_SLOTS = env.str('SHARED_CACHE_SLOTS', default='4096')
+    SHARED_CACHE_SLOT_SIZE = env.str('SHARED_CACHE_SLOT_SIZE', default='16384')
+
+    AD_LOOKUP_CACHE_TTL = env.str('AD_LOOKUP_CACHE_TTL', default='86400')
+    AD_LOOKUP_CACHE_STALE_TTL = env.str('AD_LOOKUP_CACHE_STALE_TTL', default='604800')
+
+    SUPPORT_CENTRES_FILE = env.str('SUPPORT_CENTRES_FILE', default='')
+    POSTCODE_CENTROIDS_FILE = env.str('POSTCODE_CENTROIDS_FILE', default='')
+
+    ADDRESS_SNAPSHOT_FILE = env.str('ADDRESS_SNAPSHOT_FILE', default='')
+
+    WARM_UP_FILE = env.str('WARM_UP_FILE', default='')
+    WARM_UP_RATE = env.str('WARM_UP_RATE', default='5/1')
+    WARM_UP_INTERVAL = env.str('WARM_UP_INTERVAL', default='0')
+
+    OUTBOX_ENABLED = env.bool('OUTBOX_ENABLED', default=False)
+    OUTBOX_BATCH_SIZE = env.str('OUTBOX_BATCH_SIZE', default='20')
+    OUTBOX_MAX_ATTEMPTS = env.str('OUTBOX_MAX_ATTEMPTS', default='10')
+    OUTBOX_BACKOFF = env.str('OUTBOX_BACKOFF', default='5')
+    OUTBOX_IDEMPOTENCY_TTL = env.str('OUTBOX_IDEMPOTENCY_TTL', default='600')
 
     RHSVC_URL = env.str('RHSVC_URL', default='http://localhost:8071')
     RHSVC_AUTH = (env.str('RHSVC_USERNAME', default='admin'),
@@ -127,6 +260,7 @@ class DevelopmentConfig:
     ADDRESS_INDEX_SVC_AUTH = (env.str('ADDRESS_INDEX_SVC_USERNAME', default='admin'),
                               env.str('ADDRESS_INDEX_SVC_PASSWORD', default='secret'))
     ADDRESS_INDEX_EPOCH = env.str('ADDRESS_INDEX_EPOCH', default='')
+    ADDRESS_INDEX_SVC_POSTCODE_LIMIT = env.str('ADDRESS_INDEX_SVC_POSTCODE_LIMIT', default='5000')
 
     AD_LOOK_UP_SVC_URL = env.str('AD_LOOK_UP_SVC_URL', default='http://localhost:8071/v1')
     AD_LOOK_UP_SVC_AUTH = (env.str('AD_LOOK_UP_SVC_USERNAME', default='admin'),
@@ -139,8 +273,35 @@ class DevelopmentConfig:
 class TestingConfig:
     HOST = '0.0.0.0'
     PORT = '9092'
+    WORKERS = '1'
+    EVENT_LOOP = ''
     LOG_LEVEL = 'DEBUG'
     EXT_LOG_LEVEL = 'DEBUG'
+    LOG_QUEUE = False
+    LOG_SAMPLE_RATES = ''
+    LOG_RATE_LIMIT = '0'
+    LOG_RATE_BURST = '0'
+    LOG_DROPPED_REPORT_INTERVAL = '60'
+
+    TRACING_EXPORTER = ''
+    TRACING_FILE = 'spans.jsonl'
+
+    HEALTH_CHECK_TIMEOUT = '2'
+    HEALTH_CHECK_TIMEOUTS = ''
+    HEALTH_CHECK_INTERVAL = '10'
+    HEALTH_CHECK_TTL = '30'
+
+    LOOP_MONITOR_INTERVAL = '0'
+    LOOP_LAG_THRESHOLD = '0.1'
+    LOOP_WATCHDOG_TIMEOUT = '0'
+    LOOP_DEBUG = False
+
+    JSON_CODEC = 'orjson'
+
+    STARTUP_PROFILE = False
+
+    METRICS_DIR = ''
+    METRICS_WRITE_INTERVAL = '5'
 
     DOMAIN_URL_PROTOCOL = 'http://'
     DOMAIN_URL_EN = 'localhost:9092'
@@ -149,6 +310,45 @@ class TestingConfig:
     ACCOUNT_SERVICE_URL = 'http://localhost:9092'
     EQ_URL = 'http://localhost:5000'
     JSON_SECRET_KEYS = open('./tests/test_data/test_keys.json').read()
+    EQ_TOKEN_EXECUTOR = 'thread'
+    EQ_TOKEN_WORKERS = '2'
+    JSON_SECRET_KEYS_FILE = ''
+    JSON_SECRET_KEYS_RELOAD_INTERVAL = '30'
+
+    RATE_LIMIT_UAC_IP = ''
+    RATE_LIMIT_UAC_SESSION = ''
+
+    INVALID_UAC_CACHE_TTL = '0'
+    INVALID_UAC_CACHE_CAPACITY = '1000'
+    INVALID_UAC_FILTER_REFRESH = '5'
+
+    IDEMPOTENCY_TTL = '0'
+    IDEMPOTENCY_WAIT = '10'
+
+    AIMS_POSTCODE_CACHE_TTL = '0'
+    FULFILMENT_CACHE_TTL = '0'
+
+    SHARED_CACHE_FILE = ''
+    SHARED_CACHE_SLOTS = '4096'
+    SHARED_CACHE_SLOT_SIZE = '16384'
+
+    AD_LOOKUP_CACHE_TTL = '0'
+    AD_LOOKUP_CACHE_STALE_TTL = '0'
+
+    SUPPORT_CENTRES_FILE = ''
+    POSTCODE_CENTROIDS_FILE = ''
+
+    ADDRESS_SNAPSHOT_FILE = ''
+
+    WARM_UP_FILE = ''
+    WARM_UP_RATE = '5/1'
+    WARM_UP_INTERVAL = '0'
+
+    OUTBOX_ENABLED = False
+    OUTBOX_BATCH_SIZE = '20'
+    OUTBOX_MAX_ATTEMPTS = '10'
+    OUTBOX_BACKOFF = '5'
+    OUTBOX_IDEMPOTENCY_TTL = '600'
 
     RHSVC_URL = 'http://localhost:8071'
     RHSVC_AUTH = ('admin', 'secret')
@@ -171,6 +371,7 @@ class TestingConfig:
     ADDRESS_INDEX_SVC_URL = 'http://localhost:9000'
     ADDRESS_INDEX_SVC_AUTH = ('admin', 'secret')
     ADDRESS_INDEX_EPOCH = ''
+    ADDRESS_INDEX_SVC_POSTCODE_LIMIT = '5000'
 
     AD_LOOK_UP_SVC_URL = 'http://localhost:8071/v1'
     AD_LOOK_UP_SVC_AUTH = ('admin', 'secret')
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import os
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from sdc.crypto.exceptions import CryptoError
+from sdc.crypto.key_store import validate_required_keys
+from structlog import get_logger
+
+from . import jwt
+
+logger = get_logger('respondent-home')
+
+KEY_PURPOSE = 'authentication'
+
+# Key stores built in a worker process, by the keys they were built from
+_process_key_stores = {}
+
+
+def _encrypt_in_process(encrypt, keys, payload, key_purpose):
+    """
+    Runs in a worker process. The key store is built the first time the process is handed the keys
+    and reused after that, so only the payload has any real cost to send.
+    """
+    try:
+        key_store = _process_key_stores[keys]
+    except KeyError:
+        # Keys are only replaced when they are reloaded, so the old store will not be needed again
+        _process_key_stores.clear()
+        key_store = _process_key_stores[keys] = jwt.key_store(keys)
+    return encrypt(payload, key_store=key_store, key_purpose=key_purpose)
+
+
+class TokenEncrypter:
+    """
+    Signs and encrypts EQ launch tokens off the event loop.
+
+    With the 'thread' executor, the work runs in a thread pool. The RSA operations are done in OpenSSL, which
+    releases the GIL, so launches on one worker can use more than one core.
+
+    With 'process', each pool process builds its own key store once and reuses it.
+
+    With 'none', tokens are encrypted on the event loop as they always were.
+
+    Keys can be replaced while running with reload. When keys_file is given, it is checked every
+    reload_interval seconds and the keys are reloaded whenever it changes.
+    """
+    executor_types = ('none', 'thread', 'process')
+
+    def __init__(self, executor='thread', workers=2, keys=None, key_store=None, keys_file=None, reload_interval=30):
+        if executor not in self.executor_types:
+            raise ValueError(f'unknown EQ token executor {executor}')
+        self.executor_type = executor
+        self.workers = workers
+        self.keys = keys
+        self.key_store = key_store
+        self.keys_file = keys_file
+        self.reload_interval = reload_interval
+        self.executor = None
+        self._watcher = None
+
+    def reload(self, keys):
+        """
+        Swap in a new set of keys. Tokens already being built finish with the old keys.
+        Raises CryptoError, leaving the current keys in place, unless the new keys have a private and a public key
+        for KEY_PURPOSE, each of that type.
+        """
+        secrets = json.loads(keys)
+        validate_required_keys(secrets, KEY_PURPOSE)
+        key_store = jwt.CachedKeyStore(secrets)
+        for key_type in ('private', 'public'):
+            key = key_store.get_key_for_purpose_and_type(KEY_PURPOSE, key_type)
+            try:
+                is_private = key.as_jwk().has_private
+            except ValueError as ex:
+                raise CryptoError(f'{KEY_PURPOSE} {key_type} key {key.kid} could not be read') from ex
+            if is_private != (key_type == 'private'):
+                raise CryptoError(f'{KEY_PURPOSE} {key_type} key {key.kid} is not a {key_type} key')
+        key_store.preload(KEY_PURPOSE)
+        self.keys, self.key_store = keys, key_store
+        logger.info('reloaded EQ token keys')
+
+    def _keys_file_mtime(self):
+        try:
+            return os.stat(self.keys_file).st_mtime
+        except OSError:
+            logger.error('could not read EQ token keys file', keys_file=self.keys_file)
+            return None
+
+    async def _watch_keys_file(self):
+        mtime = self._keys_file_mtime()
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            current = self._keys_file_mtime()
+            if current is None or current == mtime:
+                continue
+            mtime = current
+            try:
+                with open(self.keys_file) as fp:
+                    self.reload(fp.read())
+            except Exception:
+                logger.exception('failed to reload EQ token keys, keeping the current keys',
+                                 keys_file=self.keys_file)
+
+    def start(self):
+        if self.executor_type == 'thread':
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='eq-token')
+        elif self.executor_type == 'process':
+            self.executor = ProcessPoolExecutor(self.workers)
+        if self.keys_file:
+            self._watcher = asyncio.ensure_future(self._watch_keys_file())
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+        if self.executor is not None:
+            executor, self.executor = self.executor, None
+            # Let tokens already being built finish, so their results are not sent to a closed loop, waiting for
+            # them in another thread so that the loop is free to deliver those results
+            await asyncio.get_event_loop().run_in_executor(None, partial(executor.shutdown, wait=True))
+
+    async def encrypt(self, encrypt, payload, key_purpose=KEY_PURPOSE) -> str:
+        """
+        :param encrypt: The encrypt function, taking the payload, key_store and key_purpose
+        :param payload: The token claims
+        :param key_purpose: The purpose of the keys to sign and encrypt with
+        """
+        if self.executor is None:
+            return encrypt(payload, key_store=self.key_store, key_purpose=key_purpose)
+        if self.executor_type == 'process':
+            call = partial(_encrypt_in_process, encrypt, self.keys, payload, key_purpose)
+        else:
+            call = partial(encrypt, payload, key_store=self.key_store, key_purpose=key_purpose)
+        return await asyncio.get_event_loop().run_in_executor(self.executor, call)
+
+
+class CurrentKeyStore:
+    """The key store a TokenEncrypter is using, following it when the keys are reloaded"""
+    def __init__(self, encrypter):
+        self._encrypter = encrypter
+
+    def __getattr__(self, name):
+        return getattr(self._encrypter.key_store, name)
+
+
+def setup(app, key_store) -> TokenEncrypter:
+    """
+    Create the app's token encrypter, with key_store built from JSON_SECRET_KEYS. Pools are created at startup,
+    so that they belong to the process serving requests rather than one it was forked from.
+    If JSON_SECRET_KEYS_FILE is set, the keys are reloaded from it whenever it changes.
+    """
+    encrypter = TokenEncrypter(app['EQ_TOKEN_EXECUTOR'], int(app['EQ_TOKEN_WORKERS']),
+                               keys=app['JSON_SECRET_KEYS'], key_store=key_store,
+                               keys_file=app['JSON_SECRET_KEYS_FILE'],
+                               reload_interval=float(app['JSON_SECRET_KEYS_RELOAD_INTERVAL']))
+
+    async def start_encrypter(app):
+        encrypter.start()
+
+    async def stop_encrypter(app):
+        await encrypter.stop()
+
+    app.on_startup.append(start_encrypter)
+    app.on_cleanup.append(stop_encrypter)
+    return encrypter
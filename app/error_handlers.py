@@ -8,7 +8,8 @@ from aiohttp.client_exceptions import (ClientResponseError,
 from .exceptions import (ExerciseClosedError, InactiveCaseError,
                          InvalidEqPayLoad, InvalidAccessCode,
                          SessionTimeout,
-                         TooManyRequests, TooManyRequestsWebForm, TooManyRequestsEQLaunch)
+                         TooManyRequests, TooManyRequestsWebForm, TooManyRequestsEQLaunch,
+                         TooManyRequestsUAC)
 from structlog import get_logger
 
 from .utils import View
@@ -62,6 +63,8 @@ def create_error_middleware(overrides):
             return await too_many_requests_web_form(request)
         except TooManyRequestsEQLaunch:
             return await too_many_requests_eq_launch(request)
+        except TooManyRequestsUAC:
+            return await too_many_requests_uac(request)
         except InactiveCaseError as ex:
             return await inactive_case(request, ex.case_type)
         except ExerciseClosedError as ex:
@@ -202,6 +205,13 @@ async def too_many_requests_eq_launch(request):
     return jinja.render_template('start-too-many-requests.html', request, attributes, status=429)
 
 
+async def too_many_requests_uac(request):
+    # The session is kept, as a new one would start a new rate limit window
+    attributes = check_display_region(request)
+    attributes['timeout'] = 'true'
+    return jinja.render_template('start-too-many-requests.html', request, attributes, status=429)
+
+
 async def session_timeout(request, user_journey: str, sub_user_journey: str):
     attributes = check_display_region(request)
     attributes['timeout'] = 'true'
@@ -0,0 +1,76 @@
+import asyncio
+
+from aiohttp import http_parser
+from structlog import get_logger
+
+logger = get_logger('respondent-home')
+
+
+def _uvloop_policy():
+    import uvloop
+    return uvloop.EventLoopPolicy()
+
+
+def _asyncio_policy():
+    return asyncio.DefaultEventLoopPolicy()
+
+
+# In order of preference when no event loop is configured
+policy_factories = {
+    'uvloop': _uvloop_policy,
+    'asyncio': _asyncio_policy,
+}
+
+
+def make_policy(name=None):
+    """
+    Build the named event loop policy, or that of the fastest loop installed when no name is given.
+    Raises ImportError if a named loop's library is not installed.
+    """
+    if name:
+        try:
+            factory = policy_factories[name]
+        except KeyError:
+            raise ValueError(f'unknown event loop {name}')
+        return factory()
+
+    for factory in policy_factories.values():
+        try:
+            return factory()
+        except ImportError:
+            continue
+
+
+def install(name=None):
+    """
+    Use the named event loop for loops created from now on, so it must be installed before the app's loop is made.
+    Falls back to the fastest installed loop if the named library is missing.
+    """
+    try:
+        policy = make_policy(name)
+    except ImportError:
+        logger.warn('configured event loop not installed', event_loop=name)
+        policy = make_policy()
+    asyncio.set_event_loop_policy(policy)
+    if http_parser_name() != 'c':
+        logger.warn('aiohttp is parsing HTTP without its C extension')
+    logger.info('event loop installed', event_loop=type(policy).__module__.split('.')[0],
+                http_parser=http_parser_name())
+
+
+def loop_name(loop=None) -> str:
+    """The library providing the loop, such as 'uvloop' or 'asyncio'"""
+    loop = loop or asyncio.get_event_loop()
+    return type(loop).__module__.split('.')[0]
+
+
+def http_parser_name() -> str:
+    """
+    'c' when aiohttp parses requests with its C extension, or 'python' when it was installed without it or
+    told not to use it with AIOHTTP_NO_EXTENSIONS.
+    """
+    return 'python' if http_parser.HttpRequestParser is http_parser.HttpRequestParserPy else 'c'
+
+
+def report() -> dict:
+    return {'event_loop': loop_name(), 'http_parser': http_parser_name()}
@@ -38,6 +38,10 @@ class TooManyRequestsEQLaunch(Exception):
     """Raised when EQ returns a 429 error"""
 
 
+class TooManyRequestsUAC(Exception):
+    """Raised when access codes are entered more often than the rate limits allow"""
+
+
 class ExerciseClosedError(Exception):
     """Raised when a user attempts to access an already ended CE"""
     def __init__(self, collection_exercise_id):
@@ -0,0 +1,14 @@
+from aiohttp.worker import GunicornWebWorker
+
+from . import event_loop
+from .app import load_config
+
+
+class WebWorker(GunicornWebWorker):
+    """
+    aiohttp's gunicorn worker, running the app on the event loop chosen by EVENT_LOOP. The loop is installed
+    before the worker makes its loop, which is before the app is created.
+    """
+    def init_process(self):
+        event_loop.install(load_config()['EVENT_LOOP'])
+        super().init_process()
@@ -1,9 +1,9 @@
 import aiohttp_jinja2
 
-from aiohttp.web import RouteTableDef, json_response, HTTPFound
+from aiohttp.web import RouteTableDef, Response, json_response, HTTPFound
 from structlog import get_logger
 
-from . import VERSION
+from . import VERSION, event_loop, json_codec, metrics
 from .security import forget
 from .utils import View
 
@@ -17,10 +17,23 @@ class Info(View):
         info = {
             'name': 'respondent-home-ui',
             'version': VERSION,
+            **event_loop.report(),
         }
         if 'check' in request.query:
-            info['ready'] = await request.app.check_services()
-        return json_response(info)
+            info.update(request.app.health_checker.report())
+        return json_response(info, dumps=json_codec.dumps)
+
+
+@static_routes.view('/metrics', use_prefix=False)
+class Metrics(View):
+    async def get(self, request):
+        worker_metrics = request.app['worker_metrics']
+        if worker_metrics is not None:
+            body = await worker_metrics.render()
+        else:
+            body = metrics.registry.render()
+        return Response(body=body.encode('utf-8'),
+                        headers={'Content-Type': metrics.registry.content_type})
 
 
 @static_routes.view(r'/' + View.valid_display_regions + '/start/launch-eq/')
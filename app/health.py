@@ -0,0 +1,168 @@
+import asyncio
+import time
+
+from structlog import get_logger
+
+logger = get_logger('respondent-home')
+
+REDIS = 'REDIS'
+
+
+class ServiceStatus:
+    """
+    The outcome of one probe of a service.
+    """
+    __slots__ = ('name', 'healthy', 'latency', 'error', 'checked')
+
+    def __init__(self, name, healthy, latency, error=None):
+        self.name = name
+        self.healthy = healthy
+        self.latency = latency
+        self.error = error
+        self.checked = time.monotonic()
+
+    def to_dict(self) -> dict:
+        status = {
+            'status': 'UP' if self.healthy else 'DOWN',
+            'latency_ms': round(self.latency * 1000, 1),
+        }
+        if self.error:
+            status['error'] = self.error
+        return status
+
+
+def http_probe(app, url):
+    async def probe():
+        async with app.http_session_pool.get(url) as resp:
+            resp.raise_for_status()
+    return probe
+
+
+def redis_probe(redis_pool):
+    async def probe():
+        await redis_pool.execute('PING')
+    return probe
+
+
+def parse_timeouts(timeouts):
+    """
+    Parse 'SERVICE=seconds,OTHER_SERVICE=seconds' into a dict of service name to timeout.
+    """
+    parsed = {}
+    for item in (timeouts or '').split(','):
+        if item.strip():
+            name, _, timeout = item.partition('=')
+            parsed[name.strip()] = float(timeout)
+    return parsed
+
+
+class HealthChecker:
+    """
+    Probes the services we depend on concurrently, each with its own timeout.
+
+    Once started, the probes are repeated every interval seconds in the background, so that readiness
+    can be reported from the latest results without any I/O. Results older than ttl seconds are not trusted.
+    """
+    def __init__(self, probes, timeout=2.0, timeouts=None, interval=10.0, ttl=30.0):
+        self.probes = probes
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        self.interval = interval
+        self.ttl = ttl
+        self.statuses = {}
+        self._latest_started = float('-inf')
+        self._refresher = None
+
+    async def probe(self, name) -> ServiceStatus:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.probes[name](), self.timeouts.get(name, self.timeout))
+        except asyncio.TimeoutError:
+            error = 'timed out'
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            error = type(ex).__name__
+        else:
+            return ServiceStatus(name, True, time.perf_counter() - start)
+        logger.error('failed to connect to required service', config=name, error=error)
+        return ServiceStatus(name, False, time.perf_counter() - start, error)
+
+    async def check(self) -> dict:
+        """Probe every service now, and keep the results unless a check started since has already finished"""
+        started = time.monotonic()
+        statuses = await asyncio.gather(*(self.probe(name) for name in self.probes))
+        if started >= self._latest_started:
+            self._latest_started = started
+            self.statuses = {status.name: status for status in statuses}
+        if all(status.healthy for status in statuses):
+            logger.debug('all required services are healthy')
+        return {status.name: status for status in statuses}
+
+    @property
+    def ready(self) -> bool:
+        """Whether every service was healthy when last probed, within the last ttl seconds"""
+        if len(self.statuses) < len(self.probes):
+            return False
+        oldest = time.monotonic() - self.ttl
+        return all(status.healthy and status.checked >= oldest for status in self.statuses.values())
+
+    def report(self) -> dict:
+        """The latest results, without probing anything"""
+        now = time.monotonic()
+        return {
+            'ready': self.ready,
+            'services': {
+                name: dict(status.to_dict(), age_s=round(now - status.checked, 1))
+                for name, status in self.statuses.items()
+            },
+        }
+
+    async def _refresh(self):
+        while True:
+            try:
+                await self.check()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('health check refresh failed')
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._refresher is None:
+            self._refresher = asyncio.ensure_future(self._refresh())
+
+    async def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+
+
+def setup(app, redis_pool=None) -> HealthChecker:
+    """
+    Create the app's health checker, probing each of app.service_status_urls and Redis when a pool is given.
+    Background refreshing runs between startup and shutdown.
+    """
+    probes = {name: http_probe(app, url) for name, url in app.service_status_urls.items()}
+    if redis_pool is not None:
+        probes[REDIS] = redis_probe(redis_pool)
+
+    checker = HealthChecker(probes,
+                            timeout=float(app['HEALTH_CHECK_TIMEOUT']),
+                            timeouts=parse_timeouts(app['HEALTH_CHECK_TIMEOUTS']),
+                            interval=float(app['HEALTH_CHECK_INTERVAL']),
+                            ttl=float(app['HEALTH_CHECK_TTL']))
+
+    async def start_checks(app):
+        checker.start()
+
+    async def stop_checks(app):
+        await checker.stop()
+
+    app.on_startup.append(start_checks)
+    app.on_shutdown.append(stop_checks)
+    return checker
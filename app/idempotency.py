@@ -0,0 +1,176 @@
+import asyncio
+import hashlib
+import math
+import time
+
+from aiohttp import RequestInfo
+from aiohttp.client_exceptions import ClientResponseError
+from aioredis import RedisError
+from multidict import CIMultiDict, CIMultiDictProxy
+from structlog import get_logger
+from yarl import URL
+
+from . import json_codec, metrics
+
+logger = get_logger('respondent-home')
+
+duplicate_submissions = metrics.registry.counter(
+    'duplicate_submissions_total', 'Repeated submissions answered with the outcome of the first.', ('kind',))
+
+IN_FLIGHT = json_codec.dumps({'state': 'in_flight'})
+
+
+def idempotency_key(kind, *parts) -> str:
+    """A key identifying a submission by what was submitted, so that a repeated submission has the same key"""
+    return hashlib.sha256(json_codec.dumps([kind, *parts]).encode('utf-8')).hexdigest()
+
+
+class IdempotentSubmissions:
+    """
+    Makes each submission to RHSvc once, however many times it is repeated within ttl seconds, such as by a
+    respondent pressing send twice or a retried request.
+
+    The first submission with a key claims it in Redis while it is being made, then records its outcome there.
+    A repeat waits up to wait seconds for the submission in flight, then is given the recorded outcome: the
+    result, or the same error when RHSvc rejected the submission. Submissions that fail for other reasons, such as
+    RHSvc being unavailable, are not recorded, so that they can be tried again.
+
+    Repeats within this process wait on the submission in flight directly. Without Redis, or when it cannot be
+    reached, submissions are only deduplicated within this process.
+    """
+    def __init__(self, ttl=600, wait=10.0, redis_pool=None, prefix='idempotency', in_flight_ttl=60,
+                 poll_interval=0.1, capacity=10000, clock=time.time):
+        self.ttl = ttl
+        self.wait = wait
+        self.redis_pool = redis_pool
+        self.prefix = prefix
+        self.in_flight_ttl = in_flight_ttl
+        self.poll_interval = poll_interval
+        self.capacity = capacity
+        self.clock = clock
+        self.in_flight = {}
+        self.recent = {}
+
+    def key(self, key):
+        return f'{self.prefix}:{key}'
+
+    async def run(self, request, kind, key, submit):
+        """
+        Make a submission unless one with the same key has been made recently.
+
+        :param request: The respondent's request, for logging
+        :param kind: What is being submitted, for metrics and logs
+        :param key: The idempotency key
+        :param submit: Coroutine function making the submission, returning its result
+        :return: The result of this submission, or of the first with the same key
+        """
+        if not self.ttl:
+            return await submit()
+        while key in self.in_flight:
+            outcome = await asyncio.shield(self.in_flight[key])
+            if outcome is not None:
+                return self.replay(request, kind, outcome)
+        outcome = self.recent_outcome(key)
+        if outcome is not None:
+            return self.replay(request, kind, outcome)
+
+        future = self.in_flight[key] = asyncio.get_event_loop().create_future()
+        try:
+            outcome = await self.claim(key)
+            if outcome is not None:
+                return self.replay(request, kind, outcome)
+            try:
+                result = await submit()
+            except ClientResponseError as ex:
+                if 400 <= ex.status < 500 and ex.status != 429:
+                    outcome = {'state': 'rejected', 'status': ex.status, 'message': ex.message,
+                               'url': str(ex.request_info.real_url) if ex.request_info else ''}
+                    await self.complete(key, outcome)
+                else:
+                    await self.release(key)
+                raise
+            except Exception:
+                await self.release(key)
+                raise
+            outcome = {'state': 'done', 'result': result}
+            await self.complete(key, outcome)
+            return result
+        finally:
+            del self.in_flight[key]
+            future.set_result(outcome)
+
+    def replay(self, request, kind, outcome):
+        duplicate_submissions.inc(kind)
+        logger.info('duplicate submission answered with the first outcome',
+                    kind=kind,
+                    outcome=outcome['state'],
+                    client_ip=request['client_ip'],
+                    client_id=request['client_id'],
+                    trace=request['trace'])
+        if outcome['state'] == 'rejected':
+            url = URL(outcome['url'])
+            raise ClientResponseError(RequestInfo(url, 'POST', CIMultiDictProxy(CIMultiDict()), url), (),
+                                      status=outcome['status'], message=outcome['message'])
+        return outcome['result']
+
+    def recent_outcome(self, key):
+        expiry, outcome = self.recent.get(key, (0, None))
+        return outcome if expiry > self.clock() else None
+
+    async def claim(self, key):
+        """
+        Claim the key for a submission, waiting while another holds it.
+
+        :return: None when claimed, or the outcome of the submission that held it
+        """
+        if self.redis_pool is None:
+            return None
+        deadline = self.clock() + self.wait
+        try:
+            while True:
+                if await self.redis_pool.execute(b'SET', self.key(key), IN_FLIGHT,
+                                                 b'NX', b'PX', int(self.in_flight_ttl * 1000)):
+                    return None
+                stored = await self.redis_pool.execute(b'GET', self.key(key))
+                if stored:
+                    outcome = json_codec.loads(stored)
+                    if outcome['state'] != 'in_flight':
+                        return outcome
+                if self.clock() >= deadline:
+                    logger.warn('gave up waiting for duplicate submission in flight', wait=self.wait)
+                    return None
+                await asyncio.sleep(self.poll_interval)
+        except (RedisError, OSError) as ex:
+            logger.error('failed to claim idempotency key in redis', error=type(ex).__name__)
+            return None
+
+    async def complete(self, key, outcome):
+        now = self.clock()
+        if len(self.recent) >= self.capacity:
+            self.recent = {recent_key: recent for recent_key, recent in self.recent.items() if recent[0] > now}
+            if len(self.recent) >= self.capacity:
+                del self.recent[next(iter(self.recent))]
+        self.recent[key] = (now + self.ttl, outcome)
+        if self.redis_pool is not None:
+            try:
+                await self.redis_pool.execute(b'SET', self.key(key), json_codec.dumps(outcome),
+                                              b'EX', math.ceil(self.ttl))
+            except (RedisError, OSError) as ex:
+                logger.error('failed to record submission outcome in redis', error=type(ex).__name__)
+
+    async def release(self, key):
+        if self.redis_pool is not None:
+            try:
+                await self.redis_pool.execute(b'DEL', self.key(key))
+            except (RedisError, OSError) as ex:
+                logger.error('failed to release idempotency key in redis', error=type(ex).__name__)
+
+
+def setup(app, redis_pool=None) -> IdempotentSubmissions:
+    """
+    Deduplicate submissions repeated within IDEMPOTENCY_TTL seconds, waiting up to IDEMPOTENCY_WAIT seconds for one
+    in flight. A TTL of 0 turns deduplication off.
+    """
+    return IdempotentSubmissions(ttl=float(app['IDEMPOTENCY_TTL']),
+                                 wait=float(app['IDEMPOTENCY_WAIT']),
+                                 redis_pool=redis_pool)
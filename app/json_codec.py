@@ -0,0 +1,124 @@
+import json
+
+from structlog import get_logger
+
+logger = get_logger('respondent-home')
+
+
+class JsonCodec:
+    """
+    A JSON encoder/decoder pair.
+
+    dumps returns str and dumps_bytes returns UTF-8 bytes, so that either form can be handed to a library
+    without another round of encoding. Objects that cannot be serialised are passed to default, as with
+    json.dumps.
+    """
+    def __init__(self, name, dumps, dumps_bytes, loads):
+        self.name = name
+        self._dumps = dumps
+        self._dumps_bytes = dumps_bytes
+        self.loads = loads
+
+    def __repr__(self):
+        return f'<JsonCodec {self.name}>'
+
+    def dumps(self, obj, default=None, **_) -> str:
+        """json.dumps compatible signature, other keyword arguments are ignored"""
+        return self._dumps(obj, default)
+
+    def dumps_bytes(self, obj, default=None) -> bytes:
+        return self._dumps_bytes(obj, default)
+
+
+def _stdlib_codec():
+    def dumps(obj, default):
+        return json.dumps(obj, default=default)
+
+    def dumps_bytes(obj, default):
+        return json.dumps(obj, default=default).encode('utf-8')
+
+    return JsonCodec('json', dumps, dumps_bytes, json.loads)
+
+
+def _orjson_codec():
+    import orjson
+
+    options = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj, default):
+        return orjson.dumps(obj, default=default, option=options).decode('utf-8')
+
+    def dumps_bytes(obj, default):
+        return orjson.dumps(obj, default=default, option=options)
+
+    return JsonCodec('orjson', dumps, dumps_bytes, orjson.loads)
+
+
+def _ujson_codec():
+    import ujson
+
+    def dumps(obj, default):
+        if default is None:
+            return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False, default=default)
+
+    def dumps_bytes(obj, default):
+        return dumps(obj, default).encode('utf-8')
+
+    return JsonCodec('ujson', dumps, dumps_bytes, ujson.loads)
+
+
+# In order of preference when no codec is configured
+codec_factories = {
+    'orjson': _orjson_codec,
+    'ujson': _ujson_codec,
+    'json': _stdlib_codec,
+}
+
+
+def make_codec(name=None) -> JsonCodec:
+    """
+    Build the named codec, or the fastest one installed when no name is given.
+    Raises ImportError if a named codec's library is not installed.
+    """
+    if name:
+        try:
+            factory = codec_factories[name]
+        except KeyError:
+            raise ValueError(f'unknown JSON codec {name}')
+        return factory()
+
+    for factory in codec_factories.values():
+        try:
+            return factory()
+        except ImportError:
+            continue
+
+
+codec = make_codec()
+
+
+def configure(name=None) -> JsonCodec:
+    """
+    Select the codec used by the module level dumps/loads functions.
+    Falls back to the fastest installed codec if the named library is missing.
+    """
+    global codec
+    try:
+        codec = make_codec(name)
+    except ImportError:
+        logger.warn('configured JSON codec not installed', json_codec=name)
+        codec = make_codec()
+    return codec
+
+
+def dumps(obj, default=None, **kwargs) -> str:
+    return codec.dumps(obj, default, **kwargs)
+
+
+def dumps_bytes(obj, default=None) -> bytes:
+    return codec.dumps_bytes(obj, default)
+
+
+def loads(data):
+    return codec.loads(data)
@@ -1,16 +1,84 @@
 import json
 
-from sdc.crypto.key_store import KeyStore
+from jwcrypto import jwk
+from sdc.crypto.key_store import Key, KeyStore
 from sdc.crypto.key_store import validate_required_keys
 from structlog import get_logger
 
 logger = get_logger('respondent-home')
 
 
+class CachedJWK(jwk.JWK):
+    """
+    JWK that keeps the cryptography key objects it gives for each operation.
+    jwcrypto otherwise rebuilds, and for private keys checks, the key from its parameters for every operation.
+    Only the public get_op_key is overridden, as jwcrypto's signers and encrypters get their keys through it.
+    """
+    def __init__(self, **kwargs):
+        self._cached_op_keys = {}
+        super().__init__(**kwargs)
+
+    def get_op_key(self, operation=None, arg=None):
+        try:
+            return self._cached_op_keys[operation, arg]
+        except KeyError:
+            key = self._cached_op_keys[operation, arg] = super().get_op_key(operation, arg)
+            return key
+
+
+class CachedKey(Key):
+    """
+    A Key that parses its PEM value into a JWK once, rather than on every signature or encryption.
+    Neither the JWK nor its key objects are changed by signing or encrypting, so one can be shared between threads.
+    """
+    def __init__(self, kid, purpose, key_type, value):
+        super().__init__(kid, purpose, key_type, value)
+        self._jwk = None
+
+    def as_jwk(self):
+        if self._jwk is None:
+            self._jwk = CachedJWK.from_pem(self.value.encode('utf-8'))
+        return self._jwk
+
+
+class CachedKeyStore(KeyStore):
+    """
+    KeyStore holding CachedKeys, which also looks keys up by purpose and type without scanning every key.
+    """
+    def __init__(self, keys):
+        super().__init__(keys)
+        self.keys = {kid: CachedKey(kid, key.purpose, key.key_type, key.value) for kid, key in self.keys.items()}
+        self._by_purpose_and_type = {}
+        for key in self.keys.values():
+            self._by_purpose_and_type.setdefault((key.purpose, key.key_type), key)
+
+    def preload(self, purpose):
+        """Parse the keys for purpose now, rather than on first use. Raises ValueError if a key cannot be parsed."""
+        for key in self.keys.values():
+            if key.purpose == purpose:
+                key.as_jwk().get_op_key('sign' if key.key_type == 'private' else 'encrypt')
+
+    def get_key_for_purpose_and_type(self, purpose, key_type):
+        return self._by_purpose_and_type.get((purpose, key_type))
+
+
+# Key stores parsed before the workers serving requests were forked, by the keys they were built from
+preloaded_key_stores = {}
+
+
 def key_store(keys: str) -> KeyStore:
+    preloaded = preloaded_key_stores.get(keys)
+    if preloaded is not None:
+        return preloaded
     secrets = json.loads(keys)
 
     logger.info('validating key file')
     validate_required_keys(secrets, 'authentication')
 
-    return KeyStore(secrets)
+    store = CachedKeyStore(secrets)
+    try:
+        store.preload('authentication')
+    except ValueError:
+        # Left to fail when the keys are used, as it did before they were parsed up front
+        logger.warn('could not parse authentication keys')
+    return store
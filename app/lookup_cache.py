@@ -0,0 +1,219 @@
+import asyncio
+import math
+import time
+
+from collections import OrderedDict
+
+from aioredis import RedisError
+from structlog import get_logger
+
+from . import json_codec, metrics, normalise
+from .request import BackgroundRequest
+
+logger = get_logger('respondent-home')
+
+lookup_cache_requests = metrics.registry.counter(
+    'lookup_cache_requests_total',
+    'Lookups answered from a cache, including stale results being refreshed, and those that had to be made upstream.',
+    ('cache', 'result'))
+
+
+class LookupCache:
+    """
+    Results of upstream lookups, such as the addresses at a postcode, kept for ttl seconds so that repeated
+    lookups do not reach the upstream service.
+
+    Results are kept in this process, up to capacity of the most recently used, and shared with other workers
+    through Redis when there is a pool. Concurrent lookups of the same key in this process wait for a single
+    upstream call. Failed lookups are not cached.
+
+    With a stale_ttl, results older than ttl are still given for up to stale_ttl seconds more, while they are
+    looked up again in the background, so that respondents only wait for upstream when a result is missing or
+    very old.
+
+    With a bucket function, results are grouped in Redis under a hash per bucket, such as a postcode sector,
+    which expires stale_ttl after its latest result was stored.
+
+    With a shared cache, results are also kept where the other workers on the host can read them, checked
+    after this process's own results and before Redis.
+    """
+    def __init__(self, name, ttl=3600, redis_pool=None, capacity=10000, stale_ttl=0, bucket=None, shared=None,
+                 clock=time.time):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.bucket = bucket
+        self.redis_pool = redis_pool
+        self.shared = shared
+        self.capacity = capacity
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.refreshing = {}
+
+    def key(self, key):
+        if self.bucket is not None:
+            return f'lookup_cache:{self.name}:{self.bucket(key)}'
+        return f'lookup_cache:{self.name}:{key}'
+
+    def _get_local(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] + self.ttl + self.stale_ttl <= self.clock():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def shared_key(self, key):
+        return f'{self.name}:{key}'.encode('utf-8')
+
+    def _get_shared(self, key):
+        if self.shared is None:
+            return None
+        stored = self.shared.get(self.shared_key(key))
+        if stored is None:
+            return None
+        entry = tuple(json_codec.loads(stored))
+        if entry[0] + self.ttl + self.stale_ttl <= self.clock():
+            return None
+        self._set_local(key, entry)
+        return entry
+
+    def _set_local(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    async def get(self, key):
+        """
+        :return: The time the cached value was looked up and the value, or None when not cached
+        """
+        entry = self._get_local(key)
+        if entry is not None:
+            return entry
+        entry = self._get_shared(key)
+        if entry is not None or self.redis_pool is None:
+            return entry
+        try:
+            if self.bucket is not None:
+                stored = await self.redis_pool.execute(b'HGET', self.key(key), key)
+            else:
+                stored = await self.redis_pool.execute(b'GET', self.key(key))
+        except (RedisError, OSError) as ex:
+            logger.error('failed to read lookup cache from redis', cache=self.name, error=type(ex).__name__)
+            return None
+        if stored is None:
+            return None
+        entry = tuple(json_codec.loads(stored))
+        if entry[0] + self.ttl + self.stale_ttl <= self.clock():
+            return None
+        self._set_local(key, entry)
+        if self.shared is not None:
+            self.shared.set(self.shared_key(key), stored)
+        return entry
+
+    async def set(self, key, value):
+        entry = (self.clock(), value)
+        self._set_local(key, entry)
+        stored = json_codec.dumps(entry)
+        if self.shared is not None:
+            self.shared.set(self.shared_key(key), stored.encode('utf-8'))
+        if self.redis_pool is None:
+            return
+        expiry = math.ceil(self.ttl + self.stale_ttl)
+        try:
+            if self.bucket is not None:
+                await self.redis_pool.execute(b'HSET', self.key(key), key, stored)
+                await self.redis_pool.execute(b'EXPIRE', self.key(key), expiry)
+            else:
+                await self.redis_pool.execute(b'SET', self.key(key), stored, b'EX', expiry)
+        except (RedisError, OSError) as ex:
+            logger.error('failed to write lookup cache to redis', cache=self.name, error=type(ex).__name__)
+
+    async def fetch(self, request, key, lookup):
+        """
+        The cached result for key, or the result of lookup(request), which is then cached.
+
+        The lookup runs in a task of its own, which concurrent fetches of the same key wait on, so that a fetch
+        being cancelled, such as when its respondent disconnects, does not cancel the lookup the others wait for.
+        Stale results are looked up again for a BackgroundRequest, as the response to request may have been sent.
+
+        :param lookup: Coroutine function making the upstream lookup for a request
+        """
+        if not self.ttl:
+            return await lookup(request)
+        entry = await self.get(key)
+        if entry is not None:
+            looked_up, value = entry
+            if looked_up + self.ttl > self.clock():
+                lookup_cache_requests.inc(self.name, 'hit')
+            else:
+                lookup_cache_requests.inc(self.name, 'stale')
+                if key not in self.refreshing and key not in self.in_flight:
+                    self.refreshing[key] = asyncio.ensure_future(
+                        self._refresh(key, lookup, BackgroundRequest(request.app, request)))
+            return value
+        in_flight = self.in_flight.get(key)
+        if in_flight is not None:
+            lookup_cache_requests.inc(self.name, 'hit')
+            return await asyncio.shield(in_flight)
+
+        lookup_cache_requests.inc(self.name, 'miss')
+        return await asyncio.shield(self._start_lookup(key, lookup, request))
+
+    def _start_lookup(self, key, lookup, request):
+        task = self.in_flight[key] = asyncio.ensure_future(self._lookup(key, lookup, request))
+        # Fetches that stopped waiting for the lookup do not need its error
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return task
+
+    async def _lookup(self, key, lookup, request):
+        try:
+            value = await lookup(request)
+        finally:
+            del self.in_flight[key]
+        await self.set(key, value)
+        return value
+
+    async def _refresh(self, key, lookup, request):
+        try:
+            await self._start_lookup(key, lookup, request)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logger.warn('failed to refresh stale lookup', cache=self.name, error=type(ex).__name__)
+        finally:
+            del self.refreshing[key]
+
+    async def close(self):
+        """Stop refreshing stale results"""
+        refreshing = list(self.refreshing.values())
+        for task in refreshing:
+            task.cancel()
+        await asyncio.gather(*refreshing, return_exceptions=True)
+
+
+def setup(app, redis_pool=None, shared=None):
+    """
+    Create the caches of AIMS postcode lookups and RHSvc fulfilment lookups, kept for AIMS_POSTCODE_CACHE_TTL and
+    FULFILMENT_CACHE_TTL seconds, and of the support centres near a postcode, kept for AD_LOOKUP_CACHE_TTL seconds
+    and refreshed in the background for AD_LOOKUP_CACHE_STALE_TTL seconds after. A TTL of 0 turns a cache off.
+    Results are kept in the shared cache too when there is one. Refreshes still running stop on shutdown.
+    """
+    app['postcode_cache'] = LookupCache('aims_postcode', ttl=float(app['AIMS_POSTCODE_CACHE_TTL']),
+                                        redis_pool=redis_pool, shared=shared)
+    app['fulfilment_cache'] = LookupCache('fulfilments', ttl=float(app['FULFILMENT_CACHE_TTL']),
+                                          redis_pool=redis_pool, shared=shared)
+    app['ad_lookup_cache'] = LookupCache('ad_lookup', ttl=float(app['AD_LOOKUP_CACHE_TTL']),
+                                         stale_ttl=float(app['AD_LOOKUP_CACHE_STALE_TTL']),
+                                         bucket=normalise.postcode_sector,
+                                         redis_pool=redis_pool, shared=shared)
+
+    async def stop_refreshing(app):
+        for name in ('postcode_cache', 'fulfilment_cache', 'ad_lookup_cache'):
+            await app[name].close()
+
+    app.on_shutdown.append(stop_refreshing)
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from structlog import get_logger
+
+from . import metrics
+
+logger = get_logger('respondent-home')
+
+app_dir = os.path.dirname(os.path.abspath(__file__)) + os.sep
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+loop_lag = metrics.registry.histogram(
+    'event_loop_lag_seconds', 'Delay in running a task scheduled on the event loop.',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+loop_blocked = metrics.registry.counter(
+    'event_loop_blocked_total', 'Times the event loop was blocked for longer than the watchdog timeout.')
+slow_callbacks = metrics.registry.counter(
+    'event_loop_slow_callbacks_total', 'Callbacks that ran for longer than the slow callback threshold.')
+
+
+def blocking_frame(stack):
+    """The innermost frame of our own code in a stack summary, which is most likely the one to blame"""
+    for frame in reversed(stack):
+        if frame.filename.startswith(app_dir) and not frame.filename.endswith('loop_monitor.py'):
+            return f'{os.path.relpath(frame.filename, root_dir)}:{frame.lineno} {frame.name}'
+    return None
+
+
+class SlowCallbackHandler(logging.Handler):
+    """
+    Counts the slow callback warnings that asyncio logs in debug mode.
+    The warnings themselves are still logged as usual.
+    """
+    def emit(self, record):
+        if isinstance(record.msg, str) and record.msg.startswith('Executing'):
+            slow_callbacks.inc()
+
+
+class LoopMonitor:
+    """
+    Measures how late the event loop runs a sentinel task that sleeps for interval seconds,
+    logging when the lag is over threshold.
+
+    When watchdog_timeout is set, a thread also watches the sentinel's heartbeat. If the loop has not run the
+    sentinel for watchdog_timeout seconds, the loop thread's stack is logged while it is still blocked.
+    """
+    def __init__(self, interval=0.5, threshold=0.1, watchdog_timeout=0):
+        self.interval = interval
+        self.threshold = threshold
+        self.watchdog_timeout = watchdog_timeout
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id = None
+        self._sentinel = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    async def _sentinel_task(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.heartbeat = time.monotonic()
+            loop_lag.observe(lag)
+            if lag > self.threshold:
+                logger.warn('event loop lag over threshold', lag_ms=round(lag * 1000, 1),
+                            threshold_ms=round(self.threshold * 1000, 1))
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(min(self.interval, self.watchdog_timeout)):
+            heartbeat = self.heartbeat
+            blocked_for = time.monotonic() - heartbeat
+            if blocked_for > self.watchdog_timeout and heartbeat != reported:
+                reported = heartbeat
+                self.report_blocked(blocked_for)
+
+    def report_blocked(self, blocked_for):
+        frame = sys._current_frames().get(self.loop_thread_id)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)
+        loop_blocked.inc()
+        logger.error('event loop blocked',
+                     blocked_ms=round(blocked_for * 1000, 1),
+                     blocking_frame=blocking_frame(stack),
+                     stack=''.join(traceback.format_list(stack)))
+
+    def start(self):
+        """Start monitoring the running loop. Call from the loop's thread."""
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self._sentinel = asyncio.ensure_future(self._sentinel_task())
+        if self.watchdog_timeout:
+            self._stopped.clear()
+            self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+            self._watchdog.start()
+
+    async def stop(self):
+        if self._watchdog is not None:
+            self._stopped.set()
+            self._watchdog.join()
+            self._watchdog = None
+        if self._sentinel is not None:
+            self._sentinel.cancel()
+            try:
+                await self._sentinel
+            except asyncio.CancelledError:
+                pass
+            self._sentinel = None
+
+
+def setup(app):
+    """
+    Monitor the event loop between startup and shutdown, if LOOP_MONITOR_INTERVAL is set.
+    With LOOP_DEBUG, asyncio debug mode is also enabled, so callbacks running for longer than
+    LOOP_LAG_THRESHOLD are logged by asyncio and counted.
+    """
+    interval = float(app['LOOP_MONITOR_INTERVAL'])
+    if not interval:
+        return None
+
+    threshold = float(app['LOOP_LAG_THRESHOLD'])
+    monitor = LoopMonitor(interval, threshold, float(app['LOOP_WATCHDOG_TIMEOUT']))
+
+    async def start_monitor(app):
+        if app['LOOP_DEBUG']:
+            loop = asyncio.get_event_loop()
+            loop.set_debug(True)
+            loop.slow_callback_duration = threshold
+            asyncio_logger = logging.getLogger('asyncio')
+            if not any(isinstance(handler, SlowCallbackHandler) for handler in asyncio_logger.handlers):
+                asyncio_logger.addHandler(SlowCallbackHandler())
+        monitor.start()
+
+    async def stop_monitor(app):
+        await monitor.stop()
+
+    app.on_startup.append(start_monitor)
+    app.on_shutdown.append(stop_monitor)
+    return monitor
@@ -0,0 +1,351 @@
+import asyncio
+import os
+import time
+
+from bisect import bisect_left
+
+from aiohttp import web
+from structlog import get_logger
+
+from . import json_codec
+
+logger = get_logger('respondent-home')
+
+namespace = 'rhui'
+
+# Upper bounds in seconds, covering everything from a cached page to a call that runs into the client timeout
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Config keys of the services we call, and the label their requests are recorded under
+upstream_services = (
+    ('RHSVC_URL', 'rhsvc'),
+    ('ADDRESS_INDEX_SVC_URL', 'aims'),
+    ('AD_LOOK_UP_SVC_URL', 'ad_lookup'),
+    ('WEBCHAT_SVC_URL', 'webchat'),
+)
+
+# Label used for requests that did not match a route, so that unknown paths can't grow the label set
+unmatched_route = 'unmatched'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    """
+    A monotonically increasing count, kept separately for each combination of label values.
+    """
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def get(self, *label_values):
+        return self.values.get(label_values, 0)
+
+    def samples(self):
+        for label_values, value in sorted(self.values.items()):
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Gauge(Counter):
+    """
+    A value that can go up and down, such as the length of a queue, kept separately for each combination of label
+    values.
+    """
+    kind = 'gauge'
+
+    def set(self, value, *label_values):
+        self.values[label_values] = value
+
+
+class Histogram:
+    """
+    Observations counted into cumulative buckets, kept separately for each combination of label values.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=latency_buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}
+
+    def observe(self, value, *label_values):
+        try:
+            counts, total = self.values[label_values]
+        except KeyError:
+            counts, total = [0] * (len(self.buckets) + 1), 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.values[label_values] = counts, total + value
+
+    def count(self, *label_values):
+        counts, _ = self.values.get(label_values, ((), 0.0))
+        return sum(counts)
+
+    def samples(self):
+        for label_values, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield (self.name + '_bucket',
+                       _format_labels(self.labels, label_values, (('le', _format_value(float(bound))),)),
+                       cumulative)
+            yield self.name + '_sum', _format_labels(self.labels, label_values), total
+            yield self.name + '_count', _format_labels(self.labels, label_values), cumulative
+
+
+class Registry:
+    """
+    The metrics of this process, rendered in the Prometheus text exposition format.
+    Under more than one worker, each has its own, and WorkerMetrics combines them.
+    """
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'metric {metric.name} already registered')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(f'{namespace}_{name}', documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self.register(Gauge(f'{namespace}_{name}', documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=latency_buckets):
+        return self.register(Histogram(f'{namespace}_{name}', documentation, labels, buckets))
+
+    def reset(self):
+        for metric in self.metrics.values():
+            metric.values.clear()
+
+    def snapshot(self) -> dict:
+        """The values of every metric, by metric name, as [label values, value] pairs that can be written as JSON"""
+        return {name: [[list(label_values), value] for label_values, value in metric.values.items()]
+                for name, metric in self.metrics.items()}
+
+    def combine(self, snapshots, stopped=()) -> 'Registry':
+        """
+        A registry of these metrics holding the values from a snapshot for each worker, [(pid, snapshot)].
+        Counters and histograms are summed. Gauges are given a pid label, as the values of different workers
+        can't be added up, and are left out for the stopped pids.
+        """
+        combined = Registry()
+        for name, metric in self.metrics.items():
+            if isinstance(metric, Gauge):
+                target = Gauge(name, metric.documentation, metric.labels + ('pid',))
+            elif isinstance(metric, Histogram):
+                target = Histogram(name, metric.documentation, metric.labels, metric.buckets)
+            else:
+                target = Counter(name, metric.documentation, metric.labels)
+            combined.register(target)
+            for pid, snapshot in snapshots:
+                for label_values, value in snapshot.get(name, ()):
+                    label_values = tuple(label_values)
+                    if isinstance(target, Gauge):
+                        if pid not in stopped:
+                            target.set(value, *label_values, str(pid))
+                    elif isinstance(target, Histogram):
+                        counts, total = value
+                        summed, summed_total = target.values.get(label_values, ([0] * len(counts), 0.0))
+                        target.values[label_values] = ([a + b for a, b in zip(summed, counts)],
+                                                       summed_total + total)
+                    else:
+                        target.inc(*label_values, amount=value)
+        return combined
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        lines.append('')
+        return '\n'.join(lines)
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    'http_requests_total', 'Requests handled, by route and response status.', ('route', 'status'))
+http_request_duration = registry.histogram(
+    'http_request_duration_seconds', 'Time taken to handle requests, by route.', ('route',))
+upstream_requests = registry.counter(
+    'upstream_requests_total', 'Requests made to other services, by connection type and response status.',
+    ('service', 'connection', 'status'))
+upstream_request_duration = registry.histogram(
+    'upstream_request_duration_seconds', 'Time taken by each attempt at a request to another service.',
+    ('service', 'connection', 'attempt'))
+upstream_fallbacks = registry.counter(
+    'upstream_fallbacks_total', 'Requests that fell back to a basic connection after the pooled attempts failed.',
+    ('service',))
+session_duration = registry.histogram(
+    'session_duration_seconds', 'Time taken to load and save sessions in Redis.', ('operation',))
+
+
+def process_stopped(pid) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def clear_worker_metrics(directory):
+    """Remove the metrics written by the workers of an earlier run, before starting new ones"""
+    for name in os.listdir(directory):
+        if name.endswith('.json'):
+            os.remove(os.path.join(directory, name))
+
+
+class WorkerMetrics:
+    """
+    The metrics of every worker on a host, so that whichever worker serves /metrics reports them all.
+
+    Each worker writes a snapshot of its registry to a file of its own in directory every interval seconds, and
+    when it stops. /metrics combines the latest snapshot of each worker with that of the worker serving it.
+    Snapshots of stopped workers are kept, so that their counts are not lost, until the directory is cleared
+    when the workers are next started.
+    """
+    def __init__(self, directory, interval=5.0, registry=registry, pid=None):
+        self.directory = directory
+        self.interval = interval
+        self.registry = registry
+        self.pid = pid or os.getpid()
+        # Started time as well as pid, so that a pid used again does not replace the counts of a stopped worker
+        self.path = os.path.join(directory, f'{self.pid}-{int(time.time() * 1000)}.json')
+        self._writer = None
+
+    def write(self, snapshot):
+        partial_path = self.path + '.partial'
+        with open(partial_path, 'wb') as snapshot_file:
+            snapshot_file.write(json_codec.dumps_bytes(snapshot))
+        os.replace(partial_path, self.path)
+
+    def read(self):
+        """[(pid, snapshot)] of every worker, including this one and those that have stopped"""
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), 'rb') as snapshot_file:
+                    snapshots.append((int(name.split('-')[0]), json_codec.loads(snapshot_file.read())))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def _exchange(self, snapshot):
+        self.write(snapshot)
+        snapshots = self.read()
+        return snapshots, {pid for pid, _ in snapshots if pid != self.pid and process_stopped(pid)}
+
+    async def render(self) -> str:
+        # Values are copied on the event loop, which updates them, and files are read and written off it
+        snapshot = self.registry.snapshot()
+        snapshots, stopped = await asyncio.get_event_loop().run_in_executor(None, self._exchange, snapshot)
+        return self.registry.combine(snapshots, stopped).render()
+
+    async def _write_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.get_event_loop().run_in_executor(None, self.write, self.registry.snapshot())
+            except OSError as ex:
+                logger.error('failed to write worker metrics', error=type(ex).__name__)
+
+    def start(self):
+        if self._writer is None:
+            self._writer = asyncio.ensure_future(self._write_periodically())
+
+    async def stop(self):
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+        self.write(self.registry.snapshot())
+
+
+def setup(app):
+    """
+    Share metrics between the workers on a host through files in METRICS_DIR, when it is set. The directory
+    should be empty when the workers start: workers.run clears it, and under gunicorn it should be a new
+    directory, such as a tmpfs mounted for the container. Without it, /metrics reports the worker serving it.
+    """
+    if not app['METRICS_DIR']:
+        return None
+    worker_metrics = WorkerMetrics(app['METRICS_DIR'], float(app['METRICS_WRITE_INTERVAL']))
+
+    async def start_writing(app):
+        worker_metrics.start()
+
+    async def stop_writing(app):
+        await worker_metrics.stop()
+
+    app.on_startup.append(start_writing)
+    app.on_shutdown.append(stop_writing)
+    return worker_metrics
+
+
+def route_name(request) -> str:
+    """The resource name of the matched route, such as Start:post"""
+    route = request.match_info.route
+    return getattr(route, 'name', None) or unmatched_route
+
+
+def upstream_service(app, url) -> str:
+    for key, service in upstream_services:
+        service_url = app.get(key)
+        if service_url and url.startswith(service_url):
+            return service
+    return 'other'
+
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as ex:
+        status = ex.status
+        raise
+    finally:
+        route = route_name(request)
+        http_request_duration.observe(time.perf_counter() - start, route)
+        http_requests.inc(route, str(status))
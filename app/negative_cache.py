@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import math
+import time
+
+from aioredis import RedisError
+from structlog import get_logger
+
+from . import metrics
+from .session import RedisScript
+
+logger = get_logger('respondent-home')
+
+negative_cache_lookups = metrics.registry.counter(
+    'negative_cache_lookups_total',
+    'Lookups of the negative cache. A hit is an upstream call saved, filtered means the filter ruled the value out.',
+    ('cache', 'result'))
+
+# Remembers a value for ttl seconds and sets its bits in the filter of the current generation.
+# KEYS are the value's key and the generation's filter, ARGV the ttl, the filter's lifetime and the bit offsets.
+add_script = RedisScript(b'''
+redis.call('SET', KEYS[1], 1, 'EX', ARGV[1])
+for i = 3, #ARGV do
+    redis.call('SETBIT', KEYS[2], ARGV[i], 1)
+end
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+''')
+
+
+class BloomFilter:
+    """
+    A fixed size set of values that can answer 'definitely not present' without storing the values,
+    and 'probably present' with a false positive rate of about error_rate while holding up to capacity values.
+
+    The bits are kept in the order Redis uses for SETBIT and GET, so a filter can be built in Redis and read back.
+    """
+    def __init__(self, capacity, error_rate=0.01):
+        size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.size = size + -size % 8
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(self.size // 8)
+
+    def offsets(self, value: str):
+        digest = hashlib.sha256(value.encode('utf-8')).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:16], 'big') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, value: str, offsets=None):
+        for offset in offsets or self.offsets(value):
+            self.bits[offset >> 3] |= 0x80 >> (offset & 7)
+
+    def __contains__(self, value: str):
+        bits = self.bits
+        return all(bits[offset >> 3] & (0x80 >> (offset & 7)) for offset in self.offsets(value))
+
+    def merge(self, bits: bytes):
+        """
+        Add the values of another filter of the same size, given as its bits.
+        Redis only stores a bitmap up to its last set bit, so shorter bits are padded.
+        """
+        bits = bits.ljust(len(self.bits), b'\0')
+        merged = int.from_bytes(self.bits, 'big') | int.from_bytes(bits, 'big')
+        self.bits = bytearray(merged.to_bytes(len(self.bits), 'big'))
+
+
+class NegativeCache:
+    """
+    Remembers values, such as access codes unknown to RHSvc, for ttl seconds, so that they can be answered without
+    asking again.
+
+    Every lookup is first checked against a Bloom filter held in this process. Most lookups are of values that
+    were never added, which the filter rules out with no I/O. Values the filter may hold are confirmed exactly
+    from Redis, so a false positive costs one Redis call and never turns away a value that was not added.
+
+    With Redis, values are remembered by every worker. Each keeps a copy of the filters in Redis, refreshed every
+    refresh_interval seconds. Filters rotate every ttl seconds and the last two are checked, so they
+    only hold values added in the last two ttl periods. Without Redis, values are only remembered in this process.
+    """
+    def __init__(self, name, ttl=300, capacity=100000, error_rate=0.01, redis_pool=None, refresh_interval=5.0,
+                 clock=time.time):
+        self.name = name
+        self.ttl = ttl
+        self.capacity = capacity
+        self.redis_pool = redis_pool
+        self.refresh_interval = refresh_interval
+        self.clock = clock
+        self.filters = {}
+        self.error_rate = error_rate
+        self.expiries = {}
+        self._refresher = None
+
+    def key(self, value):
+        return f'{self.name}:{value}'
+
+    def filter_key(self, generation):
+        return f'{self.name}:filter:{generation}'
+
+    def generations(self):
+        current = int(self.clock() // self.ttl)
+        return current, current - 1
+
+    def _filter(self, generation):
+        bloom = self.filters.get(generation)
+        if bloom is None:
+            bloom = self.filters[generation] = BloomFilter(self.capacity, self.error_rate)
+            for old in [old for old in self.filters if old < generation - 1]:
+                del self.filters[old]
+        return bloom
+
+    def _might_contain(self, value):
+        return any(value in self.filters[generation] for generation in self.generations() if generation in self.filters)
+
+    async def contains(self, value) -> bool:
+        if not self.ttl:
+            return False
+        if not self._might_contain(value):
+            negative_cache_lookups.inc(self.name, 'filtered')
+            return False
+        found = None
+        if self.redis_pool is not None:
+            try:
+                found = bool(await self.redis_pool.execute(b'EXISTS', self.key(value)))
+            except (RedisError, OSError) as ex:
+                logger.error('failed to look up negative cache in redis', cache=self.name, error=type(ex).__name__)
+        if found is None:
+            found = self.expiries.get(value, 0) > self.clock()
+        negative_cache_lookups.inc(self.name, 'hit' if found else 'miss')
+        return found
+
+    async def add(self, value):
+        if not self.ttl:
+            return
+        now = self.clock()
+        generation = self.generations()[0]
+        bloom = self._filter(generation)
+        offsets = bloom.offsets(value)
+        bloom.add(value, offsets)
+        self._remember(value, now)
+        if self.redis_pool is not None:
+            try:
+                await add_script(self.redis_pool, [self.key(value), self.filter_key(generation)],
+                                 [math.ceil(self.ttl), math.ceil(self.ttl * 2), *offsets])
+            except (RedisError, OSError) as ex:
+                logger.error('failed to add to negative cache in redis', cache=self.name, error=type(ex).__name__)
+
+    def _remember(self, value, now):
+        """Keep the value in this process too, for when Redis cannot be reached"""
+        if len(self.expiries) >= self.capacity:
+            self.expiries = {key: expiry for key, expiry in self.expiries.items() if expiry > now}
+            if len(self.expiries) >= self.capacity:
+                del self.expiries[next(iter(self.expiries))]
+        self.expiries[value] = now + self.ttl
+
+    async def refresh(self):
+        """Merge in the current filters from Redis, picking up values added by other workers"""
+        generations = self.generations()
+        bits = await self.redis_pool.execute(b'MGET', *(self.filter_key(generation) for generation in generations))
+        for generation, generation_bits in zip(generations, bits):
+            if generation_bits:
+                self._filter(generation).merge(generation_bits)
+
+    async def _refresh(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                logger.error('failed to refresh negative cache filter', cache=self.name, error=type(ex).__name__)
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        if self.ttl and self.redis_pool is not None and self._refresher is None:
+            self._refresher = asyncio.ensure_future(self._refresh())
+
+    async def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+
+
+def setup(app, redis_pool=None) -> NegativeCache:
+    """
+    Create the cache of access codes RHSvc did not recognise, held for INVALID_UAC_CACHE_TTL seconds.
+    A TTL of 0 turns the cache off.
+    """
+    cache = NegativeCache('invalid_uac',
+                          ttl=float(app['INVALID_UAC_CACHE_TTL']),
+                          capacity=int(app['INVALID_UAC_CACHE_CAPACITY']),
+                          redis_pool=redis_pool,
+                          refresh_interval=float(app['INVALID_UAC_FILTER_REFRESH']))
+
+    async def start_refresh(app):
+        cache.start()
+
+    async def stop_refresh(app):
+        await cache.stop()
+
+    app.on_startup.append(start_refresh)
+    app.on_shutdown.append(stop_refresh)
+    return cache
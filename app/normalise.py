@@ -0,0 +1,168 @@
+"""
+Normalisation of the values respondents type in, shared by the validators.
+
+Patterns are compiled and translation tables built once, at import, so each value is cleaned up
+in a single pass rather than one str.replace per unwanted character.
+"""
+import re
+import string
+
+from unicodedata import normalize
+
+UK_PREFIX = '44'
+
+# Reasons a value fails validation, as given by the check functions
+EMPTY = 'empty'
+NOT_ALPHANUMERIC = 'not_alphanumeric'
+NOT_DIGITS = 'not_digits'
+TOO_SHORT = 'too_short'
+TOO_LONG = 'too_long'
+INVALID_FORMAT = 'invalid_format'
+NOT_MOBILE = 'not_mobile'
+
+OBSCURE_WHITESPACE = (
+    '\u180E'  # Mongolian vowel separator
+    '\u200B'  # zero width space
+    '\u200C'  # zero width non-joiner
+    '\u200D'  # zero width joiner
+    '\u2060'  # word joiner
+    '\uFEFF'  # zero width non-breaking space
+)
+
+uac_pattern = re.compile(r'[A-Z0-9]{16}')
+postcode_pattern = re.compile(
+    r'^((AB|AL|B|BA|BB|BD|BH|BL|BN|BR|BS|BT|BX|CA|CB|CF|CH|CM|CO|CR|CT|CV|CW|DA|DD|DE|DG|DH|DL|DN|DT|DY|E|EC|EH|EN|EX|FK|FY|G|GL|GY|GU|HA|HD|HG|HP|HR|HS|HU|HX|IG|IM|IP|IV|JE|KA|KT|KW|KY|L|LA|LD|LE|LL|LN|LS|LU|M|ME|MK|ML|N|NE|NG|NN|NP|NR|NW|OL|OX|PA|PE|PH|PL|PO|PR|RG|RH|RM|S|SA|SE|SG|SK|SL|SM|SN|SO|SP|SR|SS|ST|SW|SY|TA|TD|TF|TN|TQ|TR|TS|TW|UB|W|WA|WC|WD|WF|WN|WR|WS|WV|YO|ZE)(\d[\dA-Z]?[ ]?\d[ABD-HJLN-UW-Z]{2}))$'  # NOQA
+)
+ipv4_pattern = re.compile(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}')
+email_pattern = re.compile(r'(^[^@\s]+@[^@\s]+\.[^@\s]+$)')
+
+whitespace_table = str.maketrans('', '', string.whitespace + OBSCURE_WHITESPACE)
+phone_number_table = str.maketrans('', '', string.whitespace + OBSCURE_WHITESPACE + '()-+')
+# Every character str.strip() removes, which all come before U+3001, and the zero width ones it does not
+name_strip_characters = ''.join(c for c in map(chr, range(0x3001)) if c.isspace()) + OBSCURE_WHITESPACE
+
+
+def uac(value) -> str:
+    """Upper case the UAC and remove the spaces it is printed with"""
+    return value.upper().replace(' ', '') if value else ''
+
+
+def is_uac(value) -> bool:
+    """Whether a normalised UAC is well formed"""
+    return uac_pattern.fullmatch(value) is not None
+
+
+def postcode(value) -> str:
+    """Remove all whitespace, upper case and fold any non ASCII characters to their ASCII equivalents"""
+    value = value.translate(whitespace_table).upper()
+    try:
+        value.encode('ascii')
+    except UnicodeEncodeError:
+        value = normalize('NFKD', value).encode('ascii', 'ignore').decode('utf8')
+    return value
+
+
+def check_postcode(value) -> tuple:
+    """
+    Validate a postcode against the rules of the web forms.
+
+    :return: The postcode formatted with a single space and None, or the normalised value and why it is invalid
+    """
+    value = postcode(value)
+    if not value:
+        return value, EMPTY
+    if not value.isalnum():
+        return value, NOT_ALPHANUMERIC
+    if len(value) < 5:
+        return value, TOO_SHORT
+    if len(value) > 7:
+        return value, TOO_LONG
+    if not postcode_pattern.fullmatch(value):
+        return value, INVALID_FORMAT
+    return value[:-3] + ' ' + value[-3:], None
+
+
+def postcode_sector(value) -> str:
+    """The sector of a postcode formatted by check_postcode, such as 'SW1A 1' for 'SW1A 1AA'"""
+    return value[:-2]
+
+
+def phone_number(value) -> str:
+    """Remove whitespace and the punctuation numbers are commonly written with"""
+    return value.translate(phone_number_table)
+
+
+def is_digits(value) -> bool:
+    """Whether every character of a normalised phone number is a digit. An empty number has no non digits."""
+    return not value or value.isdecimal()
+
+
+def check_uk_mobile_number(value) -> tuple:
+    """
+    Validate a UK mobile number against the rules of the web forms.
+
+    :return: The number with the 44 country code and None, or the normalised value and why it is invalid
+    """
+    value = phone_number(value)
+    if not is_digits(value):
+        return value, NOT_DIGITS
+    # Leading zeros go first, as a number written with the 00 international prefix has them before the country code
+    value = value.lstrip('0')
+    value = value.lstrip(UK_PREFIX).lstrip('0')
+    if not value:
+        return value, EMPTY
+    if not value.startswith('7'):
+        return value, NOT_MOBILE
+    if len(value) > 10:
+        return value, TOO_LONG
+    if len(value) < 10:
+        return value, TOO_SHORT
+    return UK_PREFIX + value, None
+
+
+def check_all(check, values) -> tuple:
+    """
+    Apply a check function to many values, such as a column of contact centre data, without raising for
+    invalid ones. Each distinct value is only checked once, as such data repeats a great deal.
+    None is treated as empty, and other values that are not strings, such as numbers, are checked as strings.
+
+    :return: A list of the normalised values and a list of the reasons each is invalid, None where valid
+    """
+    results = {}
+    normalised = []
+    errors = []
+    for value in values:
+        try:
+            result = results[value]
+        except KeyError:
+            result = results[value] = check('' if value is None else value if isinstance(value, str) else str(value))
+        normalised.append(result[0])
+        errors.append(result[1])
+    return normalised, errors
+
+
+def check_postcodes(values) -> tuple:
+    """check_postcode for each of values, see check_all"""
+    return check_all(check_postcode, values)
+
+
+def check_uk_mobile_numbers(values) -> tuple:
+    """check_uk_mobile_number for each of values, see check_all"""
+    return check_all(check_uk_mobile_number, values)
+
+
+def name(value) -> str:
+    """Strip whitespace, including zero width characters, from either end of a name"""
+    return value.strip(name_strip_characters) if value else ''
+
+
+def client_ip(forwarded_for) -> str:
+    """
+    The respondent's IP address from the client_ip X-Forwarded-For chain, which is the third from last address
+    as the load balancer and ingress each add one. Empty if there is no valid IPv4 address there.
+    """
+    if forwarded_for and forwarded_for.count(',') > 1:
+        ip = forwarded_for.split(',')[-3].strip()
+        if ipv4_pattern.fullmatch(ip):
+            return ip
+    return ''
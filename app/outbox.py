@@ -0,0 +1,280 @@
+import asyncio
+import os
+import socket
+import time
+
+from aiohttp.client_exceptions import ClientResponseError
+from aioredis import RedisError, ReplyError
+from structlog import get_logger
+
+from . import json_codec, metrics
+from .request import BackgroundRequest, RetryRequest
+from .session import RedisScript
+
+logger = get_logger('respondent-home')
+
+outbox_submissions = metrics.registry.counter(
+    'outbox_submissions_total', 'Submissions handled by the outbox, by kind and outcome.', ('kind', 'outcome'))
+outbox_backlog = metrics.registry.gauge(
+    'outbox_backlog', 'Submissions in the outbox stream, including those being sent or waiting to be retried.')
+outbox_pending = metrics.registry.gauge(
+    'outbox_pending', 'Submissions read from the outbox that have not been sent yet.')
+outbox_oldest_age = metrics.registry.gauge(
+    'outbox_oldest_age_seconds', 'Time since the oldest submission in the outbox was added.')
+
+# Adds a submission unless one with the same idempotency key was added within the last ARGV[1] seconds.
+# KEYS are the stream and the idempotency key, ARGV the key's lifetime and then the entry's fields.
+# Returns the new entry's id, or nothing for a duplicate.
+enqueue_script = RedisScript(b'''
+if redis.call('SET', KEYS[2], 1, 'NX', 'EX', ARGV[1]) then
+    return redis.call('XADD', KEYS[1], '*', unpack(ARGV, 2))
+end
+return false
+''')
+
+
+def _decode(fields):
+    return {fields[i].decode('utf-8'): fields[i + 1].decode('utf-8') for i in range(0, len(fields), 2)}
+
+
+def _next_id(entry_id):
+    """The smallest stream entry id after entry_id, to read on from it with an inclusive range"""
+    milliseconds, sequence = entry_id.split(b'-')
+    return milliseconds + b'-' + str(int(sequence) + 1).encode('ascii')
+
+
+class Outbox:
+    """
+    Submissions to RHSvc held in a Redis stream and sent in the background, so that the respondent does not wait
+    for RHSvc and is not shown an error when it is slow or unavailable.
+
+    Each worker reads batches from the stream as a member of one consumer group, so every submission is sent by
+    one worker. A submission is removed once RHSvc accepts it, or rejects it as a bad request. Otherwise it stays
+    pending and is retried by any worker after a backoff that doubles with each attempt, until max_attempts, when
+    it is moved to the dead letter stream. Up to pending_pages batches of pending submissions are looked through
+    for retries on each poll, carrying on from where the last poll stopped.
+    """
+    def __init__(self, app, redis_pool, stream='outbox', batch_size=20, poll_interval=0.5, max_attempts=10,
+                 backoff=5.0, max_backoff=300.0, idempotency_ttl=600, pending_pages=5):
+        self.app = app
+        self.redis_pool = redis_pool
+        self.stream = stream
+        self.dead_stream = stream + ':dead'
+        self.group = stream + '-dispatchers'
+        self.consumer = f'{socket.gethostname()}-{os.getpid()}'
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.idempotency_ttl = idempotency_ttl
+        self.pending_pages = pending_pages
+        # The entry id to look for retries from on the next poll
+        self._pending_cursor = b'-'
+        self._group_created = False
+        self._dispatcher = None
+
+    async def enqueue(self, request, kind, method, path, body, key) -> bool:
+        """
+        Add a submission to be sent to RHSvc.
+
+        :param request: The respondent's request
+        :param kind: What is being submitted, for metrics and logs
+        :param path: The path under RHSVC_URL to send to
+        :param body: The JSON body
+        :param key: The idempotency key. Submissions with the same key as a recent one are dropped.
+        :return: False if the submission was a duplicate
+        """
+        fields = {
+            'kind': kind, 'method': method, 'path': path, 'body': json_codec.dumps(body), 'key': key,
+            'client_ip': request['client_ip'] or '', 'client_id': request['client_id'], 'trace': request['trace'] or '',
+        }
+        args = [self.idempotency_ttl]
+        for name, value in fields.items():
+            args += [name, value]
+        added = await enqueue_script(self.redis_pool, [self.stream, f'{self.stream}:key:{key}'], args)
+        outbox_submissions.inc(kind, 'queued' if added else 'duplicate')
+        logger.info('submission queued' if added else 'duplicate submission dropped',
+                    kind=kind, client_ip=request['client_ip'], client_id=request['client_id'], trace=request['trace'])
+        return bool(added)
+
+    def retry_after(self, deliveries) -> float:
+        return min(self.backoff * 2 ** (deliveries - 1), self.max_backoff)
+
+    async def send(self, fields) -> str:
+        """Send one submission, returning 'sent', 'rejected' or 'retry'"""
+        request = BackgroundRequest(self.app, fields)
+        retry_request = RetryRequest(request, fields['method'], self.app['RHSVC_URL'] + fields['path'],
+                                     self.app['RHSVC_AUTH'], {'Idempotency-Key': fields['key']},
+                                     json_codec.loads(fields['body']), False)
+        try:
+            await retry_request.make_request()
+        except ClientResponseError as ex:
+            if 400 <= ex.status < 500 and ex.status != 429:
+                return 'rejected'
+            return 'retry'
+        except Exception as ex:
+            logger.warn('failed to send submission', kind=fields['kind'], error=type(ex).__name__,
+                        client_id=fields['client_id'], trace=fields['trace'])
+            return 'retry'
+        return 'sent'
+
+    async def dispatch(self, entries):
+        """Send a batch of (entry id, fields) concurrently, removing those that no longer need sending"""
+        outcomes = await asyncio.gather(*(self.send(fields) for _, fields in entries))
+        done = []
+        for (entry_id, fields), outcome in zip(entries, outcomes):
+            outbox_submissions.inc(fields['kind'], outcome)
+            if outcome == 'rejected':
+                await self.dead_letter(entry_id, fields, 'rejected')
+            if outcome != 'retry':
+                done.append(entry_id)
+        if done:
+            await self.redis_pool.execute(b'XACK', self.stream, self.group, *done)
+            await self.redis_pool.execute(b'XDEL', self.stream, *done)
+
+    async def dead_letter(self, entry_id, fields, reason):
+        logger.error('submission could not be sent', kind=fields['kind'], reason=reason,
+                     client_id=fields['client_id'], trace=fields['trace'])
+        args = []
+        for name, value in dict(fields, reason=reason, entry=entry_id.decode('ascii')).items():
+            args += [name, value]
+        await self.redis_pool.execute(b'XADD', self.dead_stream, b'*', *args)
+
+    async def read_new(self):
+        reply = await self.redis_pool.execute(b'XREADGROUP', b'GROUP', self.group, self.consumer,
+                                              b'COUNT', self.batch_size, b'STREAMS', self.stream, b'>')
+        if not reply:
+            return []
+        (_, entries), = reply
+        return [(entry_id, _decode(fields)) for entry_id, fields in entries]
+
+    async def claim_retries(self):
+        """
+        Claim pending submissions whose backoff has passed, including those left by workers that have stopped.
+        Submissions still backing off are passed over, so that they do not hold up those behind them.
+
+        Submissions are claimed only if they have been idle for their backoff, so that one claimed and being sent
+        by another worker since it was looked at, which resets its idle time, is left to that worker.
+        """
+        # Entry ids to claim, by (whether to retry them, the backoff in milliseconds they must have been idle for)
+        due = {}
+        found = 0
+        cursor = self._pending_cursor
+        for _ in range(self.pending_pages):
+            pending = await self.redis_pool.execute(b'XPENDING', self.stream, self.group, cursor, b'+',
+                                                    self.batch_size)
+            # A short page is the end of the pending entries, so the next poll starts again from the first
+            cursor = _next_id(pending[-1][0]) if len(pending) == self.batch_size else b'-'
+            for entry_id, _, idle, deliveries in pending:
+                if found == self.batch_size:
+                    cursor = entry_id
+                    break
+                min_idle = int(self.retry_after(deliveries) * 1000)
+                if idle >= min_idle:
+                    due.setdefault((deliveries < self.max_attempts, min_idle), []).append(entry_id)
+                    found += 1
+            if cursor == b'-' or found == self.batch_size:
+                break
+        self._pending_cursor = cursor
+        entries = []
+        for (retry, min_idle), entry_ids in due.items():
+            claimed = await self.redis_pool.execute(b'XCLAIM', self.stream, self.group, self.consumer, min_idle,
+                                                    *entry_ids)
+            # Entries removed from the stream come back without fields, or as nothing at all
+            claimed = [entry for entry in claimed if entry]
+            if retry:
+                entries += [(entry_id, _decode(fields)) for entry_id, fields in claimed if fields]
+                continue
+            for entry_id, fields in claimed:
+                if fields:
+                    await self.dead_letter(entry_id, _decode(fields), 'too many attempts')
+            if claimed:
+                given_up = [entry_id for entry_id, _ in claimed]
+                await self.redis_pool.execute(b'XACK', self.stream, self.group, *given_up)
+                await self.redis_pool.execute(b'XDEL', self.stream, *given_up)
+        return entries
+
+    async def record_backlog(self):
+        backlog = await self.redis_pool.execute(b'XLEN', self.stream)
+        pending, *_ = await self.redis_pool.execute(b'XPENDING', self.stream, self.group)
+        oldest = await self.redis_pool.execute(b'XRANGE', self.stream, b'-', b'+', b'COUNT', 1)
+        outbox_backlog.set(backlog)
+        outbox_pending.set(pending)
+        if oldest:
+            added_ms = int(oldest[0][0].split(b'-')[0])
+            outbox_oldest_age.set(max(0.0, time.time() - added_ms / 1000))
+        else:
+            outbox_oldest_age.set(0)
+
+    async def create_group(self):
+        try:
+            await self.redis_pool.execute(b'XGROUP', b'CREATE', self.stream, self.group, b'0', b'MKSTREAM')
+        except ReplyError as ex:
+            if not str(ex).startswith('BUSYGROUP'):
+                raise
+
+    async def dispatch_once(self) -> int:
+        """Send one batch of retries and new submissions, returning how many were attempted"""
+        entries = await self.claim_retries()
+        entries += await self.read_new()
+        if entries:
+            await self.dispatch(entries)
+        await self.record_backlog()
+        return len(entries)
+
+    async def _dispatch(self):
+        while True:
+            try:
+                if not self._group_created:
+                    await self.create_group()
+                    self._group_created = True
+                if await self.dispatch_once():
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except (RedisError, OSError) as ex:
+                # The stream may have been removed from Redis, taking the group with it
+                self._group_created = not str(ex).startswith('NOGROUP')
+                logger.error('outbox dispatch failed', error=type(ex).__name__)
+            except Exception:
+                logger.exception('outbox dispatch failed')
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+    async def stop(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+
+def setup(app, redis_pool=None):
+    """
+    Create the outbox when OUTBOX_ENABLED is set and there is a Redis pool, dispatching between startup and shutdown.
+    Submissions are sent directly when there is no outbox.
+    """
+    if not app['OUTBOX_ENABLED'] or redis_pool is None:
+        return None
+
+    outbox = Outbox(app, redis_pool,
+                    batch_size=int(app['OUTBOX_BATCH_SIZE']),
+                    max_attempts=int(app['OUTBOX_MAX_ATTEMPTS']),
+                    backoff=float(app['OUTBOX_BACKOFF']),
+                    idempotency_ttl=int(app['OUTBOX_IDEMPOTENCY_TTL']))
+
+    async def start_dispatch(app):
+        outbox.start()
+
+    async def stop_dispatch(app):
+        await outbox.stop()
+
+    app.on_startup.append(start_dispatch)
+    app.on_shutdown.append(stop_dispatch)
+    return outbox
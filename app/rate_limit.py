@@ -0,0 +1,138 @@
+import random
+import time
+
+from collections import deque
+
+from aioredis import RedisError
+from structlog import get_logger
+
+from . import metrics
+from .session import RedisScript
+
+logger = get_logger('respondent-home')
+
+rate_limited = metrics.registry.counter(
+    'rate_limited_total', 'Requests rejected by a local rate limit.', ('limit',))
+
+# Checks every window before recording the attempt in any, so that rejected attempts do not extend a window.
+# KEYS are the windows, ARGV the time, a unique member and then the (seconds, count) of each window.
+# Returns 0 when allowed, or the position of the first window that is full.
+sliding_windows_script = RedisScript(b'''
+local now = tonumber(ARGV[1])
+for i, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - tonumber(ARGV[2 * i + 1]))
+    if redis.call('ZCARD', key) >= tonumber(ARGV[2 * i + 2]) then
+        return i
+    end
+end
+for i, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, ARGV[2])
+    redis.call('PEXPIRE', key, math.ceil(tonumber(ARGV[2 * i + 1]) * 1000))
+end
+return 0
+''')
+
+
+def parse_limit(limit):
+    """
+    Parse 'count/seconds', such as '20/60' for 20 attempts a minute, into (count, seconds).
+    An empty limit is None, meaning unlimited.
+    """
+    if not limit:
+        return None
+    count, _, seconds = limit.partition('/')
+    return int(count), float(seconds)
+
+
+class MemoryWindows:
+    """
+    Sliding windows kept in this process, used when Redis cannot be reached.
+    Each worker then limits on its own, so the limits are looser than when shared through Redis.
+    """
+    sweep_every = 1000
+
+    def __init__(self):
+        self.windows = {}
+        self.hits = 0
+
+    def hit(self, windows, now):
+        for position, (key, seconds, count) in enumerate(windows, 1):
+            attempts = self.windows.get(key)
+            if attempts is None:
+                continue
+            while attempts and attempts[0] <= now - seconds:
+                attempts.popleft()
+            if len(attempts) >= count:
+                return position
+        for key, seconds, count in windows:
+            self.windows.setdefault(key, deque()).append(now)
+        self.hits += 1
+        if self.hits % self.sweep_every == 0:
+            self.sweep(now, max(seconds for _, seconds, _ in windows))
+        return 0
+
+    def sweep(self, now, seconds):
+        """Forget windows with no attempts in the last seconds, so that one off clients do not use memory forever"""
+        for key in [key for key, attempts in self.windows.items() if not attempts or attempts[-1] <= now - seconds]:
+            del self.windows[key]
+
+
+class RateLimiter:
+    """
+    Sliding window rate limits on attempts by different identifiers, such as the client IP and session.
+
+    The windows are sorted sets in Redis, scored by the time of each attempt, and are checked and updated
+    atomically by a script, so the limits hold across every worker and instance.
+
+    :param limits: limit name to (count, seconds), allowing count attempts in any period of that many seconds
+    """
+    def __init__(self, limits, redis_pool=None, prefix='rate_limit'):
+        self.limits = {name: limit for name, limit in limits.items() if limit}
+        self.redis_pool = redis_pool
+        self.prefix = prefix
+        self.memory = MemoryWindows()
+
+    async def hit(self, **identifiers):
+        """
+        Record an attempt by each of the identifiers, by limit name, unless any of their limits has been reached.
+        Identifiers that are empty or have no limit are not limited.
+
+        :return: The name of the limit reached, or None when the attempt is allowed
+        """
+        names = [name for name in self.limits if identifiers.get(name)]
+        if not names:
+            return None
+        windows = [(f'{self.prefix}:{name}:{identifiers[name]}', self.limits[name][1], self.limits[name][0])
+                   for name in names]
+        now = time.time()
+        position = None
+        if self.redis_pool is not None:
+            try:
+                position = await self._hit_redis(windows, now)
+            except (RedisError, OSError) as ex:
+                logger.error('failed to check rate limits in redis, limiting in this process only',
+                             error=type(ex).__name__)
+        if position is None:
+            position = self.memory.hit(windows, now)
+        if position:
+            name = names[position - 1]
+            rate_limited.inc(name)
+            return name
+        return None
+
+    async def _hit_redis(self, windows, now):
+        args = [now, f'{now}:{random.getrandbits(32)}']
+        for _, seconds, count in windows:
+            args += [seconds, count]
+        return await sliding_windows_script(self.redis_pool, [key for key, _, _ in windows], args)
+
+
+def setup(app, redis_pool=None) -> RateLimiter:
+    """
+    Create the rate limiter for access code entry, from RATE_LIMIT_UAC_IP and RATE_LIMIT_UAC_SESSION.
+    Without a Redis pool, attempts are only counted within this process.
+    """
+    return RateLimiter({
+        'ip': parse_limit(app['RATE_LIMIT_UAC_IP']),
+        'session': parse_limit(app['RATE_LIMIT_UAC_SESSION']),
+    }, redis_pool=redis_pool, prefix='rate_limit:uac')
@@ -1,4 +1,9 @@
+import time
+
+from functools import partial
+
 import aiohttp
+from aiohttp.payload import JsonPayload
 from aiohttp.client_exceptions import (ClientConnectionError,
                                        ClientConnectorError,
                                        ClientResponseError)
@@ -11,6 +16,8 @@ from tenacity import (retry,
                       RetryError)
 from structlog import get_logger
 
+from . import json_codec, metrics, tracing
+
 logger = get_logger('respondent-home')
 
 pooled_attempts_limit = 2
@@ -30,18 +37,35 @@ def after_failed_pooled(retry_state):
     after_failed_attempt('pooled', retry_state)
 
 
+class BackgroundRequest(dict):
+    """
+    Stands in for a respondent's request when a call is made in the background, such as sending a submission from
+    the outbox, carrying the app and any values used to tie log entries to the respondent.
+    """
+    def __init__(self, app, fields=None):
+        fields = fields or {}
+        super().__init__(client_ip=fields.get('client_ip'), client_id=fields.get('client_id'),
+                         trace=fields.get('trace'))
+        self.app = app
+        self.headers = {}
+
+
 class RetryRequest:
     """
     Make requests to a URL, but retry under certain conditions to tolerate server graceful shutdown.
     """
-    def __init__(self, request, method, url, auth, request_headers, request_json, return_json):
+    def __init__(self, request, method, url, auth, request_headers, request_json, return_json, response_parser=None):
         self.request = request
         self.method = method
         self.url = url
         self.auth = auth
         self.headers = request_headers
         self.json = request_json
+        self.data = JsonPayload(request_json, dumps=json_codec.dumps) if request_json is not None else None
         self.return_json = return_json
+        self.response_parser = response_parser
+        self.service = metrics.upstream_service(request.app, url)
+        self.attempts = {'pooled': 0, 'basic': 0}
 
     def __handle_response(self, response):
         try:
@@ -55,6 +79,37 @@ class RetryRequest:
                          trace=self.request['trace'],
                          url=self.url)
 
+    async def __read_response(self, response):
+        if not self.return_json:
+            return None
+        if self.response_parser:
+            return await self.response_parser(response)
+        return await response.json(loads=json_codec.loads)
+
+    async def __send(self, connection, send):
+        """
+        Make one attempt at the request, timing it and propagating the trace context.
+
+        :param connection: 'pooled' or 'basic'
+        :param send: Callable taking the request headers and returning the response context manager
+        """
+        self.attempts[connection] += 1
+        attempt = str(self.attempts[connection])
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            with tracing.span(self.request, f'{self.method} {self.service}',
+                              connection=connection, attempt=attempt, **{'http.url': self.url}) as span:
+                async with send(headers=tracing.inject(span, self.headers)) as resp:
+                    status = str(resp.status)
+                    if span is not None:
+                        span.attributes['http.status_code'] = status
+                    self.__handle_response(resp)
+                    return await self.__read_response(resp)
+        finally:
+            metrics.upstream_request_duration.observe(time.perf_counter() - start, self.service, connection, attempt)
+            metrics.upstream_requests.inc(self.service, connection, status)
+
     @retry(reraise=True, stop=stop_after_attempt(basic_attempt_limit),
            wait=wait_exponential(multiplier=wait_multiplier, exp_base=25),
            after=after_failed_basic,
@@ -67,13 +122,8 @@ class RetryRequest:
                     client_id=self.request['client_id'],
                     trace=self.request['trace'])
 
-        async with aiohttp.request(
-                self.method, self.url, auth=self.auth, json=self.json, headers=self.headers) as resp:
-            self.__handle_response(resp)
-            if self.return_json:
-                return await resp.json()
-            else:
-                return None
+        return await self.__send('basic', partial(
+            aiohttp.request, self.method, self.url, auth=self.auth, data=self.data))
 
     @retry(stop=stop_after_attempt(pooled_attempts_limit),
            wait=wait_exponential(multiplier=wait_multiplier),
@@ -81,13 +131,8 @@ class RetryRequest:
            retry=(retry_if_exception_message(match='503.*') | retry_if_exception_type((ClientConnectionError,
                                                                                        ClientConnectorError))))
     async def _request_using_pool(self):
-        async with self.request.app.http_session_pool.request(
-                self.method, self.url, auth=self.auth, json=self.json, headers=self.headers, ssl=False) as resp:
-            self.__handle_response(resp)
-            if self.return_json:
-                return await resp.json()
-            else:
-                return None
+        return await self.__send('pooled', partial(
+            self.request.app.http_session_pool.request, self.method, self.url, auth=self.auth, data=self.data, ssl=False))
 
     async def make_request(self):
         """
@@ -112,6 +157,7 @@ class RetryRequest:
                             client_id=self.request['client_id'],
                             trace=self.request['trace'],
                             attempts=attempts)
+                metrics.upstream_fallbacks.inc(self.service)
                 return await self._request_basic()
         except ClientResponseError as ex:
             if ex.status not in [400, 404, 429]:
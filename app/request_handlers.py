@@ -8,6 +8,7 @@ from structlog import get_logger
 from . import (NO_SELECTION_CHECK_MSG,
                NO_SELECTION_CHECK_MSG_CY)
 
+from . import normalise
 from .flash import flash
 
 from .exceptions import TooManyRequests
@@ -576,8 +577,8 @@ class RequestCommonEnterName(RequestCommon):
                     request_type=request_type
                 ))
 
-        name_first_name = data['name_first_name'].strip()
-        name_last_name = data['name_last_name'].strip()
+        name_first_name = normalise.name(data['name_first_name'])
+        name_last_name = normalise.name(data['name_last_name'])
 
         attributes['first_name'] = name_first_name
         attributes['last_name'] = name_last_name
@@ -1,10 +1,13 @@
+import hashlib
 import time
 
 from asyncio import get_event_loop
-from aioredis import create_pool, RedisError
+from aioredis import create_pool, RedisError, ReplyError
 from aiohttp_session import session_middleware, Session, get_session
 from aiohttp_session.redis_storage import RedisStorage
 from structlog import get_logger
+
+from . import json_codec, metrics, tracing
 from .exceptions import SessionTimeout
 
 logger = get_logger('respondent-home')
@@ -36,6 +39,27 @@ def aiohttp_session_pr_331_rollback(self, identity, *, data, new,
         self._mapping.update(session_data)
 
 
+class TimedRedisStorage(RedisStorage):
+    """
+    RedisStorage that records how long sessions take to load and save, as metrics and as trace spans.
+    """
+    async def load_session(self, request):
+        start = time.perf_counter()
+        try:
+            with tracing.span(request, 'session load'):
+                return await super().load_session(request)
+        finally:
+            metrics.session_duration.observe(time.perf_counter() - start, 'load')
+
+    async def save_session(self, request, response, session):
+        start = time.perf_counter()
+        try:
+            with tracing.span(request, 'session save'):
+                return await super().save_session(request, response, session)
+        finally:
+            metrics.session_duration.observe(time.perf_counter() - start, 'save')
+
+
 def setup(app_config):
     # Monkey patch aiohttp_session.py Session.__init__ method to remove PR 331 as above
     Session.__init__ = aiohttp_session_pr_331_rollback
@@ -43,10 +67,32 @@ def setup(app_config):
     loop = get_event_loop()
     redis_pool = loop.run_until_complete(
         make_redis_pool(app_config['REDIS_SERVER'], app_config['REDIS_PORT'], app_config['REDIS_POOL_MIN'], app_config['REDIS_POOL_MAX']))
-    return session_middleware(
-        RedisStorage(redis_pool,
-                     cookie_name='RH_SESSION',
-                     max_age=int(app_config['SESSION_AGE'])))
+    middleware = session_middleware(
+        TimedRedisStorage(redis_pool,
+                          cookie_name='RH_SESSION',
+                          max_age=int(app_config['SESSION_AGE']),
+                          encoder=json_codec.dumps,
+                          decoder=json_codec.loads))
+    # Exposed so that the pool can be used for health checks
+    middleware.redis_pool = redis_pool
+    return middleware
+
+
+class RedisScript:
+    """
+    A Lua script run by its SHA1, so that only the first call after Redis has lost its script cache sends it in full.
+    """
+    def __init__(self, source: bytes):
+        self.source = source
+        self.sha = hashlib.sha1(source).hexdigest()
+
+    async def __call__(self, redis_pool, keys, args):
+        try:
+            return await redis_pool.execute(b'EVALSHA', self.sha, len(keys), *keys, *args)
+        except ReplyError as ex:
+            if not str(ex).startswith('NOSCRIPT'):
+                raise
+            return await redis_pool.execute(b'EVAL', self.source, len(keys), *keys, *args)
 
 
 async def make_redis_pool(host, port, poolMin, poolMax):
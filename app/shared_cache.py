@@ -0,0 +1,136 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+
+from structlog import get_logger
+
+from . import metrics
+
+logger = get_logger('respondent-home')
+
+shared_cache_reads = metrics.registry.counter(
+    'shared_cache_reads_total', 'Reads from the cache shared by the workers on a host, by result.', ('result',))
+
+MAGIC = b'RHSC'
+VERSION = 1
+# Magic, version, number of slots and slot size
+header = struct.Struct('<4sHxxII')
+header_size = 64
+# Sequence number, key hash, key length and value length
+slot_header = struct.Struct('<QQII')
+
+
+def key_hash(key):
+    # Python's own hash differs between processes
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little') or 1
+
+
+class SharedCache:
+    """
+    A table of byte strings in a memory mapped file, so that every worker on a host reads the values any of them
+    has written, without each keeping its own copy.
+
+    Each key has a single slot, chosen by its hash, and a value written there replaces whatever was in it.
+    Values too large for a slot are not kept. Writers take a lock on the file, while readers take none: each
+    slot has a sequence number that is odd while it is being written and is moved on by every write, so a reader
+    that sees it odd or changed while it was copying the slot treats the read as a miss.
+    """
+    def __init__(self, path, slots=16384, slot_size=4096):
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.capacity = slot_size - slot_header.size
+        size = header_size + slots * slot_size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            with self._lock():
+                existing = os.pread(self._fd, header.size, 0)
+                if not existing:
+                    os.ftruncate(self._fd, size)
+                    os.pwrite(self._fd, header.pack(MAGIC, VERSION, slots, slot_size), 0)
+                elif existing != header.pack(MAGIC, VERSION, slots, slot_size):
+                    # Resizing it would fault the workers still reading it
+                    raise ValueError(f'{path} is laid out for other settings')
+            self._map = mmap.mmap(self._fd, size)
+        except Exception:
+            os.close(self._fd)
+            raise
+
+    def _lock(self):
+        return _FileLock(self._fd)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+    def _slot(self, hashed):
+        return header_size + (hashed % self.slots) * self.slot_size
+
+    def get(self, key: bytes):
+        """:return: The value for key, or None when it is not in the cache"""
+        hashed = key_hash(key)
+        offset = self._slot(hashed)
+        shared_map = self._map
+        sequence, stored_hash, key_length, value_length = slot_header.unpack_from(shared_map, offset)
+        if sequence & 1 or stored_hash != hashed:
+            shared_cache_reads.inc('miss')
+            return None
+        start = offset + slot_header.size
+        data = shared_map[start:start + key_length + value_length]
+        if slot_header.unpack_from(shared_map, offset)[0] != sequence or data[:key_length] != key:
+            shared_cache_reads.inc('miss')
+            return None
+        shared_cache_reads.inc('hit')
+        return data[key_length:]
+
+    def set(self, key: bytes, value: bytes):
+        """:return: Whether the value was stored, which it is not when too large for a slot"""
+        if len(key) + len(value) > self.capacity:
+            return False
+        hashed = key_hash(key)
+        offset = self._slot(hashed)
+        shared_map = self._map
+        with self._lock():
+            # Readers see the slot as changing until the sequence number is even again
+            writing = slot_header.unpack_from(shared_map, offset)[0] | 1
+            struct.pack_into('<Q', shared_map, offset, writing)
+            start = offset + slot_header.size
+            shared_map[start:start + len(key) + len(value)] = key + value
+            slot_header.pack_into(shared_map, offset, writing, hashed, len(key), len(value))
+            struct.pack_into('<Q', shared_map, offset, writing + 1)
+        return True
+
+
+class _FileLock:
+    def __init__(self, fd):
+        self.fd = fd
+
+    # Record locks belong to a process, so workers forked after the file was opened still exclude each other
+    def __enter__(self):
+        fcntl.lockf(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc_info):
+        fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+
+def setup(app):
+    """
+    Open the cache shared by the workers on a host at SHARED_CACHE_FILE, such as a file under /dev/shm, with
+    SHARED_CACHE_SLOTS slots of SHARED_CACHE_SLOT_SIZE bytes. There is no shared cache without a file.
+    """
+    if not app['SHARED_CACHE_FILE']:
+        return None
+    try:
+        shared_cache = SharedCache(app['SHARED_CACHE_FILE'], slots=int(app['SHARED_CACHE_SLOTS']),
+                                   slot_size=int(app['SHARED_CACHE_SLOT_SIZE']))
+    except (OSError, ValueError) as ex:
+        logger.error('could not open shared cache', path=app['SHARED_CACHE_FILE'], error=type(ex).__name__)
+        return None
+
+    async def close_shared_cache(app):
+        shared_cache.close()
+
+    app.on_cleanup.append(close_shared_cache)
+    return shared_cache
@@ -1,5 +1,4 @@
 import aiohttp_jinja2
-import re
 import uuid
 
 from aiohttp.client_exceptions import (ClientResponseError)
@@ -12,9 +11,10 @@ from . import (BAD_CODE_MSG, INVALID_CODE_MSG, NO_SELECTION_CHECK_MSG,
                BAD_CODE_MSG_CY, INVALID_CODE_MSG_CY, NO_SELECTION_CHECK_MSG_CY,
                START_PAGE_TITLE_EN, START_PAGE_TITLE_CY)
 
+from . import normalise
 from .flash import flash
 
-from .exceptions import InvalidEqPayLoad, InvalidAccessCode
+from .exceptions import InvalidEqPayLoad, InvalidAccessCode, TooManyRequestsUAC
 from .security import remember, get_permitted_session, forget, get_sha256_hash, invalidate
 from .session import get_session_value
 
@@ -41,14 +41,9 @@ class StartCommon(View):
 
     @staticmethod
     def uac_hash(uac, expected_length=16):
-        if uac:
-            combined = uac.upper().replace(' ', '')
-        else:
-            combined = ''
-
-        uac_validation_pattern = re.compile(r'^[A-Z0-9]{16}$')
+        combined = normalise.uac(uac)
 
-        if (len(combined) < expected_length) or not (uac_validation_pattern.fullmatch(combined)):  # yapf: disable
+        if (len(combined) < expected_length) or not normalise.is_uac(combined):  # yapf: disable
             raise TypeError
 
         return get_sha256_hash(combined)
@@ -155,21 +150,39 @@ class Start(StartCommon):
 
         self.setup_uac_hash(request, data.get('uac'), lang=display_region)
 
-        try:
-            uac_json = await RHService.get_uac_details(request)
-        except ClientResponseError as ex:
-            if ex.status == 404:
-                logger.warn('attempt to use an invalid access code',
-                            client_ip=request['client_ip'], client_id=request['client_id'], trace=request['trace'])
-                if display_region == 'cy':
-                    flash(request, INVALID_CODE_MSG_CY)
+        limit = await request.app['uac_rate_limiter'].hit(ip=View.single_client_ip(request),
+                                                          session=request['client_id'])
+        if limit:
+            logger.warn('access code entry rate limited',
+                        limit=limit,
+                        client_ip=request['client_ip'],
+                        client_id=request['client_id'],
+                        trace=request['trace'])
+            raise TooManyRequestsUAC
+
+        invalid_uacs = request.app['invalid_uac_cache']
+        if await invalid_uacs.contains(request['uac_hash']):
+            uac_json = None
+        else:
+            try:
+                uac_json = await RHService.get_uac_details(request)
+            except ClientResponseError as ex:
+                if ex.status == 404:
+                    await invalid_uacs.add(request['uac_hash'])
+                    uac_json = None
                 else:
-                    flash(request, INVALID_CODE_MSG)
-                raise InvalidAccessCode
+                    logger.error('error processing access code',
+                                 client_ip=request['client_ip'], client_id=request['client_id'], trace=request['trace'])
+                    raise ex
+
+        if uac_json is None:
+            logger.warn('attempt to use an invalid access code',
+                        client_ip=request['client_ip'], client_id=request['client_id'], trace=request['trace'])
+            if display_region == 'cy':
+                flash(request, INVALID_CODE_MSG_CY)
             else:
-                logger.error('error processing access code',
-                             client_ip=request['client_ip'], client_id=request['client_id'], trace=request['trace'])
-                raise ex
+                flash(request, INVALID_CODE_MSG)
+            raise InvalidAccessCode
 
         if uac_json['caseId'] is None:
             logger.info('unlinked case',
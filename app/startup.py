@@ -0,0 +1,98 @@
+import builtins
+import importlib.util
+import sys
+import time
+
+from envparse import env
+from structlog import get_logger
+
+logger = get_logger('respondent-home')
+
+
+class ImportProfiler:
+    """
+    Times every module imported while it is running, by wrapping __import__, as Python 3.6 has no -X importtime.
+    Each module's own time leaves out the modules it imported, so the times can be summed by package.
+    """
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.modules = {}
+        self._stack = []
+        self._import = None
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        target = name
+        if level:
+            try:
+                target = importlib.util.resolve_name('.' * level + name, (globals or {}).get('__package__'))
+            except (ImportError, ValueError):
+                pass
+        if target in sys.modules and fromlist:
+            # from package import submodule
+            target = next((f'{target}.{item}' for item in fromlist if f'{target}.{item}' not in sys.modules), target)
+        if target in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+
+        frame = [0.0]
+        self._stack.append(frame)
+        start = self.clock()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = self.clock() - start
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1][0] += elapsed
+            self.modules[target] = elapsed - frame[0]
+
+    def start(self):
+        if self._import is None:
+            self._import = builtins.__import__
+            builtins.__import__ = self._timed_import
+
+    def stop(self):
+        if self._import is not None:
+            builtins.__import__ = self._import
+            self._import = None
+
+    def by_package(self, top=15):
+        """:return: The top packages by the time spent importing their modules, in milliseconds"""
+        packages = {}
+        for module, elapsed in self.modules.items():
+            package = module.split('.')[0]
+            packages[package] = packages.get(package, 0.0) + elapsed
+        slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        return {package: round(elapsed * 1000, 1) for package, elapsed in slowest}
+
+
+# Started when the app package is imported with STARTUP_PROFILE on, so the app's own imports are timed too
+import_profiler = ImportProfiler()
+
+
+class StartupProfile:
+    """
+    The time taken by each phase of creating the app, marked as each one finishes, logged once the app is ready.
+    """
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = self.last = clock()
+        self.phases = {}
+
+    def mark(self, phase):
+        now = self.clock()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    def log(self, **kwargs):
+        phases = {phase: round(elapsed * 1000, 1) for phase, elapsed in self.phases.items()}
+        if import_profiler.modules:
+            import_profiler.stop()
+            kwargs['imports_ms'] = import_profiler.by_package()
+        logger.info('app startup profile', duration_ms=round((self.clock() - self.started) * 1000, 1),
+                    phases_ms=phases, **kwargs)
+
+
+def profile_imports():
+    # Read as the STARTUP_PROFILE setting is, as the config is not loaded yet
+    if env.bool('STARTUP_PROFILE', default=False):
+        import_profiler.start()
@@ -0,0 +1,183 @@
+import codecs
+import re
+
+from json import JSONDecoder
+
+from aiohttp.client_exceptions import ContentTypeError
+
+chunk_size = 16 * 1024
+
+# Fields of each AIMS address that are used when building the select address page
+address_fields = ('uprn', 'formattedAddress')
+
+addresses_pattern = re.compile(r'"addresses"\s*:\s*\[')
+# The lookahead stops a number split across two chunks from being read early
+total_pattern = re.compile(r'"total"\s*:\s*(\d+)(?=\D)')
+token_pattern = re.compile(r'"(?:[^"\\]|\\.)*(")?|[\[\]{}]')
+whitespace_and_commas = ' \t\r\n,'
+
+# Enough trailing text to hold a partially received "total" field while searching for it
+search_overlap = 64
+
+SEEK, ARRAY, SKIP, TAIL = range(4)
+
+
+class PostcodeResponseParser:
+    """
+    Incremental parser for AIMS postcode responses.
+
+    Feed the response body a chunk at a time. Only the uprn and formattedAddress of each address and the
+    response total are kept. Once the address limit is reached, the remaining addresses are scanned over
+    without being decoded.
+    """
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.addresses = None
+        self.total = None
+        self._state = SEEK
+        self._buffer = ''
+        self._depth = 0
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json_decoder = JSONDecoder()
+
+    @property
+    def done(self):
+        return self._state == TAIL and self.total is not None
+
+    def feed(self, chunk: bytes):
+        self._buffer += self._text_decoder.decode(chunk)
+        self._parse()
+
+    def close(self):
+        self._buffer += self._text_decoder.decode(b'', final=True)
+        self._parse()
+        if self._state in (ARRAY, SKIP):
+            raise ValueError('AIMS postcode response ended inside the addresses array')
+
+    def result(self) -> dict:
+        """
+        Return the parsed fields in the same shape as the full AIMS response.
+        Fields that were not present in the body are left out, as they would be in the decoded JSON.
+        """
+        response = {}
+        if self.addresses is not None:
+            response['addresses'] = self.addresses
+        if self.total is not None:
+            response['total'] = self.total
+        return {'response': response}
+
+    def _parse(self):
+        while True:
+            if self._state == SEEK:
+                match = addresses_pattern.search(self._buffer)
+                if not match:
+                    self._find_total(self._buffer)
+                    self._buffer = self._buffer[-search_overlap:]
+                    return
+                self._find_total(self._buffer[:match.start()])
+                self._buffer = self._buffer[match.end():]
+                self.addresses = []
+                self._state = ARRAY
+
+            elif self._state == ARRAY:
+                if not self._parse_addresses():
+                    return
+
+            elif self._state == SKIP:
+                if not self._skip_addresses():
+                    return
+
+            else:
+                if not self.done:
+                    self._find_total(self._buffer)
+                self._buffer = self._buffer[-search_overlap:]
+                return
+
+    def _parse_addresses(self):
+        """
+        Decode complete address objects from the buffer.
+        Returns True when the parser has moved on to another state.
+        """
+        buffer = self._buffer
+        position = 0
+        length = len(buffer)
+        try:
+            while True:
+                while position < length and buffer[position] in whitespace_and_commas:
+                    position += 1
+                if position == length:
+                    return False
+                if buffer[position] == ']':
+                    position += 1
+                    self._state = TAIL
+                    return True
+                if self.limit is not None and len(self.addresses) >= self.limit:
+                    self._state = SKIP
+                    return True
+                try:
+                    address, position = self._json_decoder.raw_decode(buffer, position)
+                except ValueError:
+                    # Most likely an object split across chunks, wait for more data
+                    return False
+                self.addresses.append({key: address[key] for key in address_fields if key in address})
+        finally:
+            self._buffer = buffer[position:]
+
+    def _skip_addresses(self):
+        """
+        Scan over the rest of the addresses array without decoding it.
+        Returns True when the end of the array has been reached.
+        """
+        position = 0
+        for match in token_pattern.finditer(self._buffer):
+            token = match.group()
+            if token[0] == '"':
+                if match.group(1) is None:
+                    # String continues in the next chunk
+                    position = match.start()
+                    break
+            elif token in '[{':
+                self._depth += 1
+            elif self._depth:
+                self._depth -= 1
+            elif token == ']':
+                self._buffer = self._buffer[match.end():]
+                self._state = TAIL
+                return True
+            position = match.end()
+        else:
+            position = len(self._buffer)
+        self._buffer = self._buffer[position:]
+        return False
+
+    def _find_total(self, text):
+        if self.total is None:
+            match = total_pattern.search(text)
+            if match:
+                self.total = int(match.group(1))
+
+
+async def read_postcode_response(response, limit=None) -> dict:
+    """
+    Stream an AIMS postcode response body through a PostcodeResponseParser,
+    stopping as soon as everything needed has been read.
+
+    :param response: The aiohttp client response
+    :param limit: The maximum number of addresses to keep
+    """
+    content_type = response.headers.get('Content-Type', '').lower()
+    if 'json' not in content_type:
+        raise ContentTypeError(
+            response.request_info,
+            response.history,
+            message='Attempt to decode JSON with unexpected mimetype: %s' % content_type,
+            headers=response.headers)
+
+    parser = PostcodeResponseParser(limit)
+    async for chunk in response.content.iter_chunked(chunk_size):
+        parser.feed(chunk)
+        if parser.done:
+            break
+    else:
+        parser.close()
+    return parser.result()
@@ -0,0 +1,215 @@
+import asyncio
+import bisect
+import csv
+import heapq
+import math
+import time
+
+from array import array
+
+from structlog import get_logger
+
+from . import json_codec, metrics
+
+logger = get_logger('respondent-home')
+
+support_centre_lookups = metrics.registry.counter(
+    'support_centre_lookups_total', 'Support centre searches, by whether the local index could answer them.',
+    ('source',))
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def to_unit_vector(latitude, longitude):
+    """
+    The point on a unit sphere at latitude and longitude. The straight line distance between two such points
+    grows with the distance over the Earth's surface, so nearest points can be found without trigonometry.
+    """
+    latitude, longitude = math.radians(latitude), math.radians(longitude)
+    return (math.cos(latitude) * math.cos(longitude), math.cos(latitude) * math.sin(longitude),
+            math.sin(latitude))
+
+
+def distance_in_miles(chord):
+    """The distance over the Earth's surface between two points a chord apart on a unit sphere"""
+    return 2 * math.asin(min(1.0, chord / 2)) * EARTH_RADIUS_MILES
+
+
+def postcode_key(postcode):
+    """
+    A postcode as an integer, so that a million postcodes fit in a compact sorted array.
+    Postcodes start with a letter, so reading them in base 36 gives each a different number.
+    """
+    return int(postcode.replace(' ', ''), 36)
+
+
+class PostcodeCentroids:
+    """
+    The latitude and longitude at the centre of each postcode, such as from the ONS Postcode Directory,
+    held in sorted arrays at 16 bytes a postcode and looked up by binary search.
+    """
+    def __init__(self, rows=()):
+        rows = sorted((postcode_key(postcode), latitude, longitude) for postcode, latitude, longitude in rows)
+        self.keys = array('Q', (key for key, _, _ in rows))
+        self.latitudes = array('f', (latitude for _, latitude, _ in rows))
+        self.longitudes = array('f', (longitude for _, _, longitude in rows))
+
+    @classmethod
+    def load(cls, path):
+        """Load a CSV of postcode, latitude and longitude, skipping rows without coordinates"""
+        def rows(reader):
+            for row in reader:
+                try:
+                    yield row[0], float(row[1]), float(row[2])
+                except (IndexError, ValueError):
+                    continue
+        with open(path, newline='') as centroids_file:
+            return cls(rows(csv.reader(centroids_file)))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get(self, postcode):
+        """:return: (latitude, longitude), or None for a postcode not in the table"""
+        try:
+            key = postcode_key(postcode)
+        except ValueError:
+            return None
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            return self.latitudes[position], self.longitudes[position]
+        return None
+
+
+class KDTree:
+    """
+    A k-d tree of points, finding the k nearest to a point by visiting only the branches that could hold them.
+    Nodes are (point index, axis, left, right), with the points split on the axis they are most spread along.
+    """
+    def __init__(self, points):
+        self.points = points
+        self.root = self._build(list(range(len(points))))
+
+    def _build(self, indexes):
+        if not indexes:
+            return None
+        points = self.points
+        axis = max(range(3), key=lambda axis: (max(points[index][axis] for index in indexes)
+                                               - min(points[index][axis] for index in indexes)))
+        indexes.sort(key=lambda index: points[index][axis])
+        middle = len(indexes) // 2
+        return indexes[middle], axis, self._build(indexes[:middle]), self._build(indexes[middle + 1:])
+
+    def nearest(self, point, k):
+        """:return: [(distance, point index)] of the k nearest points, nearest first"""
+        # A max heap by negated squared distance of the nearest found so far
+        found = []
+        points = self.points
+        px, py, pz = point
+        # Nodes to visit, with the squared distance to the plane separating them from the point
+        stack = [(self.root, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            # The far side of a plane can only hold a nearer point when the plane is nearer than the furthest found
+            if node is None or (len(found) == k and bound >= -found[0][0]):
+                continue
+            index, axis, left, right = node
+            x, y, z = points[index]
+            squared = (x - px) ** 2 + (y - py) ** 2 + (z - pz) ** 2
+            if len(found) < k:
+                heapq.heappush(found, (-squared, index))
+            elif squared < -found[0][0]:
+                heapq.heapreplace(found, (-squared, index))
+            offset = point[axis] - points[index][axis]
+            near, far = (left, right) if offset < 0 else (right, left)
+            stack.append((far, offset * offset))
+            stack.append((near, 0.0))
+        return sorted((math.sqrt(-negated), index) for negated, index in found)
+
+
+class SupportCentreIndex:
+    """
+    Support centres held in this process, answering the nearest centres to a postcode without calling the
+    AD lookup service.
+
+    Centres are read from a snapshot in the AD lookup response format, with latitude and longitude, and postcodes
+    are placed by a table of postcode centroids. Postcodes not in the table are left to the AD lookup service,
+    and the centres it returns are added to the index, so that new and changed centres are picked up. Centres are
+    known by their locationID, so a centre that moves or is renamed replaces its old entry.
+    """
+    def __init__(self, centres, centroids):
+        self.centroids = centroids
+        self.centres = {}
+        for centre in centres:
+            self.centres[self.centre_key(centre)] = centre
+        # Counts changes to the centres, so that a rebuilt index is only swapped in if none have come since
+        self.version = 0
+        self.indexed, self.tree = self._build(list(self.centres.values()))
+
+    @staticmethod
+    def centre_key(centre):
+        location_id = centre.get('locationID')
+        if location_id not in (None, ''):
+            return location_id
+        return centre.get('locationName'), centre.get('postcode')
+
+    @staticmethod
+    def _build(centres):
+        """:return: (the centres with a location, a KDTree of their points)"""
+        indexed = [centre for centre in centres
+                   if centre.get('latitude') not in (None, '') and centre.get('longitude') not in (None, '')]
+        return indexed, KDTree([to_unit_vector(float(centre['latitude']), float(centre['longitude']))
+                                for centre in indexed])
+
+    def nearest(self, latitude, longitude, limit=10):
+        """The AD lookup response for the limit nearest centres to a point"""
+        nearest = self.tree.nearest(to_unit_vector(latitude, longitude), limit)
+        return {'centres': [dict(self.indexed[index], distanceInMiles=round(distance_in_miles(chord), 1))
+                            for chord, index in nearest]}
+
+    def nearest_to_postcode(self, postcode, limit=10):
+        """The AD lookup response for the centres nearest a postcode, or None when the postcode is not known"""
+        centroid = self.centroids.get(postcode)
+        if centroid is None or not self.indexed:
+            support_centre_lookups.inc('remote')
+            return None
+        support_centre_lookups.inc('local')
+        return self.nearest(*centroid, limit=limit)
+
+    async def update(self, ad_response):
+        """
+        Add the centres from a fresh AD lookup response, rebuilding the index if any are new or changed.
+        The index is rebuilt in an executor, and searches use the current one until the new one is swapped in.
+        """
+        changed = False
+        for centre in ad_response.get('centres', []):
+            centre = {name: value for name, value in centre.items() if name != 'distanceInMiles'}
+            key = self.centre_key(centre)
+            if self.centres.get(key) != centre:
+                self.centres[key] = centre
+                changed = True
+        if not changed:
+            return
+        self.version += 1
+        version = self.version
+        indexed, tree = await asyncio.get_event_loop().run_in_executor(None, self._build, list(self.centres.values()))
+        if version == self.version:
+            self.indexed, self.tree = indexed, tree
+            logger.info('support centre index updated', centres=len(indexed))
+
+
+def setup(app):
+    """
+    Load the support centre index from SUPPORT_CENTRES_FILE, a JSON AD lookup response listing every centre, and
+    POSTCODE_CENTROIDS_FILE, a CSV of postcode, latitude and longitude. Without both, every search is made
+    with the AD lookup service.
+    """
+    if not app['SUPPORT_CENTRES_FILE'] or not app['POSTCODE_CENTROIDS_FILE']:
+        return None
+    start = time.perf_counter()
+    with open(app['SUPPORT_CENTRES_FILE']) as centres_file:
+        centres = json_codec.loads(centres_file.read())['centres']
+    index = SupportCentreIndex(centres, PostcodeCentroids.load(app['POSTCODE_CENTROIDS_FILE']))
+    logger.info('support centre index loaded', centres=len(index.indexed), postcodes=len(index.centroids),
+                duration=round(time.perf_counter() - start, 3))
+    return index
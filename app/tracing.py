@@ -0,0 +1,266 @@
+import importlib
+import random
+import re
+import sys
+import time
+
+import aiohttp_jinja2
+import jinja2
+from aiohttp import web
+from structlog import get_logger
+
+from . import json_codec
+from .metrics import route_name
+
+logger = get_logger('respondent-home')
+
+# Request keys holding the innermost open span and the spans finished so far
+CURRENT_SPAN = 'tracing_span'
+FINISHED_SPANS = 'tracing_spans'
+
+TRACEPARENT = 'traceparent'
+CLOUD_TRACE_CONTEXT = 'X-Cloud-Trace-Context'
+
+traceparent_pattern = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+cloud_trace_pattern = re.compile(r'^([0-9a-fA-F]{32})(?:/(\d+))?')
+
+
+def new_trace_id():
+    return '%032x' % random.getrandbits(128)
+
+
+def new_span_id():
+    return '%016x' % random.getrandbits(64)
+
+
+class Span:
+    """
+    A timed operation within a trace, with the fields of an OpenTelemetry span.
+    """
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'attributes', 'error',
+                 'start_time', 'end_time', '_start_counter')
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.error = None
+        self.start_time = time.time()
+        self.end_time = None
+        self._start_counter = time.perf_counter()
+
+    def end(self):
+        # Wall clock time is only read once, so that the duration is not affected by clock adjustments
+        self.end_time = self.start_time + (time.perf_counter() - self._start_counter)
+
+    @property
+    def duration(self):
+        return self.end_time - self.start_time
+
+    def to_dict(self) -> dict:
+        """The span in the OTLP JSON encoding"""
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'startTimeUnixNano': int(self.start_time * 1e9),
+            'endTimeUnixNano': int(self.end_time * 1e9),
+            'attributes': [{'key': key, 'value': {'stringValue': str(value)}}
+                           for key, value in self.attributes.items()],
+            'status': {'code': 'STATUS_CODE_ERROR', 'message': self.error} if self.error
+            else {'code': 'STATUS_CODE_OK'},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+class NullExporter:
+    """Discards spans"""
+    def export(self, spans):
+        pass
+
+    def close(self):
+        pass
+
+
+class StreamExporter:
+    """
+    Writes each span as a line of JSON, for looking at traces without a collector.
+    Writes block the event loop, so this is meant for local and offline testing only.
+    """
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def export(self, spans):
+        self.stream.write(''.join(json_codec.dumps(span.to_dict()) + '\n' for span in spans))
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class FileExporter(StreamExporter):
+    def __init__(self, path):
+        super().__init__(open(path, 'a', encoding='utf-8'))
+
+    def close(self):
+        self.stream.close()
+
+
+exporter_factories = {
+    'null': lambda options: NullExporter(),
+    'stdout': lambda options: StreamExporter(),
+    'file': lambda options: FileExporter(options['TRACING_FILE']),
+}
+
+
+def make_exporter(name, options=None):
+    """
+    Build the named span exporter. A dotted path to a class may be given instead of a name, in which case the
+    class is called with the app config and must provide export(spans) and close().
+    """
+    options = options or {}
+    if name in exporter_factories:
+        return exporter_factories[name](options)
+    if '.' in name:
+        module_name, _, class_name = name.rpartition('.')
+        return getattr(importlib.import_module(module_name), class_name)(options)
+    raise ValueError(f'unknown span exporter {name}')
+
+
+def parse_trace_context(headers):
+    """
+    Return the trace id and parent span id sent with a request, from either a W3C traceparent header
+    or an X-Cloud-Trace-Context header. The span id is None when only the trace is known.
+    """
+    match = traceparent_pattern.match(headers.get(TRACEPARENT, ''))
+    if match:
+        return match.group(1), match.group(2)
+    match = cloud_trace_pattern.match(headers.get(CLOUD_TRACE_CONTEXT, ''))
+    if match:
+        span_id = match.group(2)
+        return match.group(1).lower(), '%016x' % (int(span_id) & 0xFFFFFFFFFFFFFFFF) if span_id else None
+    return new_trace_id(), None
+
+
+def inject(span, headers=None) -> dict:
+    """Return a copy of headers carrying the trace context of span, or headers itself when there is no span"""
+    if span is not None:
+        headers = dict(headers or {})
+        headers[TRACEPARENT] = f'00-{span.trace_id}-{span.span_id}-01'
+        headers[CLOUD_TRACE_CONTEXT] = f'{span.trace_id}/{int(span.span_id, 16)};o=1'
+    return headers
+
+
+class span:
+    """
+    Context manager timing a child of the request's current span.
+    Does nothing, and gives None, when the request is not being traced.
+    """
+    __slots__ = ('request', 'name', 'attributes', 'parent', 'span')
+
+    def __init__(self, request, name, **attributes):
+        self.request = request
+        self.name = name
+        self.attributes = attributes
+        self.parent = None
+        self.span = None
+
+    def __enter__(self):
+        self.parent = self.request.get(CURRENT_SPAN) if self.request is not None else None
+        if self.parent is not None:
+            self.span = Span(self.name, self.parent.trace_id, self.parent.span_id, self.attributes)
+            self.request[CURRENT_SPAN] = self.span
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.span is not None:
+            self.span.end()
+            if exc_type is not None and not issubclass(exc_type, web.HTTPException):
+                self.span.error = exc_type.__name__
+            self.request[CURRENT_SPAN] = self.parent
+            self.request[FINISHED_SPANS].append(self.span)
+        return False
+
+
+@web.middleware
+async def tracing_middleware(request, handler):
+    trace_id, parent_id = parse_trace_context(request.headers)
+    root = Span(f'{request.method} {request.path}', trace_id, parent_id,
+                {'http.method': request.method, 'http.target': request.path_qs})
+    request[CURRENT_SPAN] = root
+    request[FINISHED_SPANS] = []
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as ex:
+        status = ex.status
+        raise
+    finally:
+        root.end()
+        route = route_name(request)
+        root.name = f'{request.method} {route}'
+        root.attributes['http.route'] = route
+        root.attributes['http.status_code'] = status
+        if status >= 500:
+            root.error = str(status)
+        request[FINISHED_SPANS].append(root)
+        try:
+            request.app['tracing_exporter'].export(request[FINISHED_SPANS])
+        except Exception:
+            logger.exception('failed to export spans', trace=trace_id)
+
+
+def traced_middleware(name, middleware):
+    """Wrap a middleware so that the time spent in it and everything it calls is recorded as a span"""
+    span_name = 'middleware ' + name
+
+    @web.middleware
+    async def middleware_handler(request, handler):
+        with span(request, span_name):
+            return await middleware(request, handler)
+
+    return middleware_handler
+
+
+@web.middleware
+async def handler_middleware(request, handler):
+    with span(request, 'handler ' + route_name(request)):
+        return await handler(request)
+
+
+class TracedTemplate(jinja2.Template):
+    """Template recording a span for each render, when the request is in the template context"""
+    def render(self, *args, **kwargs):
+        context = args[0] if args else kwargs
+        with span(context.get('request'), 'render ' + self.name):
+            return super().render(*args, **kwargs)
+
+
+def trace_middlewares(middlewares):
+    """
+    Wrap the named middlewares so that each records a span, behind the middleware that starts the request span.
+
+    :param middlewares: (name, middleware) pairs, outermost first
+    """
+    return [tracing_middleware] + [traced_middleware(name, middleware) for name, middleware in middlewares]
+
+
+def setup(app):
+    """
+    Export spans using the exporter named by TRACING_EXPORTER, and record spans for handlers and template
+    rendering. Call once the other middlewares and the jinja2 environment have been set up.
+    """
+    app['tracing_exporter'] = make_exporter(app['TRACING_EXPORTER'], app)
+    app.middlewares.append(handler_middleware)
+    aiohttp_jinja2.get_env(app).template_class = TracedTemplate
+
+    async def close_exporter(app):
+        app['tracing_exporter'].close()
+
+    app.on_cleanup.append(close_exporter)
@@ -1,34 +1,33 @@
-import string
-import re
+import asyncio
 import math
 
+from functools import lru_cache, partial
+
 from aiohttp.client_exceptions import (ClientResponseError)
+from aioredis import RedisError
 from .exceptions import InactiveCaseError, InvalidEqPayLoad, InvalidDataError, InvalidDataErrorWelsh, \
     TooManyRequestsEQLaunch
 from aiohttp.web import HTTPFound
 from datetime import datetime, date
 from pytz import timezone, utc
-from unicodedata import normalize
 
 from sdc.crypto.encrypter import encrypt
+from . import normalise
 from .eq import EqPayloadConstructor
 from .flash import flash
+from .idempotency import idempotency_key
 from .request import RetryRequest
+from .streaming import read_postcode_response
 from structlog import get_logger
 
 logger = get_logger('respondent-home')
 
-OBSCURE_WHITESPACE = (
-    '\u180E'  # Mongolian vowel separator
-    '\u200B'  # zero width space
-    '\u200C'  # zero width non-joiner
-    '\u200D'  # zero width joiner
-    '\u2060'  # word joiner
-    '\uFEFF'  # zero width non-breaking space
-)
 
-uk_prefix = '44'
-uk_zone = timezone('Europe/London')
+@lru_cache(maxsize=None)
+def uk_zone():
+    """Looked up on first use, as pytz checks every zone file it has the first time a zone is asked for"""
+    return timezone('Europe/London')
+
 
 census_day = date(2021, 3, 21)
 
@@ -50,21 +49,11 @@ class View:
     def single_client_ip(request):
         if request['client_ip']:
             client_ip = request['client_ip']
-            single_ip_validation_pattern = re.compile(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$')
-            if client_ip.count(',') > 1:
-                single_ip_value = client_ip.split(', ', -1)[-3]
-                if single_ip_validation_pattern.fullmatch(single_ip_value):
-                    single_ip = single_ip_value
-                else:
-                    logger.warn('clientIP failed validation. Provided IP - ' + client_ip,
-                                client_id=request['client_id'],
-                                trace=request['trace'])
-                    single_ip = ''
-            else:
+            single_ip = normalise.client_ip(client_ip)
+            if not single_ip:
                 logger.warn('clientIP failed validation. Provided IP - ' + client_ip,
                             client_id=request['client_id'],
                             trace=request['trace'])
-                single_ip = ''
         elif request.headers.get('Origin', None) and 'localhost' in request.headers.get('Origin', None):
             single_ip = '127.0.0.1'
         else:
@@ -102,7 +91,7 @@ class View:
 
     @staticmethod
     def check_if_after_census_day():
-        wall_clock = utc.localize(View.get_now_utc()).astimezone(uk_zone)
+        wall_clock = utc.localize(View.get_now_utc()).astimezone(uk_zone())
         now_date = wall_clock.date()
         if now_date > census_day:
             after_census_day = True
@@ -149,7 +138,8 @@ class View:
                             auth=None,
                             headers=None,
                             request_json=None,
-                            return_json=False):
+                            return_json=False,
+                            response_parser=None):
         """
         :param request: The AIOHTTP user request, used for logging and app access
         :param method: The HTTP verb
@@ -158,8 +148,9 @@ class View:
         :param headers: Any needed headers as a python dictionary
         :param request_json: JSON payload to pass as request data
         :param return_json: If True, the response JSON will be returned
+        :param response_parser: Optional coroutine function used in place of the full JSON decode of the response
         """
-        retry_request = RetryRequest(request, method, url, auth, headers, request_json, return_json)
+        retry_request = RetryRequest(request, method, url, auth, headers, request_json, return_json, response_parser)
         return await retry_request.make_request()
 
     @staticmethod
@@ -174,17 +165,28 @@ class View:
         eq_payload = await EqPayloadConstructor(case, attributes, app,
                                                 adlocation).build()
 
-        token = encrypt(eq_payload,
-                        key_store=app['key_store'],
-                        key_purpose='authentication')
-
+        # The token does not depend on RHSvc, so it is built while surveyLaunched is being posted.
+        # When either fails the other is stopped, so that surveyLaunched is not posted for a launch without a token.
+        encrypting = asyncio.ensure_future(app['token_encrypter'].encrypt(encrypt, eq_payload))
+        posting = asyncio.ensure_future(RHService.post_surveylaunched(request, case, adlocation))
         try:
-            await RHService.post_surveylaunched(request, case, adlocation)
+            await asyncio.wait((encrypting, posting), return_when=asyncio.FIRST_EXCEPTION)
+            if encrypting.done():
+                encrypting.result()
+            await posting
+            token = await encrypting
         except ClientResponseError as ex:
             if ex.status == 429:
                 raise TooManyRequestsEQLaunch()
             else:
                 raise ex
+        finally:
+            for task in (encrypting, posting):
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # Retrieved, as only the first error is raised
+                    task.exception()
 
         logger.info('redirecting to eq',
                     client_ip=request['client_ip'], client_id=request['client_id'], trace=request['trace'])
@@ -193,52 +195,26 @@ class View:
 
 
 class ProcessPostcode:
-    postcode_validation_pattern = re.compile(
-        r'^((AB|AL|B|BA|BB|BD|BH|BL|BN|BR|BS|BT|BX|CA|CB|CF|CH|CM|CO|CR|CT|CV|CW|DA|DD|DE|DG|DH|DL|DN|DT|DY|E|EC|EH|EN|EX|FK|FY|G|GL|GY|GU|HA|HD|HG|HP|HR|HS|HU|HX|IG|IM|IP|IV|JE|KA|KT|KW|KY|L|LA|LD|LE|LL|LN|LS|LU|M|ME|MK|ML|N|NE|NG|NN|NP|NR|NW|OL|OX|PA|PE|PH|PL|PO|PR|RG|RH|RM|S|SA|SE|SG|SK|SL|SM|SN|SO|SP|SR|SS|ST|SW|SY|TA|TD|TF|TN|TQ|TR|TS|TW|UB|W|WA|WC|WD|WF|WN|WR|WS|WV|YO|ZE)(\d[\dA-Z]?[ ]?\d[ABD-HJLN-UW-Z]{2}))$'  # NOQA
-    )
+    postcode_validation_pattern = normalise.postcode_pattern
 
     @staticmethod
     def validate_postcode(postcode, locale):
 
-        for character in string.whitespace + OBSCURE_WHITESPACE:
-            postcode = postcode.replace(character, '')
+        postcode, error = normalise.check_postcode(postcode)
 
-        postcode = postcode.upper()
-        postcode = normalize('NFKD', postcode).encode('ascii', 'ignore').decode('utf8')
-
-        if len(postcode) == 0:
+        if error == normalise.EMPTY:
             if locale == 'cy':
                 raise InvalidDataErrorWelsh("Rhowch god post", 'empty')
             else:
                 raise InvalidDataError('Enter a postcode', 'empty')
 
-        if not postcode.isalnum():
-            if locale == 'cy':
-                raise InvalidDataErrorWelsh("Rhowch god post dilys yn y Deyrnas Unedig")
-            else:
-                raise InvalidDataError('Enter a valid UK postcode')
-
-        if len(postcode) < 5:
-            if locale == 'cy':
-                raise InvalidDataErrorWelsh("Rhowch god post dilys yn y Deyrnas Unedig")
-            else:
-                raise InvalidDataError('Enter a valid UK postcode')
-
-        if len(postcode) > 7:
-            if locale == 'cy':
-                raise InvalidDataErrorWelsh("Rhowch god post dilys yn y Deyrnas Unedig")
-            else:
-                raise InvalidDataError('Enter a valid UK postcode')
-
-        if not ProcessPostcode.postcode_validation_pattern.fullmatch(postcode):
+        if error:
             if locale == 'cy':
                 raise InvalidDataErrorWelsh("Rhowch god post dilys yn y Deyrnas Unedig")
             else:
                 raise InvalidDataError('Enter a valid UK postcode')
 
-        postcode_formatted = postcode[:-3] + ' ' + postcode[-3:]
-
-        return postcode_formatted
+        return postcode
 
 
 class ProcessMobileNumber:
@@ -246,12 +222,9 @@ class ProcessMobileNumber:
     @staticmethod
     def normalise_phone_number(number, locale):
 
-        for character in string.whitespace + OBSCURE_WHITESPACE + '()-+':
-            number = number.replace(character, '')
+        number = normalise.phone_number(number)
 
-        try:
-            list(map(int, number))
-        except ValueError:
+        if not normalise.is_digits(number):
             if locale == 'cy':
                 raise InvalidDataErrorWelsh("Rhowch rif ffôn symudol yn y Deyrnas Unedig mewn fformat dilys, "
                                             "er enghraifft, 07700 900345 neu +44 7700 900345", message_type='invalid')
@@ -264,23 +237,15 @@ class ProcessMobileNumber:
     @staticmethod
     def validate_uk_mobile_phone_number(number, locale):
 
-        number = ProcessMobileNumber.normalise_phone_number(number, locale).lstrip(uk_prefix).lstrip('0')
+        number, error = normalise.check_uk_mobile_number(number)
 
-        if len(number) == 0:
+        if error == normalise.EMPTY:
             if locale == 'cy':
                 raise InvalidDataErrorWelsh("Rhowch eich rhif ffôn symudol", message_type='empty')
             else:
                 raise InvalidDataError('Enter your mobile number', message_type='empty')
 
-        if not number.startswith('7'):
-            if locale == 'cy':
-                raise InvalidDataErrorWelsh("Rhowch rif ffôn symudol yn y Deyrnas Unedig mewn fformat dilys, "
-                                            "er enghraifft, 07700 900345 neu +44 7700 900345", message_type='invalid')
-            else:
-                raise InvalidDataError('Enter a UK mobile number in a valid format, for example, '
-                                       '07700 900345 or +44 7700 900345', message_type='invalid')
-
-        if len(number) > 10:
+        if error:
             if locale == 'cy':
                 raise InvalidDataErrorWelsh("Rhowch rif ffôn symudol yn y Deyrnas Unedig mewn fformat dilys, "
                                             "er enghraifft, 07700 900345 neu +44 7700 900345", message_type='invalid')
@@ -288,15 +253,7 @@ class ProcessMobileNumber:
                 raise InvalidDataError('Enter a UK mobile number in a valid format, for example, '
                                        '07700 900345 or +44 7700 900345', message_type='invalid')
 
-        if len(number) < 10:
-            if locale == 'cy':
-                raise InvalidDataErrorWelsh("Rhowch rif ffôn symudol yn y Deyrnas Unedig mewn fformat dilys, "
-                                            "er enghraifft, 07700 900345 neu +44 7700 900345", message_type='invalid')
-            else:
-                raise InvalidDataError('Enter a UK mobile number in a valid format, for example, '
-                                       '07700 900345 or +44 7700 900345', message_type='invalid')
-
-        return '{}{}'.format(uk_prefix, number)
+        return number
 
 
 class ProcessName:
@@ -308,7 +265,7 @@ class ProcessName:
         form_first_name = data.get('name_first_name')
         form_last_name = data.get('name_last_name')
 
-        if (not form_first_name) or (len(form_first_name.strip()) == 0):
+        if not normalise.name(form_first_name):
             if display_region == 'cy':
                 flash(request, {'text': "Rhowch eich enw cyntaf", 'level': 'ERROR', 'type': 'NAME_ENTER_ERROR',
                                 'field': 'error_first_name', 'value_first_name': form_first_name,
@@ -330,7 +287,7 @@ class ProcessName:
                                 'value_first_name': form_first_name, 'value_last_name': form_last_name})
             name_valid = False
 
-        if (not form_last_name) or (len(form_last_name.strip()) == 0):
+        if not normalise.name(form_last_name):
             if display_region == 'cy':
                 flash(request, {'text': "Rhowch eich cyfenw", 'level': 'ERROR', 'type': 'NAME_ENTER_ERROR',
                                 'field': 'error_last_name', 'value_first_name': form_first_name,
@@ -533,12 +490,18 @@ class AddressIndex(View):
     async def get_ai_postcode(request, postcode):
         ai_svc_url = request.app['ADDRESS_INDEX_SVC_URL']
         ai_epoch = request.app['ADDRESS_INDEX_EPOCH']
-        url = f'{ai_svc_url}/addresses/rh/postcode/{postcode}?limit=5000&epoch={ai_epoch}'
-        return await View._make_request(request,
-                                        'GET',
-                                        url,
-                                        auth=request.app['ADDRESS_INDEX_SVC_AUTH'],
-                                        return_json=True)
+        ai_limit = int(request.app['ADDRESS_INDEX_SVC_POSTCODE_LIMIT'])
+        snapshot = request.app.get('address_snapshot')
+        if snapshot is not None:
+            postcode_return = snapshot.postcode(postcode, ai_limit)
+            if postcode_return is not None:
+                return postcode_return
+        url = f'{ai_svc_url}/addresses/rh/postcode/{postcode}?limit={ai_limit}&epoch={ai_epoch}'
+        return await request.app['postcode_cache'].fetch(request, f'{ai_epoch}:{ai_limit}:{postcode}', partial(
+            View._make_request, method='GET', url=url,
+            auth=request.app['ADDRESS_INDEX_SVC_AUTH'],
+            return_json=True,
+            response_parser=partial(read_postcode_response, limit=ai_limit)))
 
     @staticmethod
     async def get_ai_uprn(request, uprn):
@@ -554,6 +517,40 @@ class AddressIndex(View):
 
 class RHService(View):
 
+    @staticmethod
+    async def _submit(request, kind, path, request_json, identity, return_json=False):
+        """
+        POST a submission to RHSvc through the outbox when there is one, so that it is sent in the background and
+        retried until RHSvc accepts it. Otherwise, or when it cannot be queued, it is sent directly.
+
+        Submissions are identified by the respondent's session and the values in identity, and a repeat of a recent
+        submission is answered with the first one's outcome rather than being sent again.
+
+        :param kind: What is being submitted, for metrics and logs
+        :param path: The path under RHSVC_URL
+        :param identity: The values that make this submission the same as another, for the idempotency key
+        :param return_json: If True, the response JSON will be returned, and the submission is always sent directly
+        """
+        key = idempotency_key(kind, request['client_id'], *identity)
+        outbox = request.app.get('outbox')
+        if outbox is not None and not return_json:
+            try:
+                await outbox.enqueue(request, kind, 'POST', path, request_json, key)
+                return None
+            except (RedisError, OSError) as ex:
+                logger.error('failed to queue submission, sending directly',
+                             kind=kind,
+                             error=type(ex).__name__,
+                             client_ip=request['client_ip'],
+                             client_id=request['client_id'],
+                             trace=request['trace'])
+        return await request.app['submissions'].run(request, kind, key, partial(
+            View._make_request, request, 'POST', request.app['RHSVC_URL'] + path,
+            auth=request.app['RHSVC_AUTH'],
+            headers={'Idempotency-Key': key},
+            request_json=request_json,
+            return_json=return_json))
+
     @staticmethod
     async def get_case_by_uprn(request, uprn):
         rhsvc_url = request.app['RHSVC_URL']
@@ -599,14 +596,12 @@ class RHService(View):
         rhsvc_url = request.app['RHSVC_URL']
         url = f'{rhsvc_url}/fulfilments?caseType={case_type}&region={region}&deliveryChannel={delivery_channel}' \
               f'&productGroup={product_group}&individual={individual}'
-        return await View._make_request(request,
-                                        'GET',
-                                        url,
-                                        return_json=True)
+        key = f'{case_type}:{region}:{delivery_channel}:{product_group}:{individual}'
+        return await request.app['fulfilment_cache'].fetch(request, key, partial(
+            View._make_request, method='GET', url=url, return_json=True))
 
     @staticmethod
     async def request_fulfilment_sms(request, case_id, tel_no, fulfilment_code_array):
-        rhsvc_url = request.app['RHSVC_URL']
         fulfilment_json = {
             'caseId': case_id,
             'telNo': tel_no,
@@ -614,16 +609,11 @@ class RHService(View):
             'dateTime': datetime.now(utc).isoformat(),
             'clientIP': View.single_client_ip(request)
         }
-        url = f'{rhsvc_url}/cases/{case_id}/fulfilments/sms'
-        return await View._make_request(request,
-                                        'POST',
-                                        url,
-                                        auth=request.app['RHSVC_AUTH'],
-                                        request_json=fulfilment_json)
+        return await RHService._submit(request, 'fulfilment_sms', f'/cases/{case_id}/fulfilments/sms', fulfilment_json,
+                                       (case_id, tel_no, fulfilment_code_array))
 
     @staticmethod
     async def request_fulfilment_post(request, case_id, first_name, last_name, fulfilment_code_array, title=None):
-        rhsvc_url = request.app['RHSVC_URL']
         fulfilment_json = {
             'caseId': case_id,
             'title': title,
@@ -633,12 +623,9 @@ class RHService(View):
             'dateTime': datetime.now(utc).isoformat(),
             'clientIP': View.single_client_ip(request)
         }
-        url = f'{rhsvc_url}/cases/{case_id}/fulfilments/post'
-        return await View._make_request(request,
-                                        'POST',
-                                        url,
-                                        auth=request.app['RHSVC_AUTH'],
-                                        request_json=fulfilment_json)
+        return await RHService._submit(request, 'fulfilment_post', f'/cases/{case_id}/fulfilments/post',
+                                       fulfilment_json,
+                                       (case_id, title, first_name, last_name, fulfilment_code_array))
 
     @staticmethod
     async def get_uac_details(request):
@@ -657,8 +644,6 @@ class RHService(View):
 
     @staticmethod
     async def post_case_create(request, address):
-        rhsvc_url = request.app['RHSVC_URL']
-        rhsvc_auth = request.app['RHSVC_AUTH']
         case_json = {
             'uprn': address['uprn'],
             'addressLine1': address['addressLine1'],
@@ -670,12 +655,8 @@ class RHService(View):
             'estabType': address['censusEstabType'],
             'addressType': address['censusAddressType']
         }
-        return await View._make_request(request,
-                                        'POST',
-                                        f'{rhsvc_url}/cases/create',
-                                        auth=rhsvc_auth,
-                                        request_json=case_json,
-                                        return_json=True)
+        return await RHService._submit(request, 'case_create', '/cases/create', case_json, (case_json,),
+                                       return_json=True)
 
     @staticmethod
     async def post_surveylaunched(request, case, adlocation):
@@ -705,25 +686,41 @@ class RHService(View):
             'email': form_data['email'],
             'clientIP': View.single_client_ip(request)
         }
-        rhsvc_url = request.app['RHSVC_URL']
-        return await View._make_request(request,
-                                        'POST',
-                                        f'{rhsvc_url}/webform',
-                                        auth=request.app['RHSVC_AUTH'],
-                                        request_json=form_json)
+        return await RHService._submit(request, 'webform', '/webform', form_json,
+                                       ({k: v for k, v in form_json.items() if k != 'clientIP'},))
 
 
 class ADLookUp(View):
 
     @staticmethod
     async def get_ad_lookup_by_postcode(request, postcode):
+        index = request.app.get('support_centre_index')
+        if index is not None:
+            ad_response = index.nearest_to_postcode(postcode)
+            if ad_response is not None:
+                return ad_response
+        return await ADLookUp._get_ad_lookup_by_postcode(request, postcode)
+
+    @staticmethod
+    async def _get_ad_lookup_by_postcode(request, postcode):
         ai_svc_url = request.app['AD_LOOK_UP_SVC_URL']
         url = f'{ai_svc_url}/centres/postcode?postcode={postcode}&limit=10'
         headers = {'x-api-key': request.app['AD_LOOK_UP_SVC_APIKEY'],
                    'x-app-id': request.app['AD_LOOK_UP_SVC_APPID']}
-        return await View._make_request(request,
-                                        'GET',
-                                        url,
-                                        auth=request.app['AD_LOOK_UP_SVC_AUTH'],
-                                        headers=headers,
-                                        return_json=True)
+        return await request.app['ad_lookup_cache'].fetch(request, postcode, partial(
+            ADLookUp._look_up_centres, url=url, headers=headers))
+
+    @staticmethod
+    async def _look_up_centres(request, url, headers):
+        """
+        Call the AD lookup service, adding the centres to the support centre index. Responses from the lookup
+        cache are not added, as they may be older than what the index holds.
+        """
+        ad_response = await View._make_request(request, 'GET', url,
+                                               auth=request.app['AD_LOOK_UP_SVC_AUTH'],
+                                               headers=headers,
+                                               return_json=True)
+        index = request.app.get('support_centre_index')
+        if index is not None:
+            await index.update(ad_response)
+        return ad_response
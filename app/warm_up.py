@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+from structlog import get_logger
+
+from . import json_codec, metrics, normalise
+from .rate_limit import parse_limit
+from .request import BackgroundRequest
+from .utils import AddressIndex, RHService
+
+logger = get_logger('respondent-home')
+
+warm_up_lookups = metrics.registry.counter(
+    'warm_up_lookups_total', 'Lookups made to warm the caches, by lookup and outcome.', ('lookup', 'outcome'))
+
+
+class Pacer:
+    """Spaces calls evenly, so that there are at most count in any period of seconds"""
+    def __init__(self, count, seconds, clock=time.monotonic):
+        self.interval = seconds / count
+        self.clock = clock
+        self.next = 0.0
+
+    async def wait(self):
+        now = self.clock()
+        if self.next > now:
+            await asyncio.sleep(self.next - now)
+            now = self.next
+        self.next = now + self.interval
+
+
+def read_hot_keys(path):
+    """
+    Read the lookups to warm from a JSON file such as
+    {"postcodes": ["EX2 6GA"],
+     "fulfilments": [{"case_type": "HH", "region": "E", "delivery_channel": "SMS", "product_group": "UAC",
+                      "individual": false}]}
+    listing the busiest first. Invalid and repeated postcodes are left out.
+
+    :return: (postcodes, fulfilments), the fulfilments as tuples of get_fulfilment's arguments
+    """
+    with open(path) as hot_keys_file:
+        hot_keys = json_codec.loads(hot_keys_file.read())
+    postcodes, errors = normalise.check_postcodes(hot_keys.get('postcodes', []))
+    postcodes = list(dict.fromkeys(postcode for postcode, error in zip(postcodes, errors) if not error))
+    fulfilments = [(fulfilment['case_type'], fulfilment['region'], fulfilment['delivery_channel'],
+                    fulfilment['product_group'], str(fulfilment.get('individual', False)).lower())
+                   for fulfilment in hot_keys.get('fulfilments', [])]
+    return postcodes, fulfilments
+
+
+class WarmUp:
+    """
+    Fills the AIMS postcode and fulfilment caches with the busiest lookups before respondents ask for them,
+    so that a newly started instance does not send a burst of lookups upstream at once.
+
+    The lookups are made through the same calls as the handlers, so lookups already cached are not made again,
+    and are paced so that AIMS and RHSvc see no more than rate lookups. They are read from path on every run,
+    so the file can be changed between runs. With an interval, the caches are warmed again every interval seconds.
+    """
+    def __init__(self, app, path, rate=(5, 1.0), interval=0):
+        self.app = app
+        self.path = path
+        self.rate = rate
+        self.interval = interval
+        self._runner = None
+
+    async def lookup(self, name, pacer, call, *args):
+        await pacer.wait()
+        try:
+            await call(BackgroundRequest(self.app), *args)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            warm_up_lookups.inc(name, 'error')
+            logger.warn('cache warm-up lookup failed', lookup=name, error=type(ex).__name__)
+            return False
+        warm_up_lookups.inc(name, 'ok')
+        return True
+
+    async def run(self):
+        """Warm the caches once, returning the number of lookups that succeeded"""
+        try:
+            postcodes, fulfilments = read_hot_keys(self.path)
+        except (OSError, ValueError, KeyError, TypeError) as ex:
+            logger.error('could not read cache warm-up keys', path=self.path, error=type(ex).__name__)
+            return 0
+        start = time.perf_counter()
+        pacer = Pacer(*self.rate)
+        warmed = 0
+        if self.app['postcode_cache'].ttl:
+            for postcode in postcodes:
+                warmed += await self.lookup('aims_postcode', pacer, AddressIndex.get_ai_postcode, postcode)
+        if self.app['fulfilment_cache'].ttl:
+            for fulfilment in fulfilments:
+                warmed += await self.lookup('fulfilments', pacer, RHService.get_fulfilment, *fulfilment)
+        logger.info('cache warm-up complete', lookups=len(postcodes) + len(fulfilments), warmed=warmed,
+                    duration=round(time.perf_counter() - start, 3))
+        return warmed
+
+    async def _run(self):
+        while True:
+            await self.run()
+            if not self.interval:
+                return
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._runner is None:
+            self._runner = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+
+
+def setup(app):
+    """
+    Warm the caches in the background from the hot keys in WARM_UP_FILE, at no more than WARM_UP_RATE lookups,
+    such as '5/1' for five a second, starting once the app has started and every WARM_UP_INTERVAL seconds after
+    when it is not 0. There is no warm-up without a file.
+    """
+    if not app['WARM_UP_FILE']:
+        return None
+
+    warm_up = WarmUp(app, app['WARM_UP_FILE'],
+                     rate=parse_limit(app['WARM_UP_RATE']) or (5, 1.0),
+                     interval=float(app['WARM_UP_INTERVAL']))
+
+    async def start_warm_up(app):
+        warm_up.start()
+
+    async def stop_warm_up(app):
+        await warm_up.stop()
+
+    app.on_startup.append(start_warm_up)
+    app.on_shutdown.append(stop_warm_up)
+    return warm_up
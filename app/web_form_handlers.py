@@ -1,5 +1,4 @@
 import aiohttp_jinja2
-import re
 
 from aiohttp.client_exceptions import (ClientResponseError)
 from aiohttp.web import HTTPFound, RouteTableDef
@@ -19,6 +18,7 @@ from . import (WEBFORM_MISSING_COUNTRY_MSG,
                WEBFORM_MISSING_EMAIL_EMPTY_MSG_CY,
                WEBFORM_MISSING_EMAIL_INVALID_MSG_CY
                )
+from . import normalise
 from .flash import flash
 from .utils import View, RHService
 
@@ -59,10 +59,6 @@ class WebForm(View):
 
         data = await request.post()
 
-        email_validation_pattern = re.compile(
-            r'(^[^@\s]+@[^@\s]+\.[^@\s]+$)'
-        )
-
         form_valid = True
 
         if not (data.get('country')):
@@ -86,7 +82,7 @@ class WebForm(View):
                 flash(request, WEBFORM_MISSING_DESCRIPTION_MSG)
             form_valid = False
 
-        if (not data.get('name')) or (len(data.get('name').strip()) == 0):
+        if not normalise.name(data.get('name')):
             if display_region == 'cy':
                 flash(request, WEBFORM_MISSING_NAME_MSG_CY)
             else:
@@ -100,7 +96,7 @@ class WebForm(View):
                 flash(request, WEBFORM_MISSING_EMAIL_EMPTY_MSG)
             form_valid = False
 
-        elif not email_validation_pattern.fullmatch(str(data.get('email'))):
+        elif not normalise.email_pattern.fullmatch(str(data.get('email'))):
             if display_region == 'cy':
                 flash(request, WEBFORM_MISSING_EMAIL_INVALID_MSG_CY)
             else:
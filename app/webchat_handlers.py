@@ -4,10 +4,10 @@ from aiohttp.web import HTTPFound, RouteTableDef
 
 from datetime import datetime, date
 from structlog import get_logger
-from pytz import timezone, utc
+from pytz import utc
 
 from .flash import flash
-from .utils import View
+from .utils import View, uk_zone
 
 logger = get_logger('respondent-home')
 webchat_routes = RouteTableDef()
@@ -34,8 +34,6 @@ saturday_close = 13
 weekday_open = 8
 weekday_close = 20
 
-uk_zone = timezone('Europe/London')
-
 
 class WebChat(View):
     @staticmethod
@@ -44,7 +42,7 @@ class WebChat(View):
 
     @staticmethod
     def todays_opening_hours() -> (int, int, int):
-        wall_clock = utc.localize(WebChat.get_now_utc()).astimezone(uk_zone)
+        wall_clock = utc.localize(WebChat.get_now_utc()).astimezone(uk_zone())
         now_date = wall_clock.date()
         weekday = wall_clock.weekday()
         hour = wall_clock.hour
@@ -0,0 +1,150 @@
+import asyncio
+import math
+import os
+import signal
+import socket
+import sys
+import time
+
+from aiohttp import web
+from structlog import get_logger
+
+from . import event_loop, jwt, metrics
+from .app import compile_templates, create_app, load_config
+from .app_logging import logger_initial_config, parse_sample_rates
+
+logger = get_logger('respondent-home')
+
+# A worker that stops sooner than this after starting is not started again straight away
+restart_delay = 1.0
+# Exit status of a worker that could not create the app, which starting another worker would not fix
+boot_error_status = 3
+
+
+def preload(app_config):
+    """
+    Load what every worker would otherwise load for itself, before the workers are forked, so that it is done
+    once and its memory is shared copy-on-write. Translations are loaded when the app is imported.
+    """
+    start = time.perf_counter()
+    templates = compile_templates()
+    jwt.preloaded_key_stores[app_config['JSON_SECRET_KEYS']] = jwt.key_store(app_config['JSON_SECRET_KEYS'])
+    logger.info('preloaded app for workers', templates=templates, duration=round(time.perf_counter() - start, 3))
+
+
+def worker_pool_sizes(app_config, workers):
+    """The Redis pool sizes for each worker, sharing the configured sizes between them"""
+    return {'REDIS_POOL_MIN': str(math.ceil(int(app_config['REDIS_POOL_MIN']) / workers)),
+            'REDIS_POOL_MAX': str(math.ceil(int(app_config['REDIS_POOL_MAX']) / workers))}
+
+
+def reuse_port_socket(host, port):
+    """A listening socket that other processes can bind to the same port, with the kernel sharing out connections"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    return sock
+
+
+def serve_worker(config_name, app_config, workers):
+    """Run in a forked worker: create the app with its share of the pools and serve it until stopped"""
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # The event loop, if any, belongs to the process this one was forked from
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    try:
+        sock = reuse_port_socket(app_config['HOST'], int(app_config['PORT']))
+        app = create_app(config_name, overrides=worker_pool_sizes(app_config, workers))
+    except Exception:
+        logger.exception('worker could not start')
+        os._exit(boot_error_status)
+    web.run_app(app, sock=sock, print=None)
+
+
+class Workers:
+    """
+    Forks workers that each serve the app on their own SO_REUSEPORT socket, bound to the same port, so that the
+    kernel shares connections out between them. Workers that stop are started again, until the launcher is
+    told to stop with SIGINT or SIGTERM, which is passed on to every worker, or a worker cannot start.
+    """
+    def __init__(self, config_name, app_config, workers):
+        self.config_name = config_name
+        self.app_config = app_config
+        self.workers = workers
+        self.children = {}
+        self.stopping = False
+        self.status = 0
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                serve_worker(self.config_name, self.app_config, self.workers)
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                logger.exception('worker failed')
+                status = 1
+            finally:
+                os._exit(status)
+        self.children[pid] = time.monotonic()
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> int:
+        """:return: The exit status for the launcher once every worker has stopped"""
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        for _ in range(self.workers):
+            self.spawn()
+        logger.info('workers started', workers=self.workers, port=self.app_config['PORT'])
+        while self.children:
+            pid, status = os.wait()
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            if os.WIFEXITED(status) and os.WEXITSTATUS(status) == boot_error_status:
+                logger.error('worker could not start, stopping the other workers', pid=pid)
+                self.status = 1
+                self.stop(None, None)
+                continue
+            logger.warn('worker stopped, starting another', pid=pid, status=status)
+            if time.monotonic() - started < restart_delay:
+                time.sleep(restart_delay)
+            self.spawn()
+        return self.status
+
+
+def run(config_name=None):
+    """
+    Serve the app on the event loop chosen by EVENT_LOOP. With WORKERS above 1, the app is preloaded and that many
+    workers are forked to serve it, each with its share of the Redis pool. Otherwise it is served from this process
+    as it always was.
+    """
+    app_config = load_config(config_name)
+    # Without the log queue, whose thread would not survive a fork. Each worker starts its own when it creates the app.
+    logger_initial_config(log_level=app_config['LOG_LEVEL'],
+                          ext_log_level=app_config['EXT_LOG_LEVEL'],
+                          sample_rates=parse_sample_rates(app_config['LOG_SAMPLE_RATES']),
+                          rate_limit=float(app_config['LOG_RATE_LIMIT']),
+                          rate_burst=float(app_config['LOG_RATE_BURST']),
+                          dropped_report_interval=float(app_config['LOG_DROPPED_REPORT_INTERVAL']))
+    event_loop.install(app_config['EVENT_LOOP'])
+    # Metrics left by the workers of an earlier run would be reported with those of this one
+    if app_config['METRICS_DIR']:
+        metrics.clear_worker_metrics(app_config['METRICS_DIR'])
+    workers = int(app_config['WORKERS'])
+    if workers <= 1:
+        app = create_app(config_name)
+        web.run_app(app, port=app['PORT'])
+        return
+    preload(app_config)
+    sys.exit(Workers(config_name, app_config, workers).run())
@@ -34,7 +34,7 @@ def server(ctx, port=None, reload=True, debug=False, production=True):
 
     command = (
         'gunicorn "app.app:create_app()" -w 4 '
-        f'--bind 0.0.0.0:{port} --worker-class aiohttp.worker.GunicornWebWorker '
+        f'--bind 0.0.0.0:{port} --worker-class app.gunicorn_worker.WebWorker '
         f'--access-logfile - --log-level {log_level}')
 
     if reload:
@@ -104,6 +104,21 @@ def demo(ctx):
     run_command('python -m tests.demo')
 
 
+@task
+def benchmark(ctx, name=''):
+    """Run the benchmarks, or a single named benchmark"""
+    run_command(f'python -m tests.benchmarks {name}', echo=True)
+
+
+@task
+def address_snapshot(ctx, export, output, epoch):
+    """Build an address snapshot from a CSV export of an AIMS epoch"""
+    from app.address_snapshot import build, read_export
+
+    count = build(read_export(export), output, epoch)
+    print(f'{output}: {count} postcodes from epoch {epoch}')
+
+
 @task
 def wait(ctx):
     from tests.wait_for_services import check_all_services
@@ -0,0 +1,30 @@
+import time
+
+
+def measure(func, number=10000, repeat=5):
+    """
+    Time a callable, returning the best mean duration of a single call in microseconds.
+    The best of several runs is used as it is the least affected by other load on the machine.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = (time.perf_counter() - start) / number
+        if best is None or elapsed < best:
+            best = elapsed
+    return best * 1e6
+
+
+def report(title, rows, baseline=None):
+    """
+    Print one line per (name, microseconds) row, with the saving against the baseline row if given.
+    """
+    print(title)
+    baseline_us = dict(rows).get(baseline)
+    for name, us in rows:
+        line = f'  {name:<32} {us:>10.2f} us'
+        if baseline_us and name != baseline:
+            line += f'  {(baseline_us - us) / baseline_us:.0%} saved against {baseline}'
+        print(line)
@@ -0,0 +1,11 @@
+import importlib
+import sys
+
+available = ['json_codec', 'log_pipeline', 'eq_launch', 'normalise', 'support_centres', 'workers', 'event_loop',
+             'startup']
+
+names = sys.argv[1:] or available
+for name in names:
+    if name not in available:
+        sys.exit(f'unknown benchmark {name}, choose from: {", ".join(available)}')
+    importlib.import_module(f'tests.benchmarks.{name}').run()
@@ -0,0 +1,78 @@
+"""
+EQ launch tokens signed and encrypted per second.
+
+First the CPU cost of one token with sdc-crypto's KeyStore, which parses the PEM keys for every token, against
+the CachedKeyStore that parses them once.
+
+Then the wall time per launch on one worker for each token executor. Launches are started together, as they
+would be by concurrent respondents, and the wall time for all of them is shared out. On a single core the pools
+can only add overhead; the gain comes from using the other cores.
+"""
+import json
+import asyncio
+import os
+import time
+
+from sdc.crypto.encrypter import encrypt
+from sdc.crypto.key_store import KeyStore
+
+from app import jwt
+from app.eq_tokens import TokenEncrypter
+
+from . import measure, report
+
+launches = 200
+
+payload = {
+    'tx_id': 'f3f3bd2e-bd9f-4b7b-8a3f-4a3d0a2e6a9b',
+    'case_id': '3305e937-6fb1-4ce1-9d4c-077f147789ab',
+    'collection_exercise_sid': '7a2f5a34-b9a7-4c18-b4c3-5fef5fb4cd49',
+    'ru_ref': '10023122451',
+    'user_id': '',
+    'questionnaire_id': '0100000000000123',
+    'eq_id': 'census',
+    'period_id': '2021',
+    'form_type': 'H',
+    'survey': 'CENSUS',
+    'language_code': 'en',
+    'display_address': '1 Gate Reach, Exeter',
+    'response_id': '2vfBHlIsGPImYlWTvXLiBeXw14NkzoicZcDJB8pZ9FQ=',
+    'account_service_url': 'http://localhost:9092/start/',
+    'channel': 'rh',
+    'region_code': 'GB-ENG',
+}
+
+
+def time_launches(loop, encrypter):
+    encrypter.start()
+    try:
+        # Warm the pool, so that process start up is not counted
+        loop.run_until_complete(asyncio.gather(*(encrypter.encrypt(encrypt, payload) for _ in range(4))))
+        start = time.perf_counter()
+        loop.run_until_complete(asyncio.gather(*(encrypter.encrypt(encrypt, payload) for _ in range(launches))))
+        return (time.perf_counter() - start) / launches * 1e6
+    finally:
+        loop.run_until_complete(encrypter.stop())
+
+
+def run():
+    with open('tests/test_data/test_keys.json') as fp:
+        keys = fp.read()
+    key_store = jwt.key_store(keys)
+    workers = os.cpu_count() or 1
+
+    rows = [(name, measure(lambda: encrypt(payload, key_store=store, key_purpose='authentication'),
+                           number=20, repeat=3))
+            for name, store in (('KeyStore', KeyStore(json.loads(keys))), ('CachedKeyStore', key_store))]
+    report('CPU per EQ launch token', rows, baseline='KeyStore')
+    for name, us in rows:
+        print(f'  {name:<32} {1e6 / us:>10.0f} tokens/s')
+    loop = asyncio.get_event_loop()
+
+    rows = [(f'{executor}, {workers} workers' if executor != 'none' else 'on the event loop',
+             time_launches(loop, TokenEncrypter(executor, workers, keys=keys, key_store=key_store)))
+            for executor in TokenEncrypter.executor_types]
+
+    report('Wall time per EQ launch token', rows, baseline='on the event loop')
+    for name, us in rows:
+        print(f'  {name:<32} {1e6 / us:>10.0f} launches/s')
@@ -0,0 +1,97 @@
+"""
+Requests per second and 99th percentile latency of the Start:get and CommonSelectAddress:get pages on each
+installed event loop, served in process with TestingConfig.
+
+Sessions are kept in a cookie rather than Redis, as in the unit tests, and addresses are read from an address
+snapshot rather than AIMS, so that only the app and the loop are measured.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from aiohttp import ClientSession
+from aiohttp.test_utils import TestServer
+from aiohttp_session import SimpleCookieStorage, session_middleware
+
+from app import event_loop, session
+from app.address_snapshot import build
+from app.app import create_app
+
+concurrency = 32
+requests = 2000
+
+pages = [
+    ('Start:get', '/en/start/'),
+    ('CommonSelectAddress:get', '/en/request/access-code/select-address/'),
+]
+
+
+def cookie_session(app_config):
+    return session_middleware(SimpleCookieStorage(cookie_name='RH_SESSION'))
+
+
+async def measure_page(url, cookies):
+    """:return: (requests per second, 99th percentile latency in milliseconds, responses other than 200)"""
+    latencies = []
+    failed = 0
+    remaining = iter(range(requests))
+
+    async def client(client_session):
+        nonlocal failed
+        for _ in remaining:
+            start = time.perf_counter()
+            async with client_session.get(url) as response:
+                await response.read()
+                if response.status != 200:
+                    failed += 1
+            latencies.append(time.perf_counter() - start)
+
+    async with ClientSession(cookies=cookies) as client_session:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(client_session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return requests / elapsed, latencies[int(len(latencies) * 0.99)] * 1e3, failed
+
+
+async def measure_loop(snapshot_path):
+    app = create_app('TestingConfig', overrides={'ADDRESS_SNAPSHOT_FILE': snapshot_path})
+    server = TestServer(app)
+    await server.start_server()
+    cookies = {'RH_SESSION': json.dumps({'created': int(time.time()), 'session': {
+        'client_id': 'benchmark', 'attributes': {'postcode': 'EX2 6GA'}}})}
+    try:
+        for name, path in pages:
+            rate, p99, failed = await measure_page(str(server.make_url(path)), cookies)
+            line = f'  {name:<32} {rate:>10.0f} requests/s {p99:>8.2f} ms p99'
+            if failed:
+                line += f'  {failed} responses were not 200'
+            print(line)
+    finally:
+        await server.close()
+
+
+def run():
+    snapshot_path = tempfile.mktemp(suffix='.snapshot')
+    build(((('EX2 6GA', str(10023122451 + number), f'{number + 1} Gate Reach, Exeter, EX2 6GA')
+            for number in range(30))), snapshot_path, '')
+    session.setup = cookie_session
+    try:
+        for name in event_loop.policy_factories:
+            try:
+                asyncio.set_event_loop_policy(event_loop.make_policy(name))
+            except ImportError:
+                print(f'{name} is not installed')
+                continue
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            print(f'{name} event loop, {concurrency} clients, HTTP parser: {event_loop.http_parser_name()}')
+            try:
+                loop.run_until_complete(measure_loop(snapshot_path))
+            finally:
+                loop.close()
+    finally:
+        asyncio.set_event_loop_policy(None)
+        os.remove(snapshot_path)
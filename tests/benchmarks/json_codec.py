@@ -0,0 +1,63 @@
+"""
+CPU spent on JSON per respondent request, for each installed codec.
+
+A request is modelled as: decoding a UAC lookup from RHSvc, encoding a fulfilment POST body, loading and
+saving the Redis session and formatting five log records.
+"""
+import json
+import logging
+
+from app import json_codec
+from app.app_logging import CustomJsonFormatter
+
+from . import measure, report
+
+
+def request_workload(codec):
+    with open('tests/test_data/rhsvc/uac_e.json') as fp:
+        uac_body = fp.read()
+    fulfilment = {
+        'caseId': '3305e937-6fb1-4ce1-9d4c-077f147789ab',
+        'telNo': '447123456789',
+        'fulfilmentCodes': ['UACHHT1'],
+        'dateTime': '2021-03-21T09:00:00.000000+00:00',
+        'clientIP': '10.0.0.1',
+    }
+    session = {'created': 1616317200, 'session': {
+        'client_id': '36be6b97-b4de-4718-8a74-8b27fb03ca8c',
+        'identity': '3305e937-6fb1-4ce1-9d4c-077f147789ab',
+        'case': json.loads(uac_body),
+        'attributes': {'first_name': 'Bob', 'last_name': 'Bobbington', 'postcode': 'EX2 6GA'},
+    }}
+    session_body = json.dumps(session)
+
+    formatter = CustomJsonFormatter(json_serializer=codec.dumps)
+    record = logging.LogRecord('respondent-home', logging.INFO, __file__, 1, "received GET on endpoint 'en/start'",
+                               None, None)
+    record.client_ip = '10.0.0.1, 10.0.0.2, 10.0.0.3'
+    record.client_id = '36be6b97-b4de-4718-8a74-8b27fb03ca8c'
+    record.trace = '0123456789'
+    record.method = 'GET'
+    record.path = '/en/start/'
+
+    def workload():
+        codec.loads(uac_body)
+        codec.dumps_bytes(fulfilment)
+        codec.loads(session_body)
+        codec.dumps(session)
+        for _ in range(5):
+            formatter.format(record)
+
+    return workload
+
+
+def run():
+    rows = []
+    for name in json_codec.codec_factories:
+        try:
+            codec = json_codec.make_codec(name)
+        except ImportError:
+            print(f'  {name} not installed, skipping')
+            continue
+        rows.append((name, measure(request_workload(codec), number=2000)))
+    report('JSON CPU per request', rows, baseline='json')
@@ -0,0 +1,84 @@
+"""
+Logging cost per respondent request, modelled as five structlog calls from a handler.
+
+The baseline is the previous pipeline: structlog's stock stdlib logger class, whose caller lookup tests every
+frame against a list of module prefixes, and a python-json-logger formatter.
+
+"caller" is the time spent on the thread making the log calls, which is the event loop in the service.
+"total" also includes the listener thread draining the queue.
+"""
+import logging
+import os
+import time
+
+from logging.handlers import QueueListener
+from queue import Queue
+
+import structlog
+from pythonjsonlogger import jsonlogger
+from structlog.stdlib import _FixedFindCallerLogger
+
+from app.app_logging import CustomJsonFormatter, FastCallerLogger, LogQueueHandler, logger_initial_config
+
+from . import measure, report
+
+calls_per_request = 5
+requests = 2000
+
+
+def log_request(logger):
+    def workload():
+        for _ in range(calls_per_request):
+            logger.info("received GET on endpoint 'en/start'",
+                        client_ip='10.0.0.1, 10.0.0.2, 10.0.0.3',
+                        client_id='36be6b97-b4de-4718-8a74-8b27fb03ca8c',
+                        trace='0123456789',
+                        method='GET',
+                        path='/en/start/')
+    return workload
+
+
+def benchmark_logger(name, logger_class, handler):
+    logging.setLoggerClass(logger_class)
+    std_logger = logging.getLogger(name)
+    logging.setLoggerClass(FastCallerLogger)
+    std_logger.handlers = [handler]
+    std_logger.propagate = False
+    std_logger.setLevel(logging.INFO)
+    return structlog.get_logger(name)
+
+
+def run():
+    # Give the root logger a handler so configuring structlog does not attach one to stdout
+    logging.getLogger().addHandler(logging.NullHandler())
+    logger_initial_config(log_level='WARN', ext_log_level='WARN')
+
+    devnull = open(os.devnull, 'w')
+    rows = []
+
+    handler = logging.StreamHandler(devnull)
+    handler.setFormatter(jsonlogger.JsonFormatter('(message) (asctime) (levelname) (pathname) (lineno)'))
+    logger = benchmark_logger('benchmark-previous', _FixedFindCallerLogger, handler)
+    rows.append(('previous pipeline', measure(log_request(logger), number=requests)))
+
+    handler = logging.StreamHandler(devnull)
+    handler.setFormatter(CustomJsonFormatter())
+    logger = benchmark_logger('benchmark-inline', FastCallerLogger, handler)
+    rows.append(('inline handler', measure(log_request(logger), number=requests)))
+
+    handler = logging.StreamHandler(devnull)
+    handler.setFormatter(CustomJsonFormatter())
+    log_queue = Queue()
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    logger = benchmark_logger('benchmark-queue', FastCallerLogger, LogQueueHandler(log_queue))
+    start = time.perf_counter()
+    caller = measure(log_request(logger), number=requests, repeat=1)
+    while not log_queue.empty():
+        time.sleep(0.001)
+    total = (time.perf_counter() - start) / requests * 1e6
+    listener.stop()
+    rows.append(('queue handler, caller', caller))
+    rows.append(('queue handler, total', total))
+
+    report('Logging CPU per request', rows, baseline='previous pipeline')
@@ -0,0 +1,134 @@
+"""
+CPU spent normalising respondent input, before and after the patterns and translation tables were built once,
+and checking a batch of values with the batch checks rather than the web validators.
+
+The corpus is the kinds of variant seen in real input: case, spacing, tabs and newlines pasted in with the value,
+zero width characters from copying out of documents and messaging apps, full width characters from some
+mobile keyboards and the punctuation phone numbers are written with.
+"""
+import random
+import re
+import string
+
+from functools import partial
+
+from unicodedata import normalize
+
+from app import normalise
+from app.utils import InvalidDataError, ProcessMobileNumber, ProcessPostcode
+
+from . import measure, report
+
+OBSCURE_WHITESPACE = normalise.OBSCURE_WHITESPACE
+
+postcodes = ['EX2 6GA', 'SW1A 1AA', 'M1 1AE', 'B33 8TH', 'CR2 6XH', 'DN55 1PT', 'W1A 0AX', 'EC1A 1BB', 'LL11 1AA']
+mobiles = ['07700 900345', '+44 7700 900345', '07700900345', '(07700) 900-345', '447700900345', '+44 (0)7700 900345']
+uacs = ['ABCD EFGH IJKL MNOP', 'abcdefghijklmnop', 'A1B2 C3D4 E5F6 G7H8', 'abcd-efgh-ijkl-mnop']
+names = ['Bob', '  Bobbington ', 'Mary Ann', "O'Neill", 'Siân', 'Zoë\u200B']
+# X-Forwarded-For chains are built by our load balancers, so are not varied
+client_ips = ['81.2.69.160, 10.0.0.1, 10.0.0.2', '2001:db8::1, 10.0.0.1, 10.0.0.2', '81.2.69.160', '',
+              '192.168.0.4, 81.2.69.160, 10.0.0.1, 10.0.0.2']
+
+
+def variants(value, rng):
+    """A random respondent's version of value"""
+    chars = []
+    for character in value:
+        if character == ' ':
+            character = rng.choice(['', ' ', '  ', '\t', '\u00A0', '\u200B'])
+        elif rng.random() < 0.05:
+            character = chr(ord(character) + 0xFEE0) if '!' <= character <= '~' else character
+        chars.append(character)
+    value = ''.join(chars)
+    value = rng.choice([value, value.lower(), value.upper()])
+    return rng.choice(['', ' ', '\n', '\uFEFF']) + value + rng.choice(['', ' ', '\r\n', '\u200B'])
+
+
+def corpus(values, size=2000, vary=True):
+    rng = random.Random(2021)
+    return [variants(rng.choice(values), rng) if vary else rng.choice(values) for _ in range(size)]
+
+
+def uac_before(uac):
+    combined = uac.upper().replace(' ', '') if uac else ''
+    return re.compile(r'^[A-Z0-9]{16}$').fullmatch(combined)
+
+
+def uac_after(uac):
+    return normalise.is_uac(normalise.uac(uac))
+
+
+def postcode_before(postcode):
+    for character in string.whitespace + OBSCURE_WHITESPACE:
+        postcode = postcode.replace(character, '')
+    return normalize('NFKD', postcode.upper()).encode('ascii', 'ignore').decode('utf8')
+
+
+def phone_number_before(number):
+    for character in string.whitespace + OBSCURE_WHITESPACE + '()-+':
+        number = number.replace(character, '')
+    try:
+        list(map(int, number))
+        return number
+    except ValueError:
+        return None
+
+
+def phone_number_after(number):
+    number = normalise.phone_number(number)
+    return number if normalise.is_digits(number) else None
+
+
+def name_before(name):
+    # Only stripped ordinary whitespace, so normalise does more work here
+    return name.strip()
+
+
+def client_ip_before(client_ip):
+    if client_ip.count(',') > 1:
+        ip = client_ip.split(', ', -1)[-3]
+        if re.compile(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$').fullmatch(ip):
+            return ip
+    return ''
+
+
+def validate_each(validate, values):
+    """How a batch job had to use the web validators"""
+    def workload():
+        results = []
+        for value in values:
+            try:
+                results.append((validate(value, 'en'), None))
+            except InvalidDataError as ex:
+                results.append((value, ex.message_type))
+    return workload
+
+
+def over(function, values):
+    def workload():
+        for value in values:
+            function(value)
+    return workload
+
+
+def run():
+    for title, values, before, after in (
+        ('UAC', corpus(uacs), uac_before, uac_after),
+        ('postcode', corpus(postcodes), postcode_before, normalise.postcode),
+        ('mobile number', corpus(mobiles), phone_number_before, phone_number_after),
+        ('name', corpus(names), name_before, normalise.name),
+        ('client IP', corpus(client_ips, vary=False), client_ip_before, normalise.client_ip),
+    ):
+        rows = [('before', measure(over(before, values), number=20)),
+                ('normalise', measure(over(after, values), number=20))]
+        report(f'{title}, per {len(values)} values', rows, baseline='before')
+
+    for title, values, validate, check_all in (
+        ('postcode', corpus(postcodes + ['EX2 6G', 'BFPO 105', 'QQ1 1AA'], 20000),
+         ProcessPostcode.validate_postcode, normalise.check_postcodes),
+        ('mobile number', corpus(mobiles + ['01234 567890', '07700 9003'], 20000),
+         ProcessMobileNumber.validate_uk_mobile_phone_number, normalise.check_uk_mobile_numbers),
+    ):
+        rows = [('validator per value', measure(validate_each(validate, values), number=1)),
+                ('batch check', measure(partial(check_all, values), number=1))]
+        report(f'{title} batch, per {len(values)} values', rows, baseline='validator per value')
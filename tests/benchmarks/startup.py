@@ -0,0 +1,47 @@
+"""
+Time taken by a fresh interpreter to import the app and create it with TestingConfig, against a target.
+
+Sessions are kept in a cookie rather than Redis, as in the unit tests, so that no services are needed.
+The app logs where the time goes when it is started with STARTUP_PROFILE set.
+"""
+import os
+import subprocess
+import sys
+
+runs = 7
+
+# Seconds from starting the interpreter to the app being ready, for the fastest run
+target = 1.0
+
+script = '''
+import time
+start = time.perf_counter()
+from aiohttp_session import SimpleCookieStorage, session_middleware
+from app import session
+session.setup = lambda app_config: session_middleware(SimpleCookieStorage(cookie_name='RH_SESSION'))
+from app.app import create_app
+imported = time.perf_counter()
+create_app('TestingConfig')
+print(imported - start, time.perf_counter() - imported)
+'''
+
+
+def measure():
+    """:return: (seconds to import the app, seconds to create it), from a fresh interpreter"""
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    output = subprocess.run([sys.executable, '-c', script], env=env, check=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    imported, created = output.decode('utf-8').split()[-2:]
+    return float(imported), float(created)
+
+
+def run():
+    timings = sorted((measure() for _ in range(runs)), key=sum)
+    best_import, best_create = timings[0]
+    median_import, median_create = timings[runs // 2]
+    print(f'startup, best of {runs} runs')
+    print(f'  {"import":<12} {best_import * 1e3:>8.0f} ms best {median_import * 1e3:>8.0f} ms median')
+    print(f'  {"create_app":<12} {best_create * 1e3:>8.0f} ms best {median_create * 1e3:>8.0f} ms median')
+    best = best_import + best_create
+    print(f'  {"total":<12} {best * 1e3:>8.0f} ms best, target {target * 1e3:.0f} ms: '
+          f'{"met" if best <= target else "missed"}')
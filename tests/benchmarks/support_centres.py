@@ -0,0 +1,56 @@
+"""
+Time to find the ten nearest support centres to a postcode in the local index, against scanning every centre.
+The AD lookup service, which the index replaces, takes a network round trip of several milliseconds.
+
+Centres and postcodes are scattered at random over Great Britain, at about the number of centres in the 2021
+census and a large postcode table.
+"""
+import random
+
+from app.support_centres import PostcodeCentroids, SupportCentreIndex, distance_in_miles, to_unit_vector
+
+from . import measure, report
+
+CENTRES = 3000
+POSTCODES = 200000
+
+
+def postcode(rng):
+    letters = 'ABCDEFGHJKLMNPRSTUWYZ'
+    return (rng.choice(letters) + rng.choice(letters) + str(rng.randint(1, 99)) + ' ' + str(rng.randint(0, 9))
+            + rng.choice(letters) + rng.choice(letters))
+
+
+def scan(index, latitude, longitude, limit=10):
+    """Every centre's distance, as a search without the index has to"""
+    point = to_unit_vector(latitude, longitude)
+    distances = []
+    for position, centre in enumerate(index.indexed):
+        other = to_unit_vector(float(centre['latitude']), float(centre['longitude']))
+        distances.append((sum((a - b) ** 2 for a, b in zip(point, other)) ** 0.5, position))
+    distances.sort()
+    return [dict(index.indexed[position], distanceInMiles=round(distance_in_miles(chord), 1))
+            for chord, position in distances[:limit]]
+
+
+def run():
+    rng = random.Random(2021)
+    centres = [{'locationName': f'Centre {number}', 'postcode': postcode(rng),
+                'latitude': str(rng.uniform(50, 58.5)), 'longitude': str(rng.uniform(-6, 1.7))}
+               for number in range(CENTRES)]
+    rows = [(postcode(rng), rng.uniform(50, 58.5), rng.uniform(-6, 1.7)) for _ in range(POSTCODES)]
+    index = SupportCentreIndex(centres, PostcodeCentroids(rows))
+    searches = [rng.choice(rows)[0] for _ in range(100)]
+
+    def indexed():
+        for searched in searches:
+            index.nearest_to_postcode(searched)
+
+    def scanned():
+        for searched in searches:
+            scan(index, *index.centroids.get(searched))
+
+    results = [('scan every centre', measure(scanned, number=1, repeat=3) / len(searches)),
+               ('k-d tree', measure(indexed, number=10) / len(searches))]
+    report(f'nearest 10 of {CENTRES} centres, per search', results, baseline='scan every centre')
+    print(f'  postcode table of {POSTCODES} postcodes: {len(index.centroids.keys) * 16 / 1e6:.1f} MB')
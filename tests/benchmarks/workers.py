@@ -0,0 +1,99 @@
+"""
+Memory and throughput of four workers started by gunicorn, as in the Procfile, against four forked by the
+built in launcher, which preloads the app and shares the Redis pool sizes between the workers.
+
+Both are started with DevelopmentConfig, so Redis must be running where it points. Memory is the proportional
+set size of every process, which counts pages shared copy-on-write once between the processes sharing them.
+"""
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from aiohttp import ClientSession, ClientError
+
+workers = 4
+concurrency = 64
+duration = 10.0
+
+
+def process_tree(pid):
+    pids = [pid]
+    for child in pids:
+        try:
+            with open(f'/proc/{child}/task/{child}/children') as children_file:
+                pids.extend(int(found) for found in children_file.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def memory_kb(pid):
+    """The proportional set size of a process, or its resident set size where that is not reported"""
+    for path, field in ((f'/proc/{pid}/smaps_rollup', 'Pss:'), (f'/proc/{pid}/status', 'VmRSS:')):
+        try:
+            with open(path) as proc_file:
+                for line in proc_file:
+                    if line.startswith(field):
+                        return int(line.split()[1])
+        except OSError:
+            continue
+    return 0
+
+
+async def wait_until_serving(url, process, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    async with ClientSession() as session:
+        while time.monotonic() < deadline and process.poll() is None:
+            try:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        return True
+            except ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    return False
+
+
+async def load(url):
+    """:return: Requests answered per second by concurrent clients"""
+    answered = 0
+    deadline = time.monotonic() + duration
+
+    async def client(session):
+        nonlocal answered
+        while time.monotonic() < deadline:
+            async with session.get(url) as response:
+                await response.read()
+                answered += 1
+
+    async with ClientSession() as session:
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+    return answered / duration
+
+
+def measure_server(name, command, port):
+    env = dict(os.environ, APP_SETTINGS='DevelopmentConfig', PORT=str(port), WORKERS=str(workers))
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}/info'
+    loop = asyncio.get_event_loop()
+    try:
+        if not loop.run_until_complete(wait_until_serving(url, process)):
+            print(f'  {name:<32} could not be started, is Redis running?')
+            return
+        memory = sum(memory_kb(pid) for pid in process_tree(process.pid)) / 1024
+        requests = loop.run_until_complete(load(url))
+        print(f'  {name:<32} {memory:>8.1f} MB {requests:>10.0f} requests/s')
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait()
+
+
+def run():
+    print(f'{workers} workers serving /info to {concurrency} clients')
+    gunicorn = os.path.join(os.path.dirname(sys.executable), 'gunicorn')
+    measure_server('gunicorn', [gunicorn, 'app.app:create_app()', '--workers', str(workers), '--bind',
+                                '127.0.0.1:9301', '--worker-class', 'app.gunicorn_worker.WebWorker'], 9301)
+    measure_server('launcher', [sys.executable, 'run.py'], 9302)
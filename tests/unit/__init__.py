@@ -4,6 +4,8 @@ import json
 import time
 import uuid
 
+from unittest import TestCase
+
 from aiohttp.test_utils import AioHTTPTestCase
 from tenacity import wait_exponential
 
@@ -135,6 +137,81 @@ def skip_encrypt(func, *args, **kwargs):
     return new_func
 
 
+class FakeClock:
+    """Stands in for time.time or time.monotonic, giving now until a test moves it on"""
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedisPool:
+    """
+    Answers the Redis commands the app sends from memory, holding string and hash keys and recording expiries
+    without applying them. Scripts are recorded and answered with script_result. Every command is recorded in
+    calls, and any errors given are raised, in order, by the first commands sent.
+    """
+    def __init__(self, script_result=1, errors=()):
+        self.values = {}
+        self.expiries = {}
+        self.scripts = []
+        self.calls = []
+        self.script_result = script_result
+        self.errors = list(errors)
+
+    @staticmethod
+    def encode(value):
+        return value.encode('utf-8') if isinstance(value, str) else value
+
+    async def execute(self, command, *args):
+        self.calls.append((command, args))
+        if self.errors:
+            raise self.errors.pop(0)
+        if command in (b'EVALSHA', b'EVAL'):
+            self.scripts.append(args)
+            return self.script_result
+        key, *args = args
+        if command == b'SET':
+            value, *options = args
+            if b'NX' in options and key in self.values:
+                return None
+            self.values[key] = self.encode(value)
+            if b'EX' in options:
+                self.expiries[key] = options[options.index(b'EX') + 1]
+            return b'OK'
+        if command == b'GET':
+            return self.values.get(key)
+        if command == b'MGET':
+            return [self.values.get(key) for key in (key, *args)]
+        if command == b'EXISTS':
+            return int(key in self.values)
+        if command == b'DEL':
+            return int(self.values.pop(key, None) is not None)
+        if command == b'HSET':
+            self.values.setdefault(key, {})[args[0]] = self.encode(args[1])
+            return 1
+        if command == b'HGET':
+            return self.values.get(key, {}).get(args[0])
+        if command == b'EXPIRE':
+            self.expiries[key] = args[0]
+            return 1
+        raise AssertionError(f'unexpected command {command}')
+
+
+class AsyncTestCase(TestCase):
+    """TestCase with an event loop of its own for each test, set as the current loop"""
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+
 class RHTestCase(AioHTTPTestCase):
 
     language_code = 'en'
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import tempfile
+
+from unittest import TestCase
+
+from app import address_snapshot
+from app.address_snapshot import AddressSnapshot, build
+from app.request import BackgroundRequest
+from app.utils import AddressIndex
+
+
+class TestAddressSnapshot(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mktemp(suffix='.snapshot')
+        build([('EX2 6GA', '10023122452', '2 Gate Reach, Exeter, EX2 6GA'),
+               ('EX2 6GA', '10023122451', '1 Gate Reach,\tExeter,\nEX2 6GA'),
+               ('ex26ga', '10023122453', '3 Gate Reach, Exeter, EX2 6GA'),
+               ('CF10 1AA', '200001', 'Caf\u00e9 Cymru, Caerdydd, CF10 1AA'),
+               ('not a postcode', '1', 'Nowhere')], self.path, '73')
+        self.snapshot = AddressSnapshot(self.path)
+
+    def tearDown(self):
+        self.snapshot.close()
+        os.remove(self.path)
+
+    def test_postcode(self):
+        postcode_return = self.snapshot.postcode('EX2 6GA')
+        self.assertEqual(postcode_return['response']['total'], 3)
+        self.assertEqual(postcode_return['response']['addresses'][0],
+                         {'uprn': '10023122451', 'formattedAddress': '1 Gate Reach, Exeter, EX2 6GA'})
+        self.assertEqual([address['uprn'] for address in postcode_return['response']['addresses']],
+                         ['10023122451', '10023122452', '10023122453'])
+        self.assertEqual(self.snapshot.postcode('CF101AA')['response']['addresses'][0]['formattedAddress'],
+                         'Caf\u00e9 Cymru, Caerdydd, CF10 1AA')
+
+    def test_postcode_limit(self):
+        postcode_return = self.snapshot.postcode('EX2 6GA', limit=2)
+        self.assertEqual(len(postcode_return['response']['addresses']), 2)
+        self.assertEqual(postcode_return['response']['total'], 3)
+
+    def test_postcode_missing(self):
+        self.assertEqual(self.snapshot.epoch, '73')
+        self.assertEqual(len(self.snapshot), 2)
+        self.assertIsNone(self.snapshot.postcode('GU34 6DU'))
+        self.assertIsNone(self.snapshot.postcode('ZZ99 9ZZ'))
+
+    def test_built_in_runs(self):
+        rows = [('EX2 6GA', str(uprn), f'{uprn} Gate Reach, Exeter, EX2 6GA') for uprn in range(12, 0, -1)]
+        rows += [('CF10 1AA', '200001', 'Old address'), ('EX2 6GA', '7', '7 Gate Reach, Exeter, EX2 6GA'),
+                 ('CF10 1AA', '200001', 'New address')]
+        path = tempfile.mktemp(suffix='.snapshot')
+        try:
+            self.assertEqual(build(rows, path, '73', run_size=4), 2)
+            snapshot = AddressSnapshot(path)
+            try:
+                addresses = snapshot.postcode('EX2 6GA')['response']['addresses']
+                self.assertEqual([address['uprn'] for address in addresses], [str(uprn) for uprn in range(1, 13)])
+                self.assertEqual(snapshot.postcode('CF10 1AA')['response']['addresses'],
+                                 [{'uprn': '200001', 'formattedAddress': 'New address'}])
+            finally:
+                snapshot.close()
+        finally:
+            os.remove(path)
+
+    def test_epoch_too_long(self):
+        path = tempfile.mktemp(suffix='.snapshot')
+        with self.assertRaises(ValueError):
+            build([('EX2 6GA', '1', '1 Gate Reach')], path, 'x' * 17)
+        self.assertFalse(os.path.exists(path))
+
+    def test_not_a_snapshot(self):
+        with tempfile.NamedTemporaryFile(suffix='.snapshot', delete=False) as other_file:
+            other_file.write(b'postcode,uprn,formattedAddress\n' * 4)
+        try:
+            with self.assertRaises(ValueError):
+                AddressSnapshot(other_file.name)
+        finally:
+            os.remove(other_file.name)
+
+    def test_setup_checks_epoch(self):
+        app = {'ADDRESS_SNAPSHOT_FILE': self.path, 'ADDRESS_INDEX_EPOCH': '72'}
+        self.assertIsNone(address_snapshot.setup(app))
+
+    def test_search_answered_from_snapshot(self):
+        loop = asyncio.new_event_loop()
+        request = BackgroundRequest({'address_snapshot': self.snapshot, 'ADDRESS_INDEX_SVC_URL': 'http://aims',
+                                     'ADDRESS_INDEX_EPOCH': '73', 'ADDRESS_INDEX_SVC_POSTCODE_LIMIT': '5000'})
+        address_content = loop.run_until_complete(AddressIndex.get_postcode_return(request, 'EX2 6GA', 'en'))
+        loop.close()
+        self.assertEqual(address_content['total_matches'], 3)
+        self.assertEqual(address_content['addresses'][0]['value'], '10023122451')
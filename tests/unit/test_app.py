@@ -10,7 +10,7 @@ from aioresponses import aioresponses
 
 from envparse import ConfigurationError, env
 
-from app.app import create_app
+from app.app import create_app, on_startup
 
 from app import session
 
@@ -36,6 +36,13 @@ class TestCreateApp(AioHTTPTestCase):
     async def test_create_app(self):
         self.assertIsInstance(self.app, Application)
 
+    @unittest_run_loop
+    async def test_session_pool_created_first(self):
+        # After aiohttp's own hook for the cleanup contexts
+        hooks = [hook for hook in self.app.on_startup if getattr(hook, '__self__', None) is not self.app.cleanup_ctx]
+        self.assertIs(hooks[0], on_startup)
+        self.assertFalse(self.app.http_session_pool.closed)
+
     @unittest_run_loop
     async def test_security_headers(self):
         nonce = '123456'
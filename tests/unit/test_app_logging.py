@@ -0,0 +1,181 @@
+import json
+import logging
+import os
+
+from queue import Queue
+from unittest import TestCase, mock
+
+from app.app_logging import (CustomJsonFormatter, FastCallerLogger, LoggerFactory, LogQueueHandler, LogVolumeFilter,
+                             STRUCTLOG_DATA, logger_initial_config, parse_sample_rates, render_to_log_kwargs)
+
+from . import FakeClock
+
+
+def make_record(msg='test event', pathname=None, name='respondent-home', **extra):
+    if pathname is None:
+        pathname = os.path.join(os.getcwd(), 'app', 'handlers.py')
+    record = logging.LogRecord(name, logging.INFO, pathname, 42, msg, None, None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+class TestCustomJsonFormatter(TestCase):
+
+    def setUp(self):
+        self.formatter = CustomJsonFormatter()
+
+    def test_format_fields(self):
+        output = json.loads(self.formatter.format(make_record(client_id='abc')))
+        self.assertEqual(list(output), ['created', 'service', 'level', 'event', 'context', 'data'])
+        self.assertEqual(output['service'], 'rhui')
+        self.assertEqual(output['level'], 'INFO')
+        self.assertEqual(output['event'], 'test event')
+        self.assertEqual(output['data']['source'], 'respondent-home:handlers:(pwd)/app/handlers.py:42')
+        self.assertEqual(output['data']['client_id'], 'abc')
+
+    def test_format_created_has_milliseconds(self):
+        record = make_record()
+        record.created = 1616317200.1234
+        record.msecs = 123
+        created = json.loads(self.formatter.format(record))['created']
+        self.assertRegex(created, r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.123$')
+
+    def test_format_uses_structlog_data(self):
+        kwargs = render_to_log_kwargs(None, 'info', {'event': 'test event', 'source': 'clash', 'trace': '01'})
+        record = make_record(kwargs['msg'], **kwargs['extra'])
+        self.assertEqual(record.trace, '01')
+        data = json.loads(self.formatter.format(record))['data']
+        self.assertEqual(data['raw_source'], 'clash')
+        self.assertEqual(data['trace'], '01')
+        self.assertNotIn(STRUCTLOG_DATA, data)
+
+    def test_format_external_record(self):
+        record = make_record('GET /info 200', pathname=os.path.join(CustomJsonFormatter.lib_dir, 'lib', 'web.py'),
+                             name='aiohttp.access')
+        output = json.loads(self.formatter.format(record))
+        self.assertEqual(output['event'], 'External from aiohttp.access')
+        self.assertEqual(output['data']['message'], 'GET /info 200')
+
+    def test_format_no_source(self):
+        record = make_record(pathname='')
+        output = json.loads(self.formatter.format(record))
+        self.assertEqual(output['event'], 'test event')
+        self.assertIn('(no source)', output['data']['source'])
+
+    def test_format_unserialisable_value(self):
+        data = json.loads(self.formatter.format(make_record(error=ValueError('bad'))))['data']
+        self.assertEqual(data['error'], 'bad')
+
+
+class TestFastCallerLogger(TestCase):
+
+    def test_find_caller_skips_logging_frames(self):
+        logger = FastCallerLogger('test-fast-caller')
+        handler_records = []
+        handler = logging.Handler()
+        handler.emit = handler_records.append
+        logger.addHandler(handler)
+        logger.warning('where am I')
+        record = handler_records[0]
+        self.assertEqual(record.pathname, __file__)
+        self.assertEqual(record.funcName, 'test_find_caller_skips_logging_frames')
+
+    def find_caller(self, logger, stacklevel=1):
+        return logger.findCaller(stacklevel=stacklevel)
+
+    def test_stacklevel(self):
+        logger = FastCallerLogger('test-fast-caller')
+        self.assertEqual(self.find_caller(logger)[2], 'find_caller')
+        self.assertEqual(self.find_caller(logger, stacklevel=2)[2], 'test_stacklevel')
+
+    def test_ignore_frame_names(self):
+        logger_factory = LoggerFactory(ignore_frame_names=[__name__])
+        with mock.patch('logging.getLogger', FastCallerLogger):
+            logger = logger_factory('test-fast-caller-ignoring')
+        self.assertIn(__name__, logger.skipped_modules)
+        self.assertNotEqual(logger.findCaller()[0], __file__)
+        self.assertEqual(FastCallerLogger('test-fast-caller').findCaller()[0], __file__)
+
+    def test_logger_class_set_by_config_only(self):
+        self.addCleanup(logging.setLoggerClass, logging.getLoggerClass())
+        logging.setLoggerClass(logging.Logger)
+        LoggerFactory()
+        self.assertIs(logging.getLoggerClass(), logging.Logger)
+        logger_initial_config()
+        self.assertIs(logging.getLoggerClass(), FastCallerLogger)
+
+
+class TestLogQueueHandler(TestCase):
+
+    def test_prepare_merges_args(self):
+        log_queue = Queue()
+        handler = LogQueueHandler(log_queue)
+        record = logging.LogRecord('test', logging.INFO, __file__, 1, 'value %s', ('one',), None)
+        handler.handle(record)
+        queued = log_queue.get_nowait()
+        self.assertEqual(queued.msg, 'value one')
+        self.assertIsNone(queued.args)
+
+
+class TestLogVolumeFilter(TestCase):
+
+    def setUp(self):
+        logger_initial_config()
+        self.clock = FakeClock()
+
+    def kept(self, log_filter, records):
+        return [record for record in records if log_filter.filter(record)]
+
+    def test_sample_by_event_prefix(self):
+        log_filter = LogVolumeFilter({'received GET': 0.25}, clock=self.clock)
+        records = [make_record('received GET on endpoint') for _ in range(8)]
+        self.assertEqual(len(self.kept(log_filter, records)), 2)
+        self.assertEqual(log_filter.dropped_sampled, {'received GET': 6})
+
+    def test_unsampled_events_kept(self):
+        log_filter = LogVolumeFilter({'received GET': 0.25}, clock=self.clock)
+        records = [make_record('received POST on endpoint') for _ in range(8)]
+        self.assertEqual(len(self.kept(log_filter, records)), 8)
+
+    def test_zero_rate_drops_all(self):
+        log_filter = LogVolumeFilter({'no adlocation': 0}, clock=self.clock)
+        self.assertEqual(self.kept(log_filter, [make_record('no adlocation present')] * 3), [])
+
+    def test_warnings_always_kept(self):
+        log_filter = LogVolumeFilter({'attempt': 0}, rate_limit=1, clock=self.clock)
+        record = make_record('attempt failed')
+        record.levelno = logging.WARNING
+        self.assertEqual(len(self.kept(log_filter, [record] * 5)), 5)
+
+    def test_rate_limit_refills(self):
+        log_filter = LogVolumeFilter(rate_limit=2, rate_burst=3, clock=self.clock)
+        self.assertEqual(len(self.kept(log_filter, [make_record()] * 5)), 3)
+        self.assertEqual(log_filter.dropped_rate_limited, 2)
+        self.clock.now += 1
+        self.assertEqual(len(self.kept(log_filter, [make_record()] * 5)), 2)
+
+    def test_dropped_records_reported(self):
+        log_filter = LogVolumeFilter({'received GET': 0.5}, rate_limit=1, report_interval=10, clock=self.clock)
+        self.kept(log_filter, [make_record('received GET on endpoint')] * 4)
+        self.kept(log_filter, [make_record()] * 2)
+        self.clock.now += 10
+        with self.assertLogs('respondent-home', 'WARNING') as cm:
+            log_filter.filter(make_record())
+        record = cm.records[0]
+        self.assertEqual(record.message, 'log records dropped')
+        self.assertEqual(record.dropped_sampled, {'received GET': 2})
+        self.assertEqual(record.dropped_rate_limited, 3)
+        self.assertEqual(log_filter.dropped_rate_limited, 0)
+
+    def test_nothing_to_report(self):
+        log_filter = LogVolumeFilter(rate_limit=10, report_interval=10, clock=self.clock)
+        self.clock.now += 10
+        with self.assertRaises(AssertionError):
+            with self.assertLogs('respondent-home', 'WARNING'):
+                log_filter.filter(make_record())
+
+    def test_parse_sample_rates(self):
+        self.assertEqual(parse_sample_rates('received GET on endpoint=0.1, no adlocation present=0.05'),
+                         {'received GET on endpoint': 0.1, 'no adlocation present': 0.05})
+        self.assertEqual(parse_sample_rates(''), {})
@@ -0,0 +1,163 @@
+import asyncio
+import base64
+import json
+import os
+import tempfile
+import threading
+import time
+
+from unittest import TestCase, mock
+
+from jwcrypto import jwk
+from sdc.crypto.encrypter import encrypt
+from sdc.crypto.exceptions import CryptoError, InvalidTokenException
+from sdc.crypto.key_store import KeyStore
+
+from app import jwt
+from app.jwt import CachedKeyStore
+from app.eq_tokens import CurrentKeyStore, TokenEncrypter
+
+from . import AsyncTestCase
+
+with open('tests/test_data/test_keys.json') as fp:
+    test_keys = fp.read()
+
+payload = {'tx_id': 'f3f3bd2e-bd9f-4b7b-8a3f-4a3d0a2e6a9b', 'case_id': '3305e937-6fb1-4ce1-9d4c-077f147789ab'}
+
+
+def token_header(token):
+    header = token.split('.')[0]
+    return json.loads(base64.urlsafe_b64decode(header + '=' * (-len(header) % 4)))
+
+
+class TestTokenEncrypter(AsyncTestCase):
+
+    def encrypt_with(self, executor, encrypt_function=encrypt):
+        encrypter = TokenEncrypter(executor, 2, keys=test_keys, key_store=jwt.key_store(test_keys))
+        encrypter.start()
+        try:
+            return self.loop.run_until_complete(encrypter.encrypt(encrypt_function, payload))
+        finally:
+            self.loop.run_until_complete(encrypter.stop())
+
+    def test_encrypt_each_executor(self):
+        for executor in TokenEncrypter.executor_types:
+            token = self.encrypt_with(executor)
+            self.assertEqual(len(token.split('.')), 5, executor)
+            self.assertEqual(token_header(token)['kid'], '75dc2ceb6a02246b2909f6b7f7716e409321549d', executor)
+
+    def test_thread_executor_off_loop(self):
+        def encrypt_function(payload, key_store, key_purpose):
+            return threading.current_thread().name
+
+        self.assertTrue(self.encrypt_with('thread', encrypt_function).startswith('eq-token'))
+        self.assertEqual(self.encrypt_with('none', encrypt_function), threading.current_thread().name)
+
+    def test_stop_leaves_loop_running(self):
+        def encrypt_function(payload, key_store, key_purpose):
+            time.sleep(0.2)
+            return 'token'
+
+        encrypter = TokenEncrypter('thread', 2, keys=test_keys, key_store=jwt.key_store(test_keys))
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        async def stop_while_encrypting():
+            encrypter.start()
+            encrypting = asyncio.ensure_future(encrypter.encrypt(encrypt_function, payload))
+            ticking = asyncio.ensure_future(tick())
+            await asyncio.sleep(0.01)
+            await encrypter.stop()
+            ticking.cancel()
+            return await encrypting
+
+        self.assertEqual(self.loop.run_until_complete(stop_while_encrypting()), 'token')
+        self.assertGreater(ticks, 5)
+        self.assertIsNone(encrypter.executor)
+
+    def test_unknown_executor(self):
+        with self.assertRaises(ValueError):
+            TokenEncrypter('nonsense')
+
+    def test_reload(self):
+        encrypter = TokenEncrypter('none', keys=test_keys, key_store=jwt.key_store(test_keys))
+        key_store = encrypter.key_store
+        with self.assertRaises(CryptoError):
+            encrypter.reload('{"keys": {}}')
+        self.assertIs(encrypter.key_store, key_store)
+
+        swapped = json.loads(test_keys)
+        private, public = (swapped['keys'][kid] for kid in ('0d6ba9ff8cd6b9dd4514d9a87c50b27d1dd6c5b5',
+                                                            '75dc2ceb6a02246b2909f6b7f7716e409321549d'))
+        private['value'], public['value'] = public['value'], private['value']
+        with self.assertRaisesRegex(CryptoError, 'is not a private key'):
+            encrypter.reload(json.dumps(swapped))
+        self.assertIs(encrypter.key_store, key_store)
+
+        other_purpose = json.loads(test_keys)
+        other_purpose['keys']['75dc2ceb6a02246b2909f6b7f7716e409321549d']['purpose'] = 'submission'
+        with self.assertRaisesRegex(CryptoError, 'No public key'):
+            encrypter.reload(json.dumps(other_purpose))
+        self.assertIs(encrypter.key_store, key_store)
+
+        encrypter.reload(test_keys)
+        self.assertIsNot(encrypter.key_store, key_store)
+
+    def test_current_key_store_follows_reload(self):
+        encrypter = TokenEncrypter('none', keys=test_keys, key_store=jwt.key_store(test_keys))
+        current = CurrentKeyStore(encrypter)
+        self.assertIs(current.keys, encrypter.key_store.keys)
+        encrypter.reload(test_keys)
+        self.assertIs(current.keys, encrypter.key_store.keys)
+        self.assertEqual(current.get_key_for_purpose_and_type('authentication', 'private').kid,
+                         '0d6ba9ff8cd6b9dd4514d9a87c50b27d1dd6c5b5')
+
+    def test_reload_from_changed_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as keys_file:
+            keys_file.write(test_keys)
+            keys_file.flush()
+            encrypter = TokenEncrypter('none', keys=test_keys, key_store=jwt.key_store(test_keys),
+                                       keys_file=keys_file.name, reload_interval=0.01)
+            key_store = encrypter.key_store
+
+            async def change_keys_file():
+                encrypter.start()
+                await asyncio.sleep(0.02)
+                os.utime(keys_file.name, (time.time() + 10, time.time() + 10))
+                await asyncio.sleep(0.05)
+                await encrypter.stop()
+
+            self.loop.run_until_complete(change_keys_file())
+        self.assertIsNot(encrypter.key_store, key_store)
+
+
+class TestCachedKeyStore(TestCase):
+
+    def test_keys_parsed_once(self):
+        key_store = jwt.key_store(test_keys)
+        self.assertIsInstance(key_store, CachedKeyStore)
+        private_key = key_store.get_key_for_purpose_and_type('authentication', 'private')
+        self.assertEqual(private_key.kid, '0d6ba9ff8cd6b9dd4514d9a87c50b27d1dd6c5b5')
+        self.assertIs(private_key.as_jwk(), private_key.as_jwk())
+        self.assertIs(private_key.as_jwk().get_op_key('sign'), private_key.as_jwk().get_op_key('sign'))
+        self.assertIsNone(key_store.get_key_for_purpose_and_type('submission', 'private'))
+
+    def test_op_keys_kept_after_first_use(self):
+        private_jwk = jwt.key_store(test_keys).get_key_for_purpose_and_type('authentication', 'private').as_jwk()
+        sign_key = private_jwk.get_op_key('sign')
+        with mock.patch.object(jwk.JWK, 'get_op_key', side_effect=AssertionError('key built again')):
+            self.assertIs(private_jwk.get_op_key('sign'), sign_key)
+
+    def test_same_lookups_as_key_store(self):
+        secrets = json.loads(test_keys)
+        cached, plain = CachedKeyStore(secrets), KeyStore(secrets)
+        for purpose, key_type in (('authentication', 'public'), ('authentication', 'private')):
+            self.assertEqual(cached.get_key_for_purpose_and_type(purpose, key_type).kid,
+                             plain.get_key_for_purpose_and_type(purpose, key_type).kid)
+        with self.assertRaises(InvalidTokenException):
+            cached.get_public_key_by_kid('authentication', '0d6ba9ff8cd6b9dd4514d9a87c50b27d1dd6c5b5')
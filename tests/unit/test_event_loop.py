@@ -0,0 +1,39 @@
+import asyncio
+
+from unittest import TestCase, mock
+
+from app import event_loop
+from app.app_logging import logger_initial_config
+
+
+class TestEventLoop(TestCase):
+
+    def setUp(self):
+        logger_initial_config()
+
+    def tearDown(self):
+        asyncio.set_event_loop_policy(None)
+
+    def test_install(self):
+        event_loop.install('asyncio')
+        self.assertIsInstance(asyncio.get_event_loop_policy(), asyncio.DefaultEventLoopPolicy)
+        loop = asyncio.new_event_loop()
+        self.assertEqual(event_loop.loop_name(loop), 'asyncio')
+        loop.close()
+
+    def test_missing_loop_falls_back(self):
+        with mock.patch.dict(event_loop.policy_factories, {'uvloop': mock.Mock(side_effect=ImportError)}):
+            with self.assertLogs('respondent-home', 'WARNING') as cm:
+                event_loop.install('uvloop')
+        self.assertIn('configured event loop not installed', cm.output[0])
+        self.assertIsInstance(asyncio.get_event_loop_policy(), asyncio.DefaultEventLoopPolicy)
+
+    def test_unknown_loop(self):
+        with self.assertRaises(ValueError):
+            event_loop.make_policy('tokio')
+
+    def test_http_parser(self):
+        with mock.patch('aiohttp.http_parser.HttpRequestParser', mock.Mock()):
+            self.assertEqual(event_loop.http_parser_name(), 'c')
+        with mock.patch('aiohttp.http_parser.HttpRequestParser', event_loop.http_parser.HttpRequestParserPy):
+            self.assertEqual(event_loop.http_parser_name(), 'python')
@@ -0,0 +1,84 @@
+import asyncio
+
+from unittest import mock
+
+from aiohttp.test_utils import unittest_run_loop
+from aioresponses import aioresponses
+
+from app.health import HealthChecker, parse_timeouts
+
+from . import AsyncTestCase, RHTestCase
+
+
+async def healthy():
+    pass
+
+
+async def unhealthy():
+    raise ConnectionError()
+
+
+async def slow():
+    await asyncio.sleep(10)
+
+
+class TestHealthChecker(AsyncTestCase):
+
+    def test_check_concurrently_with_timeouts(self):
+        checker = HealthChecker({'A': healthy, 'B': unhealthy, 'C': slow, 'D': slow},
+                                timeout=0.1, timeouts={'D': 0.01})
+        statuses = self.loop.run_until_complete(checker.check())
+        self.assertTrue(statuses['A'].healthy)
+        self.assertEqual(statuses['B'].error, 'ConnectionError')
+        self.assertEqual(statuses['C'].error, 'timed out')
+        self.assertLess(statuses['D'].latency, statuses['C'].latency)
+        self.assertFalse(checker.ready)
+
+    def test_ready(self):
+        checker = HealthChecker({'A': healthy, 'B': healthy})
+        self.assertFalse(checker.ready)
+        self.loop.run_until_complete(checker.check())
+        self.assertTrue(checker.ready)
+        self.assertEqual(checker.report()['services']['A']['status'], 'UP')
+
+    def test_stale_results_not_ready(self):
+        checker = HealthChecker({'A': healthy}, ttl=30)
+        self.loop.run_until_complete(checker.check())
+        with mock.patch('app.health.time.monotonic', return_value=checker.statuses['A'].checked + 31):
+            self.assertFalse(checker.ready)
+
+    def test_background_refresh(self):
+        probe = mock.Mock(side_effect=healthy)
+        checker = HealthChecker({'A': probe}, interval=0.01)
+
+        async def refresh_for_a_while():
+            checker.start()
+            await asyncio.sleep(0.05)
+            await checker.stop()
+
+        self.loop.run_until_complete(refresh_for_a_while())
+        self.assertGreater(probe.call_count, 1)
+        self.assertTrue(checker.ready)
+
+    def test_parse_timeouts(self):
+        self.assertEqual(parse_timeouts('RHSVC_URL=1, REDIS=0.5'), {'RHSVC_URL': 1.0, 'REDIS': 0.5})
+        self.assertEqual(parse_timeouts(''), {})
+
+
+class TestInfoCheck(RHTestCase):
+
+    @unittest_run_loop
+    async def test_get_info_check_reports_cached_services(self):
+        with aioresponses(passthrough=[str(self.server._root)]) as mocked:
+            for service_url in self.app.service_status_urls.values():
+                mocked.get(service_url)
+            await self.app.health_checker.check()
+
+            response = await self.client.request('GET', '/info?check')
+            self.assertEqual(len(mocked.requests), 1)
+
+        info = await response.json()
+        self.assertTrue(info['ready'])
+        self.assertEqual(set(info['services']), set(self.app.service_status_urls))
+        self.assertEqual(info['services']['RHSVC_URL']['status'], 'UP')
+        self.assertIn('latency_ms', info['services']['RHSVC_URL'])
@@ -0,0 +1,136 @@
+import asyncio
+
+from unittest import mock
+
+from aiohttp.client_exceptions import ClientResponseError
+from aiohttp.test_utils import unittest_run_loop
+from aioresponses import aioresponses
+
+from app import config, json_codec
+from app.idempotency import IN_FLIGHT, IdempotentSubmissions, idempotency_key
+from app.request import BackgroundRequest
+from app.utils import RHService
+
+from . import AsyncTestCase, FakeRedisPool, RHTestCase
+
+
+class Submit:
+    """Counts submissions, answering after a pause with a result or an error"""
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.error:
+            raise self.error
+        return self.result
+
+
+class TestIdempotentSubmissions(AsyncTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.request = {'client_ip': None, 'client_id': 'client', 'trace': None}
+
+    def test_idempotency_key(self):
+        key = idempotency_key('fulfilment_sms', 'client', '447700900345', ['UACHHT1'])
+        self.assertEqual(key, idempotency_key('fulfilment_sms', 'client', '447700900345', ['UACHHT1']))
+        self.assertNotEqual(key, idempotency_key('fulfilment_sms', 'client', '447700900346', ['UACHHT1']))
+        self.assertNotEqual(key, idempotency_key('fulfilment_sms', 'other', '447700900345', ['UACHHT1']))
+        self.assertNotEqual(key, idempotency_key('fulfilment_post', 'client', '447700900345', ['UACHHT1']))
+
+    def test_concurrent_repeats_share_submission(self):
+        submissions = IdempotentSubmissions()
+        submit = Submit({'caseId': 'a'})
+        results = self.run_async(asyncio.gather(*(submissions.run(self.request, 'case_create', 'key', submit)
+                                                  for _ in range(3))))
+        self.assertEqual(results, [{'caseId': 'a'}] * 3)
+        self.assertEqual(submit.calls, 1)
+        self.assertEqual(submissions.in_flight, {})
+
+    def test_recent_outcome_replayed(self):
+        submissions = IdempotentSubmissions()
+        submit = Submit({'caseId': 'a'})
+        self.run_async(submissions.run(self.request, 'case_create', 'key', submit))
+        self.assertEqual(self.run_async(submissions.run(self.request, 'case_create', 'key', submit)), {'caseId': 'a'})
+        self.run_async(submissions.run(self.request, 'case_create', 'other', submit))
+        self.assertEqual(submit.calls, 2)
+
+    def test_rejection_replayed(self):
+        submissions = IdempotentSubmissions()
+        submit = Submit(error=ClientResponseError(None, (), status=400, message='Bad Request'))
+        for _ in range(2):
+            with self.assertRaises(ClientResponseError) as cm:
+                self.run_async(submissions.run(self.request, 'fulfilment_sms', 'key', submit))
+            self.assertEqual(cm.exception.status, 400)
+        self.assertEqual(submit.calls, 1)
+
+    def test_unavailable_tried_again(self):
+        submissions = IdempotentSubmissions(redis_pool=FakeRedisPool())
+        submit = Submit(error=ClientResponseError(None, (), status=503))
+        for _ in range(2):
+            with self.assertRaises(ClientResponseError):
+                self.run_async(submissions.run(self.request, 'fulfilment_sms', 'key', submit))
+        self.assertEqual(submit.calls, 2)
+        self.assertEqual(submissions.redis_pool.values, {})
+
+    def test_disabled(self):
+        submissions = IdempotentSubmissions(ttl=0)
+        submit = Submit()
+        for _ in range(2):
+            self.run_async(submissions.run(self.request, 'fulfilment_sms', 'key', submit))
+        self.assertEqual(submit.calls, 2)
+
+    def test_shared_through_redis(self):
+        pool = FakeRedisPool()
+        submit = Submit({'caseId': 'a'})
+        self.run_async(IdempotentSubmissions(redis_pool=pool).run(self.request, 'case_create', 'key', submit))
+        other_worker = IdempotentSubmissions(redis_pool=pool)
+        self.assertEqual(self.run_async(other_worker.run(self.request, 'case_create', 'key', submit)),
+                         {'caseId': 'a'})
+        self.assertEqual(submit.calls, 1)
+
+    def test_waits_for_submission_in_another_worker(self):
+        pool = FakeRedisPool()
+        pool.values['idempotency:key'] = IN_FLIGHT.encode('utf-8')
+        submissions = IdempotentSubmissions(redis_pool=pool, poll_interval=0.01)
+        submit = Submit()
+
+        async def complete():
+            await asyncio.sleep(0.05)
+            pool.values['idempotency:key'] = json_codec.dumps({'state': 'done', 'result': 'sent'}).encode('utf-8')
+
+        result, _ = self.run_async(asyncio.gather(submissions.run(self.request, 'webform', 'key', submit), complete()))
+        self.assertEqual(result, 'sent')
+        self.assertEqual(submit.calls, 0)
+
+    def test_gives_up_waiting(self):
+        pool = FakeRedisPool()
+        pool.values['idempotency:key'] = IN_FLIGHT.encode('utf-8')
+        submissions = IdempotentSubmissions(redis_pool=pool, wait=0.05, poll_interval=0.01)
+        submit = Submit('sent')
+        self.assertEqual(self.run_async(submissions.run(self.request, 'webform', 'key', submit)), 'sent')
+        self.assertEqual(submit.calls, 1)
+
+
+class TestIdempotentFulfilments(RHTestCase):
+
+    async def get_application(self):
+        with mock.patch.object(config.TestingConfig, 'IDEMPOTENCY_TTL', '60'):
+            return await super().get_application()
+
+    @unittest_run_loop
+    async def test_repeated_sms_request_sent_once(self):
+        request = BackgroundRequest(self.app, {'client_ip': '1.2.3.4, 10.0.0.1, 10.0.0.2', 'client_id': 'client'})
+        url = f"{self.app['RHSVC_URL']}/cases/{self.case_id}/fulfilments/sms"
+        with aioresponses(passthrough=[str(self.server._root)]) as mocked:
+            mocked.post(url, repeat=True)
+            await asyncio.gather(*(RHService.request_fulfilment_sms(request, self.case_id, '447700900345',
+                                                                    ['UACHHT1']) for _ in range(2)))
+            await RHService.request_fulfilment_sms(request, self.case_id, '447700900345', ['UACHHT1'])
+            (_, sent), = mocked.requests.items()
+        self.assertEqual(len(sent), 1)
+        self.assertIn('Idempotency-Key', sent[0].kwargs['headers'])
@@ -12,6 +12,8 @@ class TestInfo(RHTestCase):
         self.assertEqual(response.status, 200)
         self.assertIn('name', json)
         self.assertIn('version', json)
+        self.assertEqual(json['event_loop'], 'asyncio')
+        self.assertIn(json['http_parser'], ('c', 'python'))
 
     @unittest_run_loop
     async def test_get_info_check(self):
@@ -0,0 +1,63 @@
+import datetime
+
+from unittest import TestCase, mock
+
+from app import json_codec
+
+
+class TestJsonCodec(TestCase):
+
+    def installed_codecs(self):
+        for name in json_codec.codec_factories:
+            try:
+                yield json_codec.make_codec(name)
+            except ImportError:
+                continue
+
+    def test_make_codec_stdlib(self):
+        codec = json_codec.make_codec('json')
+        self.assertEqual(codec.name, 'json')
+
+    def test_make_codec_unknown(self):
+        with self.assertRaises(ValueError):
+            json_codec.make_codec('yaml')
+
+    def test_make_codec_default_is_installed(self):
+        self.assertIn(json_codec.make_codec().name, json_codec.codec_factories)
+
+    def test_round_trip(self):
+        data = {'caseId': 'abc', 'fulfilmentCodes': ['P_OR_H1'], 'nested': {'count': 3, 'text': 'Tŷ'}}
+        for codec in self.installed_codecs():
+            self.assertEqual(codec.loads(codec.dumps(data)), data, codec.name)
+            self.assertEqual(codec.loads(codec.dumps_bytes(data)), data, codec.name)
+            self.assertIsInstance(codec.dumps(data), str)
+            self.assertIsInstance(codec.dumps_bytes(data), bytes)
+
+    def test_default_used_for_unknown_types(self):
+        data = {'value': object}
+        for codec in self.installed_codecs():
+            self.assertEqual(codec.loads(codec.dumps(data, default=lambda obj: 'converted')), {'value': 'converted'})
+
+    def test_dumps_ignores_stdlib_keyword_arguments(self):
+        codec = json_codec.make_codec('json')
+        self.assertEqual(codec.dumps({'a': 1}, cls=None, indent=None, ensure_ascii=True), '{"a": 1}')
+
+    def test_configure(self):
+        try:
+            self.assertEqual(json_codec.configure('json').name, 'json')
+            self.assertEqual(json_codec.dumps({'a': datetime.date(2021, 3, 21)}, default=str), '{"a": "2021-03-21"}')
+            self.assertEqual(json_codec.loads('{"a": 1}'), {'a': 1})
+        finally:
+            json_codec.configure()
+
+    def test_configure_missing_library_falls_back(self):
+        def missing():
+            raise ImportError
+
+        try:
+            with mock.patch.dict(json_codec.codec_factories, {'orjson': missing}):
+                codec = json_codec.configure('orjson')
+            self.assertNotEqual(codec.name, 'orjson')
+            self.assertIs(json_codec.codec, codec)
+        finally:
+            json_codec.configure()
@@ -0,0 +1,180 @@
+import asyncio
+import os
+import tempfile
+
+from app.app_logging import logger_initial_config
+from app.lookup_cache import LookupCache
+from app.normalise import postcode_sector
+from app.request import BackgroundRequest
+from app.shared_cache import SharedCache
+
+from . import AsyncTestCase, FakeClock, FakeRedisPool
+
+
+class Lookup:
+    """Counts lookups, answering after a pause"""
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self, request):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.error:
+            raise self.error
+        return self.result
+
+
+class TestLookupCache(AsyncTestCase):
+
+    def setUp(self):
+        super().setUp()
+        logger_initial_config()
+        self.clock = FakeClock(1000.0)
+        self.request = BackgroundRequest({})
+
+    def test_cached_until_expiry(self):
+        cache = LookupCache('test', ttl=60, clock=self.clock)
+        lookup = Lookup(['a'])
+        self.assertEqual(self.run_async(cache.fetch(self.request, 'key', lookup)), ['a'])
+        self.assertEqual(self.run_async(cache.fetch(self.request, 'key', lookup)), ['a'])
+        self.assertEqual(lookup.calls, 1)
+        self.clock.now += 61
+        self.run_async(cache.fetch(self.request, 'key', lookup))
+        self.assertEqual(lookup.calls, 2)
+
+    def test_concurrent_lookups_share_call(self):
+        cache = LookupCache('test', ttl=60)
+        lookup = Lookup(['a'])
+        results = self.run_async(asyncio.gather(*(cache.fetch(self.request, 'key', lookup) for _ in range(3))))
+        self.assertEqual(results, [['a']] * 3)
+        self.assertEqual(lookup.calls, 1)
+
+    def test_cancelled_fetch_leaves_lookup_running(self):
+        cache = LookupCache('test', ttl=60)
+        lookup = Lookup(['a'])
+        leader = asyncio.ensure_future(cache.fetch(self.request, 'key', lookup))
+        waiting = asyncio.ensure_future(cache.fetch(self.request, 'key', lookup))
+        self.run_async(asyncio.sleep(0))
+        leader.cancel()
+        self.assertEqual(self.run_async(waiting), ['a'])
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(lookup.calls, 1)
+        self.assertEqual(cache.in_flight, {})
+        self.assertIn('key', cache.entries)
+
+    def test_failures_not_cached(self):
+        cache = LookupCache('test', ttl=60)
+        lookup = Lookup(error=ConnectionRefusedError())
+        for _ in range(2):
+            with self.assertRaises(ConnectionRefusedError):
+                self.run_async(cache.fetch(self.request, 'key', lookup))
+        self.assertEqual(lookup.calls, 2)
+
+    def test_least_recently_used_dropped(self):
+        cache = LookupCache('test', ttl=60, capacity=2)
+        for key in ['a', 'b', 'a', 'c']:
+            self.run_async(cache.fetch(self.request, key, Lookup(key)))
+        self.assertEqual(list(cache.entries), ['a', 'c'])
+
+    def test_shared_through_redis(self):
+        pool = FakeRedisPool()
+        lookup = Lookup({'addresses': []})
+        self.run_async(LookupCache('test', ttl=60, redis_pool=pool).fetch(self.request, 'key', lookup))
+        self.assertEqual(list(pool.values), ['lookup_cache:test:key'])
+        other_worker = LookupCache('test', ttl=60, redis_pool=pool)
+        self.assertEqual(self.run_async(other_worker.fetch(self.request, 'key', lookup)), {'addresses': []})
+        self.assertEqual(lookup.calls, 1)
+
+    def test_shared_between_workers_on_host(self):
+        path = tempfile.mktemp(suffix='.cache')
+        shared = SharedCache(path, slots=16, slot_size=1024)
+        other_shared = SharedCache(path, slots=16, slot_size=1024)
+        try:
+            pool = FakeRedisPool()
+            lookup = Lookup({'addresses': []})
+            self.run_async(LookupCache('test', ttl=60, redis_pool=pool, shared=shared).fetch(self.request, 'key', lookup))
+            pool.values.clear()
+            other_worker = LookupCache('test', ttl=60, redis_pool=pool, shared=other_shared)
+            self.assertEqual(self.run_async(other_worker.fetch(self.request, 'key', lookup)), {'addresses': []})
+            self.assertEqual(lookup.calls, 1)
+            self.assertIn('key', other_worker.entries)
+        finally:
+            shared.close()
+            other_shared.close()
+            os.remove(path)
+
+    def test_stale_while_revalidate(self):
+        cache = LookupCache('test', ttl=60, stale_ttl=600, clock=self.clock)
+        self.run_async(cache.fetch(self.request, 'key', Lookup('old')))
+        self.clock.now += 61
+
+        lookup = Lookup('new')
+        stale = self.run_async(asyncio.gather(*(cache.fetch(self.request, 'key', lookup) for _ in range(2))))
+        self.assertEqual(stale, ['old', 'old'])
+        self.run_async(asyncio.sleep(0.05))
+        self.assertEqual(lookup.calls, 1)
+        self.assertEqual(self.run_async(cache.fetch(self.request, 'key', lookup)), 'new')
+
+        # Too old to give while refreshing
+        self.clock.now += 661
+        self.assertEqual(self.run_async(cache.fetch(self.request, 'key', Lookup('newer'))), 'newer')
+
+    def test_stale_kept_when_refresh_fails(self):
+        cache = LookupCache('test', ttl=60, stale_ttl=600, clock=self.clock)
+        self.run_async(cache.fetch(self.request, 'key', Lookup('old')))
+        self.clock.now += 61
+        with self.assertLogs('respondent-home', 'WARNING'):
+            self.assertEqual(self.run_async(cache.fetch(self.request, 'key', Lookup(error=ConnectionRefusedError()))), 'old')
+            self.run_async(asyncio.sleep(0.05))
+        self.assertEqual(cache.refreshing, {})
+        self.assertEqual(self.run_async(cache.fetch(self.request, 'key', Lookup('new'))), 'old')
+        self.run_async(asyncio.sleep(0.05))
+        self.assertEqual(self.run_async(cache.fetch(self.request, 'key', Lookup('newer'))), 'new')
+
+    def test_refresh_for_background_request(self):
+        cache = LookupCache('test', ttl=60, stale_ttl=600, clock=self.clock)
+        self.run_async(cache.fetch(self.request, 'key', Lookup('old')))
+        self.clock.now += 61
+        requests = []
+
+        async def lookup(request):
+            requests.append(request)
+            return 'new'
+
+        self.run_async(cache.fetch(self.request, 'key', lookup))
+        self.run_async(asyncio.sleep(0.01))
+        self.assertIsInstance(requests[0], BackgroundRequest)
+        self.assertIsNot(requests[0], self.request)
+
+    def test_refresh_stopped_on_close(self):
+        cache = LookupCache('test', ttl=60, stale_ttl=600, clock=self.clock)
+        self.run_async(cache.fetch(self.request, 'key', Lookup('old')))
+        self.clock.now += 61
+        lookup = Lookup('new')
+        self.assertEqual(self.run_async(cache.fetch(self.request, 'key', lookup)), 'old')
+        refresh = cache.refreshing['key']
+        self.run_async(cache.close())
+        self.assertTrue(refresh.cancelled())
+        self.assertEqual(cache.refreshing, {})
+        self.assertEqual(cache.in_flight, {})
+
+    def test_bucketed_in_redis(self):
+        pool = FakeRedisPool()
+        cache = LookupCache('test', ttl=60, stale_ttl=600, bucket=postcode_sector, redis_pool=pool, clock=self.clock)
+        for postcode in ['SW1A 1AA', 'SW1A 1AB', 'SW1A 2AA']:
+            self.run_async(cache.fetch(self.request, postcode, Lookup(postcode)))
+        self.assertEqual(sorted(pool.values['lookup_cache:test:SW1A 1']), ['SW1A 1AA', 'SW1A 1AB'])
+        self.assertEqual(pool.expiries['lookup_cache:test:SW1A 2'], 660)
+
+        other_worker = LookupCache('test', ttl=60, stale_ttl=600, bucket=postcode_sector, redis_pool=pool,
+                                   clock=self.clock)
+        self.assertEqual(self.run_async(other_worker.fetch(self.request, 'SW1A 1AB', Lookup('new'))), 'SW1A 1AB')
+
+    def test_disabled(self):
+        cache = LookupCache('test', ttl=0)
+        lookup = Lookup()
+        for _ in range(2):
+            self.run_async(cache.fetch(self.request, 'key', lookup))
+        self.assertEqual(lookup.calls, 2)
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+import time
+
+from app import loop_monitor
+from app.app_logging import logger_initial_config
+from app.loop_monitor import LoopMonitor, SlowCallbackHandler
+
+from . import AsyncTestCase
+
+
+def block_loop(seconds):
+    time.sleep(seconds)
+
+
+class TestLoopMonitor(AsyncTestCase):
+
+    def setUp(self):
+        super().setUp()
+        logger_initial_config()
+
+    def run_monitor(self, monitor, blocking_seconds):
+        async def run():
+            monitor.start()
+            await asyncio.sleep(0.02)
+            block_loop(blocking_seconds)
+            await asyncio.sleep(0.05)
+            await monitor.stop()
+
+        self.loop.run_until_complete(run())
+
+    def test_lag_over_threshold_logged(self):
+        before = loop_monitor.loop_lag.count()
+        with self.assertLogs('respondent-home', 'WARNING') as cm:
+            self.run_monitor(LoopMonitor(interval=0.01, threshold=0.05), 0.1)
+        self.assertEqual(cm.records[0].message, 'event loop lag over threshold')
+        self.assertGreaterEqual(cm.records[0].lag_ms, 50)
+        self.assertGreater(loop_monitor.loop_lag.count(), before)
+
+    def test_watchdog_logs_blocking_stack(self):
+        before = loop_monitor.loop_blocked.get()
+        with self.assertLogs('respondent-home', 'ERROR') as cm:
+            self.run_monitor(LoopMonitor(interval=0.01, threshold=1, watchdog_timeout=0.05), 0.2)
+        record = cm.records[0]
+        self.assertEqual(record.message, 'event loop blocked')
+        self.assertIn('block_loop', record.stack)
+        self.assertEqual(loop_monitor.loop_blocked.get(), before + 1)
+
+    def test_blocking_frame(self):
+        stack = [
+            loop_monitor.traceback.FrameSummary(loop_monitor.app_dir + 'utils.py', 190, 'call_questionnaire'),
+            loop_monitor.traceback.FrameSummary('/usr/lib/python3.6/json/encoder.py', 199, 'encode'),
+        ]
+        self.assertEqual(loop_monitor.blocking_frame(stack), 'app/utils.py:190 call_questionnaire')
+
+    def test_slow_callback_counted(self):
+        before = loop_monitor.slow_callbacks.get()
+        handler = SlowCallbackHandler()
+        handler.emit(logging.LogRecord('asyncio', logging.WARNING, __file__, 1, 'Executing %s took %.3f seconds',
+                                       ('<Handle>', 0.2), None))
+        self.assertEqual(loop_monitor.slow_callbacks.get(), before + 1)
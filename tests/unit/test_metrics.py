@@ -0,0 +1,185 @@
+import asyncio
+import os
+import tempfile
+
+from unittest import TestCase, mock
+
+from aiohttp.test_utils import unittest_run_loop
+from aioresponses import aioresponses
+
+from app import json_codec, metrics
+from app.metrics import Counter, Histogram, Registry, WorkerMetrics
+
+from . import AsyncTestCase, RHTestCase
+
+
+class TestRegistry(TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_render_counter(self):
+        counter = self.registry.counter('things_total', 'Things.', ('kind',))
+        counter.inc('a')
+        counter.inc('a')
+        counter.inc('b "quoted"', amount=3)
+        self.assertEqual(self.registry.render(), '\n'.join([
+            '# HELP rhui_things_total Things.',
+            '# TYPE rhui_things_total counter',
+            'rhui_things_total{kind="a"} 2',
+            'rhui_things_total{kind="b \\"quoted\\""} 3',
+            '',
+        ]))
+
+    def test_render_gauge(self):
+        gauge = self.registry.gauge('queue_length', 'Queued things.')
+        gauge.set(5)
+        gauge.set(2)
+        self.assertEqual(self.registry.render(), '\n'.join([
+            '# HELP rhui_queue_length Queued things.',
+            '# TYPE rhui_queue_length gauge',
+            'rhui_queue_length 2',
+            '',
+        ]))
+
+    def test_render_histogram(self):
+        histogram = self.registry.histogram('wait_seconds', 'Waits.', ('route',), buckets=(0.1, 1))
+        histogram.observe(0.05, 'Start:get')
+        histogram.observe(0.1, 'Start:get')
+        histogram.observe(2.5, 'Start:get')
+        self.assertEqual(self.registry.render(), '\n'.join([
+            '# HELP rhui_wait_seconds Waits.',
+            '# TYPE rhui_wait_seconds histogram',
+            'rhui_wait_seconds_bucket{route="Start:get",le="0.1"} 2',
+            'rhui_wait_seconds_bucket{route="Start:get",le="1"} 2',
+            'rhui_wait_seconds_bucket{route="Start:get",le="+Inf"} 3',
+            'rhui_wait_seconds_sum{route="Start:get"} 2.65',
+            'rhui_wait_seconds_count{route="Start:get"} 3',
+            '',
+        ]))
+
+    def test_register_duplicate(self):
+        self.registry.register(Counter('rhui_things_total', 'Things.'))
+        with self.assertRaises(ValueError):
+            self.registry.register(Histogram('rhui_things_total', 'Things.'))
+
+    def test_combine(self):
+        snapshots = []
+        for pid, count in ((101, 2), (102, 3)):
+            registry = Registry()
+            registry.counter('things_total', 'Things.', ('kind',)).inc('a', amount=count)
+            registry.gauge('queue_length', 'Queued things.').set(count)
+            registry.histogram('wait_seconds', 'Waits.', buckets=(1,)).observe(0.5 * count)
+            snapshots.append((pid, json_codec.loads(json_codec.dumps(registry.snapshot()))))
+        combined = registry.combine(snapshots, stopped={102})
+        self.assertEqual(combined.render(), '\n'.join([
+            '# HELP rhui_things_total Things.',
+            '# TYPE rhui_things_total counter',
+            'rhui_things_total{kind="a"} 5',
+            '# HELP rhui_queue_length Queued things.',
+            '# TYPE rhui_queue_length gauge',
+            'rhui_queue_length{pid="101"} 2',
+            '# HELP rhui_wait_seconds Waits.',
+            '# TYPE rhui_wait_seconds histogram',
+            'rhui_wait_seconds_bucket{le="1"} 1',
+            'rhui_wait_seconds_bucket{le="+Inf"} 2',
+            'rhui_wait_seconds_sum 2.5',
+            'rhui_wait_seconds_count 2',
+            '',
+        ]))
+
+    def test_upstream_service(self):
+        app = {'RHSVC_URL': 'http://rhsvc', 'ADDRESS_INDEX_SVC_URL': 'http://ai', 'AD_LOOK_UP_SVC_URL': 'http://ad'}
+        self.assertEqual(metrics.upstream_service(app, 'http://rhsvc/cases/uac/abc'), 'rhsvc')
+        self.assertEqual(metrics.upstream_service(app, 'http://ai/addresses/rh/postcode/AB1'), 'aims')
+        self.assertEqual(metrics.upstream_service(app, 'http://ad/v1/locations'), 'ad_lookup')
+        self.assertEqual(metrics.upstream_service(app, 'http://elsewhere'), 'other')
+
+
+class TestWorkerMetrics(AsyncTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.registries = []
+        for _ in range(3):
+            registry = Registry()
+            registry.counter('things_total', 'Things.')
+            registry.gauge('queue_length', 'Queued things.')
+            self.registries.append(registry)
+
+    def tearDown(self):
+        self.directory.cleanup()
+        super().tearDown()
+
+    def worker(self, registry, pid, count):
+        registry.metrics['rhui_things_total'].inc(amount=count)
+        registry.metrics['rhui_queue_length'].set(count)
+        return WorkerMetrics(self.directory.name, registry=registry, pid=pid)
+
+    def test_render_every_worker(self):
+        serving = self.worker(self.registries[0], os.getpid(), 1)
+        for registry, pid, count in ((self.registries[1], 101, 2), (self.registries[2], 102, 4)):
+            other = self.worker(registry, pid, count)
+            other.write(registry.snapshot())
+        with mock.patch('app.metrics.process_stopped', lambda pid: pid == 102):
+            rendered = self.run_async(serving.render())
+        self.assertIn('rhui_things_total 7', rendered)
+        self.assertIn(f'rhui_queue_length{{pid="{os.getpid()}"}} 1', rendered)
+        self.assertIn('rhui_queue_length{pid="101"} 2', rendered)
+        self.assertNotIn('pid="102"', rendered)
+
+    def test_written_when_stopped(self):
+        worker = self.worker(self.registries[0], 101, 3)
+        worker.interval = 0.01
+
+        async def run():
+            worker.start()
+            await asyncio.sleep(0.05)
+            self.assertEqual(worker.read()[0][1]['rhui_things_total'], [[[], 3]])
+            worker.registry.metrics['rhui_things_total'].inc()
+            await worker.stop()
+
+        self.run_async(run())
+        self.assertEqual(worker.read(), [(101, {'rhui_things_total': [[[], 4]], 'rhui_queue_length': [[[], 3]]})])
+        metrics.clear_worker_metrics(self.directory.name)
+        self.assertEqual(worker.read(), [])
+
+
+class TestMetricsEndpoint(RHTestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.registry.reset()
+
+    @unittest_run_loop
+    async def test_get_metrics(self):
+        await self.client.request('GET', '/info')
+        response = await self.client.request('GET', '/metrics')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.headers['Content-Type'], metrics.registry.content_type)
+        self.assertIn('rhui_http_requests_total{route="Info:get",status="200"} 1', await response.text())
+
+    @unittest_run_loop
+    async def test_unmatched_route(self):
+        await self.client.request('GET', '/not-a-page')
+        self.assertEqual(metrics.http_request_duration.count(metrics.unmatched_route), 1)
+
+    @unittest_run_loop
+    async def test_upstream_retries_and_fallback(self):
+        with aioresponses(passthrough=[str(self.server._root)]) as mocked:
+            mocked.get(self.rhsvc_url, status=503)
+            mocked.get(self.rhsvc_url, status=503)
+            mocked.get(self.rhsvc_url, payload=self.uac_json_e)
+
+            response = await self.client.request('POST',
+                                                 self.post_start_en,
+                                                 allow_redirects=False,
+                                                 data=self.start_data_valid)
+
+        self.assertEqual(response.status, 302)
+        self.assertEqual(metrics.http_requests.get('Start:post', '302'), 1)
+        self.assertEqual(metrics.upstream_requests.get('rhsvc', 'pooled', '503'), 2)
+        self.assertEqual(metrics.upstream_requests.get('rhsvc', 'basic', '200'), 1)
+        self.assertEqual(metrics.upstream_request_duration.count('rhsvc', 'pooled', '2'), 1)
+        self.assertEqual(metrics.upstream_fallbacks.get('rhsvc'), 1)
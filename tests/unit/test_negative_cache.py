@@ -0,0 +1,110 @@
+import uuid
+
+from unittest import TestCase, mock
+
+from aiohttp.test_utils import unittest_run_loop
+from aioresponses import aioresponses
+
+from app import config
+from app.negative_cache import BloomFilter, NegativeCache
+
+from . import AsyncTestCase, FakeClock, FakeRedisPool, RHTestCase
+
+
+class TestBloomFilter(TestCase):
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        values = [uuid.uuid4().hex for _ in range(1000)]
+        for value in values:
+            bloom.add(value)
+        self.assertTrue(all(value in bloom for value in values))
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for _ in range(1000):
+            bloom.add(uuid.uuid4().hex)
+        false_positives = sum(uuid.uuid4().hex in bloom for _ in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_merge_redis_bitmap(self):
+        bloom, other = BloomFilter(1000), BloomFilter(1000)
+        bloom.add('a')
+        other.add('b')
+        bloom.merge(bytes(other.bits).rstrip(b'\0'))
+        self.assertIn('a', bloom)
+        self.assertIn('b', bloom)
+        self.assertEqual(len(bloom.bits), bloom.size // 8)
+
+
+class TestNegativeCache(AsyncTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock(1000.0)
+
+    def test_in_process(self):
+        cache = NegativeCache('test', ttl=60, capacity=100, clock=self.clock)
+        self.assertFalse(self.run_async(cache.contains('a')))
+        self.run_async(cache.add('a'))
+        self.assertTrue(self.run_async(cache.contains('a')))
+        self.assertFalse(self.run_async(cache.contains('b')))
+        self.clock.now += 61
+        self.assertFalse(self.run_async(cache.contains('a')))
+
+    def test_filters_rotate(self):
+        cache = NegativeCache('test', ttl=60, capacity=100, clock=self.clock)
+        self.run_async(cache.add('a'))
+        self.clock.now += 120
+        self.run_async(cache.add('b'))
+        self.assertFalse(cache._might_contain('a'))
+        self.assertEqual(len(cache.filters), 1)
+
+    def test_disabled(self):
+        cache = NegativeCache('test', ttl=0)
+        self.run_async(cache.add('a'))
+        self.assertFalse(self.run_async(cache.contains('a')))
+
+    def test_shared_through_redis(self):
+        pool = FakeRedisPool()
+        cache = NegativeCache('test', ttl=60, capacity=100, redis_pool=pool, clock=self.clock)
+        other_worker = NegativeCache('test', ttl=60, capacity=100, redis_pool=pool, clock=self.clock)
+
+        self.run_async(cache.add('a'))
+        (sha, numkeys, key, filter_key, ttl, filter_ttl, *offsets), = pool.scripts
+        self.assertEqual((numkeys, key, filter_key), (2, 'test:a', 'test:filter:16'))
+        self.assertEqual((ttl, filter_ttl), (60, 120))
+
+        # Play the script into the fake Redis
+        pool.values[key] = b'1'
+        bitmap = BloomFilter(100)
+        bitmap.add('a', offsets)
+        pool.values[filter_key] = bytes(bitmap.bits)
+
+        self.assertFalse(self.run_async(other_worker.contains('a')))
+        self.run_async(other_worker.refresh())
+        self.assertTrue(self.run_async(other_worker.contains('a')))
+
+        # Redis is the authority once the filter lets a value through
+        del pool.values[key]
+        self.assertFalse(self.run_async(other_worker.contains('a')))
+
+
+class TestInvalidUACCache(RHTestCase):
+
+    async def get_application(self):
+        with mock.patch.object(config.TestingConfig, 'INVALID_UAC_CACHE_TTL', '60'):
+            return await super().get_application()
+
+    @unittest_run_loop
+    async def test_invalid_code_not_looked_up_again(self):
+        with aioresponses(passthrough=[str(self.server._root)]) as mocked:
+            mocked.get(self.rhsvc_url, status=404, repeat=True)
+
+            for _ in range(2):
+                with self.assertLogs('respondent-home', 'WARNING') as cm:
+                    await self.client.request('POST', self.post_start_en, allow_redirects=False,
+                                              data=self.start_data_valid)
+                self.assertLogEvent(cm, 'attempt to use an invalid access code')
+
+            self.assertEqual(len(next(iter(mocked.requests.values()))), 1)
@@ -0,0 +1,78 @@
+from unittest import TestCase
+
+from app import normalise
+
+
+class TestNormalise(TestCase):
+
+    def test_uac(self):
+        self.assertEqual(normalise.uac('abcd efgh ijkl mnop'), 'ABCDEFGHIJKLMNOP')
+        self.assertEqual(normalise.uac(None), '')
+        self.assertTrue(normalise.is_uac('ABCDEFGHIJKLMNOP'))
+        self.assertFalse(normalise.is_uac('ABCDEFGHIJKLMNO'))
+        self.assertFalse(normalise.is_uac('ABCDEFGHIJKLMNO-'))
+
+    def test_postcode(self):
+        self.assertEqual(normalise.postcode(' ex2\t6ga\n'), 'EX26GA')
+        self.assertEqual(normalise.postcode('EX2\u200B6GA\uFEFF'), 'EX26GA')
+        self.assertEqual(normalise.postcode('ＥＸ２ ６ＧＡ'), 'EX26GA')
+        self.assertEqual(normalise.postcode('ÉX2 6GA'), 'EX26GA')
+        self.assertEqual(normalise.postcode(''), '')
+
+    def test_phone_number(self):
+        self.assertEqual(normalise.phone_number('+44 (0)7700-900\u200B345'), '4407700900345')
+        self.assertTrue(normalise.is_digits('07700900345'))
+        self.assertTrue(normalise.is_digits(''))
+        self.assertFalse(normalise.is_digits('07700 900345'))
+        self.assertFalse(normalise.is_digits('0770090034S'))
+
+    def test_name(self):
+        self.assertEqual(normalise.name('  Bob\u200B '), 'Bob')
+        self.assertEqual(normalise.name('\u200B \uFEFF'), '')
+        self.assertEqual(normalise.name('Mary\u200DAnn'), 'Mary\u200DAnn')
+        self.assertEqual(normalise.name(None), '')
+
+    def test_client_ip(self):
+        self.assertEqual(normalise.client_ip('1.2.3.4, 5.6.7.8, 9.10.11.12'), '1.2.3.4')
+        self.assertEqual(normalise.client_ip('0.0.0.0, 1.2.3.4, 5.6.7.8, 9.10.11.12'), '1.2.3.4')
+        self.assertEqual(normalise.client_ip('1.2.3.4,5.6.7.8,9.10.11.12'), '1.2.3.4')
+        self.assertEqual(normalise.client_ip('1.2.3.4, 5.6.7.8'), '')
+        self.assertEqual(normalise.client_ip('1.2.3, 5.6.7.8, 9.10.11.12'), '')
+        self.assertEqual(normalise.client_ip(''), '')
+
+    def test_check_postcode(self):
+        self.assertEqual(normalise.check_postcode('ex26ga'), ('EX2 6GA', None))
+        self.assertEqual(normalise.check_postcode(' '), ('', normalise.EMPTY))
+        self.assertEqual(normalise.check_postcode('EX2-6GA'), ('EX2-6GA', normalise.NOT_ALPHANUMERIC))
+        self.assertEqual(normalise.check_postcode('EX2'), ('EX2', normalise.TOO_SHORT))
+        self.assertEqual(normalise.check_postcode('EX2 6GAAA'), ('EX26GAAA', normalise.TOO_LONG))
+        self.assertEqual(normalise.check_postcode('QQ2 6GA'), ('QQ26GA', normalise.INVALID_FORMAT))
+
+    def test_postcode_sector(self):
+        self.assertEqual(normalise.postcode_sector('SW1A 1AA'), 'SW1A 1')
+        self.assertEqual(normalise.postcode_sector('EX2 6GA'), 'EX2 6')
+
+    def test_check_uk_mobile_number(self):
+        self.assertEqual(normalise.check_uk_mobile_number('+44 (0)7700 900345'), ('447700900345', None))
+        self.assertEqual(normalise.check_uk_mobile_number('07700 900345'), ('447700900345', None))
+        self.assertEqual(normalise.check_uk_mobile_number('0044'), ('', normalise.EMPTY))
+        self.assertEqual(normalise.check_uk_mobile_number('07700 9OO345'), ('077009OO345', normalise.NOT_DIGITS))
+        self.assertEqual(normalise.check_uk_mobile_number('01234 567890'), ('1234567890', normalise.NOT_MOBILE))
+        self.assertEqual(normalise.check_uk_mobile_number('07700 9003456'), ('77009003456', normalise.TOO_LONG))
+        self.assertEqual(normalise.check_uk_mobile_number('07700 90034'), ('770090034', normalise.TOO_SHORT))
+
+    def test_check_uk_mobile_number_international_prefix(self):
+        # As accepted by the web form validator before the checks were shared
+        self.assertEqual(normalise.check_uk_mobile_number('00447700900345'), ('447700900345', None))
+        self.assertEqual(normalise.check_uk_mobile_number('0447700900345'), ('447700900345', None))
+        self.assertEqual(normalise.check_uk_mobile_number('4407700900345'), ('447700900345', None))
+        self.assertEqual(normalise.check_uk_mobile_number('00 7700 900345'), ('447700900345', None))
+
+    def test_check_all(self):
+        postcodes, errors = normalise.check_postcodes(['ex26ga', None, 'EX2', 'ex26ga'])
+        self.assertEqual(postcodes, ['EX2 6GA', '', 'EX2', 'EX2 6GA'])
+        self.assertEqual(errors, [None, normalise.EMPTY, normalise.TOO_SHORT, None])
+
+        numbers, errors = normalise.check_uk_mobile_numbers(iter([7700900345, '07700 900345', '']))
+        self.assertEqual(numbers, ['447700900345', '447700900345', ''])
+        self.assertEqual(errors, [None, None, normalise.EMPTY])
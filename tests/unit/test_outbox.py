@@ -0,0 +1,219 @@
+import asyncio
+import time
+
+from unittest import mock
+
+from aiohttp.test_utils import unittest_run_loop
+from aioredis import ReplyError
+from aioresponses import aioresponses
+
+from app import json_codec, outbox
+from app.outbox import Outbox
+from app.request import BackgroundRequest
+from app.utils import RHService
+
+from . import RHTestCase
+
+
+def id_order(entry_id):
+    milliseconds, sequence = entry_id.split(b'-')
+    return int(milliseconds), int(sequence)
+
+
+class FakeStreamPool:
+    """A Redis stream with one consumer group, enough to run the outbox against"""
+    def __init__(self):
+        self.keys = set()
+        self.streams = {}
+        self.pending = {}
+        self.delivered = set()
+        self.sequence = 0
+
+    def add(self, stream, fields):
+        self.sequence += 1
+        entry_id = f'{int(time.time() * 1000)}-{self.sequence}'.encode('ascii')
+        self.streams.setdefault(stream, {})[entry_id] = [str(field).encode('utf-8') for field in fields]
+        return entry_id
+
+    async def execute(self, command, *args):
+        # Let other outboxes run between commands, as they would against Redis
+        await asyncio.sleep(0)
+        if command == b'EVALSHA':
+            raise ReplyError('NOSCRIPT No matching script.')
+        if command == b'EVAL':
+            _, _, stream, key, _, *fields = args
+            if key in self.keys:
+                return None
+            self.keys.add(key)
+            return self.add(stream, fields)
+        if command == b'XADD':
+            stream, _, *fields = args
+            return self.add(stream, fields)
+        if command == b'XGROUP':
+            return b'OK'
+        if command == b'XREADGROUP':
+            stream = args[-2]
+            entries = [(entry_id, fields) for entry_id, fields in self.streams.get(stream, {}).items()
+                       if entry_id not in self.delivered][:args[4]]
+            for entry_id, _ in entries:
+                self.delivered.add(entry_id)
+                self.pending[entry_id] = [args[2], time.time(), 1]
+            return [[stream.encode('ascii'), entries]] if entries else None
+        if command == b'XPENDING':
+            if len(args) == 2:
+                return [len(self.pending), None, None, None]
+            _, _, start, _, count = args
+            pending = sorted(self.pending.items(), key=lambda item: id_order(item[0]))
+            return [[entry_id, consumer, int((time.time() - delivered) * 1000), deliveries]
+                    for entry_id, (consumer, delivered, deliveries) in pending
+                    if start == b'-' or id_order(entry_id) >= id_order(start)][:count]
+        if command == b'XCLAIM':
+            stream, _, consumer, min_idle, *entry_ids = args
+            entry_ids = [entry_id for entry_id in entry_ids if entry_id in self.pending
+                         and (time.time() - self.pending[entry_id][1]) * 1000 >= min_idle]
+            for entry_id in entry_ids:
+                self.pending[entry_id][:] = [consumer, time.time(), self.pending[entry_id][2] + 1]
+            return [(entry_id, self.streams[stream].get(entry_id)) for entry_id in entry_ids]
+        if command == b'XACK':
+            for entry_id in args[2:]:
+                self.pending.pop(entry_id, None)
+            return len(args) - 2
+        if command == b'XDEL':
+            for entry_id in args[1:]:
+                self.streams[args[0]].pop(entry_id, None)
+            return len(args) - 1
+        if command == b'XLEN':
+            return len(self.streams.get(args[0], {}))
+        if command == b'XRANGE':
+            return list(self.streams.get(args[0], {}).items())[:1]
+        raise AssertionError(f'unexpected command {command}')
+
+    def age_pending(self, seconds):
+        for pending in self.pending.values():
+            pending[1] -= seconds
+
+
+class TestOutbox(RHTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pool = FakeStreamPool()
+        self.outbox = Outbox(self.app, self.pool, batch_size=10, max_attempts=3, backoff=5)
+        self.sms_url = f"{self.app['RHSVC_URL']}/cases/{self.case_id}/fulfilments/sms"
+
+    def enqueue(self, key='a'):
+        request = BackgroundRequest(self.app, {'client_ip': '1.2.3.4', 'client_id': 'client', 'trace': 'trace'})
+        return self.outbox.enqueue(request, 'fulfilment_sms', 'POST', f'/cases/{self.case_id}/fulfilments/sms',
+                                   {'caseId': self.case_id}, key)
+
+    @unittest_run_loop
+    async def test_duplicate_dropped(self):
+        self.assertTrue(await self.enqueue())
+        self.assertFalse(await self.enqueue())
+        self.assertTrue(await self.enqueue('b'))
+        self.assertEqual(len(self.pool.streams['outbox']), 2)
+
+    @unittest_run_loop
+    async def test_sent_and_removed(self):
+        await self.enqueue()
+        with aioresponses(passthrough=[str(self.server._root)]) as mocked:
+            mocked.post(self.sms_url)
+            self.assertEqual(await self.outbox.dispatch_once(), 1)
+            (_, sent), = mocked.requests.items()
+            self.assertEqual(sent[0].kwargs['headers']['Idempotency-Key'], 'a')
+            self.assertEqual(json_codec.loads(sent[0].kwargs['data']._value), {'caseId': self.case_id})
+        self.assertEqual(self.pool.streams['outbox'], {})
+        self.assertEqual(self.pool.pending, {})
+        self.assertEqual(outbox.outbox_backlog.values[()], 0)
+
+    @unittest_run_loop
+    async def test_rejected_dead_lettered(self):
+        await self.enqueue()
+        with aioresponses(passthrough=[str(self.server._root)]) as mocked:
+            mocked.post(self.sms_url, status=400)
+            with self.assertLogs('respondent-home', 'ERROR') as cm:
+                await self.outbox.dispatch_once()
+        self.assertLogEvent(cm, 'submission could not be sent', reason='rejected')
+        self.assertEqual(self.pool.streams['outbox'], {})
+        (dead,), = [self.pool.streams['outbox:dead'].values()]
+        self.assertIn(b'rejected', dead)
+
+    @unittest_run_loop
+    async def test_retried_with_backoff(self):
+        await self.enqueue()
+        with aioresponses(passthrough=[str(self.server._root)]) as mocked:
+            mocked.post(self.sms_url, status=500, repeat=True)
+            await self.outbox.dispatch_once()
+            self.assertEqual(len(self.pool.pending), 1)
+
+            # Not retried until the backoff has passed
+            self.assertEqual(await self.outbox.dispatch_once(), 0)
+            self.pool.age_pending(5)
+            self.assertEqual(await self.outbox.dispatch_once(), 1)
+            self.pool.age_pending(10)
+            self.assertEqual(await self.outbox.dispatch_once(), 1)
+            self.assertEqual(len(next(iter(mocked.requests.values()))), 3)
+
+            # Given up after max_attempts
+            self.pool.age_pending(20)
+            with self.assertLogs('respondent-home', 'ERROR') as cm:
+                self.assertEqual(await self.outbox.dispatch_once(), 0)
+            self.assertLogEvent(cm, 'submission could not be sent', reason='too many attempts')
+        self.assertEqual(self.pool.streams['outbox'], {})
+        self.assertEqual(self.pool.pending, {})
+        self.assertEqual(len(self.pool.streams['outbox:dead']), 1)
+
+    @unittest_run_loop
+    async def test_retries_not_held_up_by_backoff(self):
+        self.outbox.batch_size = 2
+        for key in 'abcdef':
+            await self.enqueue(key)
+        await self.outbox.read_new()
+        await self.outbox.read_new()
+        await self.outbox.read_new()
+        first, second, *rest = sorted(self.pool.pending, key=id_order)
+        # The first two have been tried twice and are backing off for 10 seconds, the rest are due after 5
+        self.pool.pending[first][2] = self.pool.pending[second][2] = 2
+        self.pool.age_pending(6)
+        self.assertEqual([entry_id for entry_id, _ in await self.outbox.claim_retries()], rest[:2])
+        self.assertEqual([entry_id for entry_id, _ in await self.outbox.claim_retries()], rest[2:])
+        # Back to the first after reaching the end
+        self.assertEqual(await self.outbox.claim_retries(), [])
+        self.pool.age_pending(10)
+        self.assertEqual([entry_id for entry_id, _ in await self.outbox.claim_retries()], [first, second])
+
+    @unittest_run_loop
+    async def test_retry_sent_once_by_racing_workers(self):
+        other = Outbox(self.app, self.pool, batch_size=10, max_attempts=3, backoff=5)
+        other.consumer = 'other-worker'
+        await self.enqueue()
+        await self.outbox.read_new()
+        self.pool.age_pending(5)
+        with aioresponses(passthrough=[str(self.server._root)]) as mocked:
+            mocked.post(self.sms_url, status=500, repeat=True)
+            # Both see the entry due, and the first to claim it resets its idle time before the other claims it
+            self.assertEqual(sorted(await asyncio.gather(self.outbox.dispatch_once(), other.dispatch_once())), [0, 1])
+            self.assertEqual(len(next(iter(mocked.requests.values()))), 1)
+        (_, _, deliveries), = self.pool.pending.values()
+        self.assertEqual(deliveries, 2)
+
+        # Given up only once, by whichever worker claims it
+        self.pool.age_pending(20)
+        self.pool.pending[next(iter(self.pool.pending))][2] = 3
+        with self.assertLogs('respondent-home', 'ERROR') as cm:
+            await asyncio.gather(self.outbox.claim_retries(), other.claim_retries())
+        self.assertEqual([record.msg for record in cm.records].count('submission could not be sent'), 1)
+        self.assertEqual(len(self.pool.streams['outbox:dead']), 1)
+        self.assertEqual(self.pool.pending, {})
+
+    @unittest_run_loop
+    async def test_sent_directly_when_redis_unavailable(self):
+        self.app['outbox'] = self.outbox
+        request = BackgroundRequest(self.app, {'client_ip': '1.2.3.4, 10.0.0.1, 10.0.0.2', 'client_id': 'client'})
+        with mock.patch.object(self.pool, 'execute', side_effect=ConnectionRefusedError()), \
+                aioresponses(passthrough=[str(self.server._root)]) as mocked:
+            mocked.post(self.sms_url)
+            with self.assertLogs('respondent-home', 'ERROR') as cm:
+                await RHService.request_fulfilment_sms(request, self.case_id, '447700900345', ['UACHHT1'])
+            self.assertLogEvent(cm, 'failed to queue submission, sending directly', kind='fulfilment_sms')
+            self.assertEqual(len(next(iter(mocked.requests.values()))), 1)
@@ -0,0 +1,96 @@
+from unittest import mock
+
+from aiohttp.test_utils import unittest_run_loop
+from aioredis import ReplyError
+from aioresponses import aioresponses
+
+from app import config, rate_limit
+from app.app_logging import logger_initial_config
+from app.rate_limit import RateLimiter
+
+from . import AsyncTestCase, FakeRedisPool, RHTestCase
+
+
+class TestRateLimiter(AsyncTestCase):
+
+    def setUp(self):
+        super().setUp()
+        logger_initial_config()
+
+    def hit(self, limiter, now, **identifiers):
+        with mock.patch('app.rate_limit.time.time', return_value=now):
+            return self.run_async(limiter.hit(**identifiers))
+
+    def test_parse_limit(self):
+        self.assertEqual(rate_limit.parse_limit('20/60'), (20, 60.0))
+        self.assertIsNone(rate_limit.parse_limit(''))
+
+    def test_sliding_window_in_memory(self):
+        limiter = RateLimiter({'ip': (2, 60), 'session': (3, 60)})
+        self.assertIsNone(self.hit(limiter, 0, ip='1.2.3.4', session='a'))
+        self.assertIsNone(self.hit(limiter, 30, ip='1.2.3.4', session='a'))
+        self.assertEqual(self.hit(limiter, 40, ip='1.2.3.4', session='a'), 'ip')
+        # Rejected attempts are not counted, and the window slides past the first attempt
+        self.assertIsNone(self.hit(limiter, 61, ip='1.2.3.4', session='a'))
+        self.assertIsNone(self.hit(limiter, 62, ip='5.6.7.8', session='a'))
+        self.assertEqual(self.hit(limiter, 63, ip='9.10.11.12', session='a'), 'session')
+        self.assertIsNone(self.hit(limiter, 63, ip='9.10.11.12', session='b'))
+
+    def test_unlimited_identifiers(self):
+        limiter = RateLimiter({'ip': (1, 60), 'session': None})
+        self.assertIsNone(self.hit(limiter, 0, ip='', session='a'))
+        self.assertIsNone(self.hit(limiter, 0, ip='', session='a'))
+        self.assertEqual(limiter.memory.windows, {})
+
+    def test_sweep(self):
+        limiter = RateLimiter({'ip': (5, 60)})
+        limiter.memory.sweep_every = 2
+        self.hit(limiter, 0, ip='1.2.3.4')
+        self.hit(limiter, 100, ip='5.6.7.8')
+        self.assertEqual(list(limiter.memory.windows), ['rate_limit:ip:5.6.7.8'])
+
+    def test_redis_script(self):
+        pool = FakeRedisPool(script_result=2, errors=[ReplyError('NOSCRIPT No matching script.')])
+        limiter = RateLimiter({'ip': (20, 60), 'session': (10, 30)}, redis_pool=pool)
+        self.assertEqual(self.hit(limiter, 1000.5, ip='1.2.3.4', session='a'), 'session')
+
+        (evalsha, evalsha_args), (eval_, eval_args) = pool.calls
+        self.assertEqual((evalsha, eval_), (b'EVALSHA', b'EVAL'))
+        self.assertEqual(evalsha_args[0], rate_limit.sliding_windows_script.sha)
+        self.assertEqual(eval_args[0], rate_limit.sliding_windows_script.source)
+        self.assertEqual(evalsha_args[1:], eval_args[1:])
+        numkeys, ip_key, session_key, now, member, *windows = eval_args[1:]
+        self.assertEqual((numkeys, ip_key, session_key), (2, 'rate_limit:ip:1.2.3.4', 'rate_limit:session:a'))
+        self.assertEqual(now, 1000.5)
+        self.assertTrue(member.startswith('1000.5:'))
+        self.assertEqual(windows, [60, 20, 30, 10])
+
+    def test_redis_unavailable(self):
+        pool = FakeRedisPool(errors=[ConnectionRefusedError(), ConnectionRefusedError()])
+        limiter = RateLimiter({'ip': (1, 60)}, redis_pool=pool)
+        with self.assertLogs('respondent-home', 'ERROR'):
+            self.assertIsNone(self.hit(limiter, 0, ip='1.2.3.4'))
+            self.assertEqual(self.hit(limiter, 1, ip='1.2.3.4'), 'ip')
+
+
+class TestUACEntryRateLimit(RHTestCase):
+
+    async def get_application(self):
+        with mock.patch.object(config.TestingConfig, 'RATE_LIMIT_UAC_SESSION', '1/60'):
+            return await super().get_application()
+
+    @unittest_run_loop
+    async def test_second_attempt_rejected_before_rhsvc(self):
+        with aioresponses(passthrough=[str(self.server._root)]) as mocked:
+            mocked.get(self.rhsvc_url, payload=self.uac_json_e, repeat=True)
+
+            response = await self.client.request('POST', self.post_start_en, allow_redirects=False,
+                                                 data=self.start_data_valid)
+            self.assertEqual(response.status, 302)
+
+            with self.assertLogs('respondent-home', 'WARNING') as cm:
+                await self.client.request('POST', self.post_start_en, allow_redirects=False,
+                                          data=self.start_data_valid)
+            self.assertLogEvent(cm, 'access code entry rate limited', limit='session')
+
+            self.assertEqual(len(next(iter(mocked.requests.values()))), 1)
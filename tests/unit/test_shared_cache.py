@@ -0,0 +1,66 @@
+import os
+import struct
+import tempfile
+
+from unittest import TestCase
+
+from app import shared_cache
+from app.shared_cache import SharedCache, key_hash
+
+
+class TestSharedCache(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mktemp(suffix='.cache')
+        self.cache = SharedCache(self.path, slots=64, slot_size=256)
+
+    def tearDown(self):
+        self.cache.close()
+        os.remove(self.path)
+
+    def test_set_and_get(self):
+        self.assertIsNone(self.cache.get(b'key'))
+        self.assertTrue(self.cache.set(b'key', b'value'))
+        self.assertEqual(self.cache.get(b'key'), b'value')
+        self.cache.set(b'key', b'other')
+        self.assertEqual(self.cache.get(b'key'), b'other')
+
+    def test_shared_between_workers(self):
+        other_worker = SharedCache(self.path, slots=64, slot_size=256)
+        try:
+            self.cache.set(b'key', b'value')
+            self.assertEqual(other_worker.get(b'key'), b'value')
+        finally:
+            other_worker.close()
+
+    def test_too_large_not_kept(self):
+        self.assertFalse(self.cache.set(b'key', b'v' * 256))
+        self.assertIsNone(self.cache.get(b'key'))
+
+    def test_same_slot_replaced(self):
+        keys = [f'key{number}'.encode() for number in range(200)]
+        first = keys[0]
+        other = next(key for key in keys[1:] if key_hash(key) % 64 == key_hash(first) % 64)
+        self.cache.set(first, b'first')
+        self.cache.set(other, b'other')
+        self.assertIsNone(self.cache.get(first))
+        self.assertEqual(self.cache.get(other), b'other')
+
+    def test_slot_being_written_is_a_miss(self):
+        self.cache.set(b'key', b'value')
+        offset = self.cache._slot(key_hash(b'key'))
+        sequence = struct.unpack_from('<Q', self.cache._map, offset)[0]
+        struct.pack_into('<Q', self.cache._map, offset, sequence + 1)
+        self.assertIsNone(self.cache.get(b'key'))
+        # A writer that stopped part way through leaves the slot usable
+        self.cache.set(b'key', b'again')
+        self.assertEqual(self.cache.get(b'key'), b'again')
+
+    def test_other_layout_not_opened(self):
+        with self.assertRaises(ValueError):
+            SharedCache(self.path, slots=128, slot_size=256)
+
+    def test_setup(self):
+        self.assertIsNone(shared_cache.setup({'SHARED_CACHE_FILE': ''}))
+        self.assertIsNone(shared_cache.setup({'SHARED_CACHE_FILE': self.path, 'SHARED_CACHE_SLOTS': '32',
+                                              'SHARED_CACHE_SLOT_SIZE': '256'}))
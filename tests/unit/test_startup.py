@@ -0,0 +1,78 @@
+import builtins
+import sys
+
+from unittest import TestCase, mock
+
+from aiohttp_session import SimpleCookieStorage, session_middleware
+
+from app import startup
+from app.app_logging import logger_initial_config
+
+from . import FakeClock
+
+
+class TestImportProfiler(TestCase):
+
+    def test_times_first_imports(self):
+        sys.modules.pop('colorsys', None)
+        profiler = startup.ImportProfiler()
+        profiler.start()
+        try:
+            import colorsys  # noqa: F401
+            import json  # noqa: F401
+        finally:
+            profiler.stop()
+        self.assertIn('colorsys', profiler.modules)
+        self.assertNotIn('json', profiler.modules)
+        self.assertIn('colorsys', profiler.by_package())
+
+    def test_stop_restores_import(self):
+        original = builtins.__import__
+        profiler = startup.ImportProfiler()
+        profiler.start()
+        profiler.stop()
+        self.assertIs(builtins.__import__, original)
+
+    def test_by_package(self):
+        profiler = startup.ImportProfiler()
+        profiler.modules = {'aiohttp.web': 0.02, 'aiohttp.client': 0.01, 'pytz': 0.005, 'app.utils': 0.001}
+        self.assertEqual(profiler.by_package(top=2), {'aiohttp': 30.0, 'pytz': 5.0})
+
+
+class TestStartupProfile(TestCase):
+
+    def setUp(self):
+        logger_initial_config()
+
+    def test_log_phases(self):
+        clock = FakeClock()
+        profile = startup.StartupProfile(clock=clock)
+        clock.now = 0.01
+        profile.mark('config')
+        clock.now = 0.11
+        profile.mark('key_store')
+        with mock.patch.dict(startup.import_profiler.modules, clear=True), \
+                self.assertLogs('respondent-home', 'INFO') as cm:
+            profile.log(config='TestingConfig')
+        self.assertEqual(profile.phases, {'config': 0.01, 'key_store': 0.1})
+        self.assertIn('app startup profile', cm.output[0])
+        self.assertNotIn('imports_ms', cm.output[0])
+
+    def create_app(self, **overrides):
+        from app.app import create_app
+
+        with mock.patch('app.session.setup', lambda app_config: session_middleware(SimpleCookieStorage())), \
+                self.assertLogs('respondent-home', 'INFO') as cm:
+            app = create_app('TestingConfig', overrides=overrides)
+        return app, [line for line in cm.output if 'app startup profile' in line]
+
+    def test_logged_with_setting(self):
+        _, profiles = self.create_app()
+        self.assertEqual(profiles, [])
+        _, profiles = self.create_app(STARTUP_PROFILE=True)
+        self.assertEqual(len(profiles), 1)
+
+    def test_optional_parts_left_out(self):
+        app, _ = self.create_app()
+        for name in ('outbox', 'shared_cache', 'support_centre_index', 'address_snapshot', 'warm_up'):
+            self.assertIsNone(app[name])
@@ -0,0 +1,81 @@
+import json
+
+from unittest import TestCase
+
+from app.streaming import PostcodeResponseParser
+
+
+def parse(body, chunk_length, limit=None):
+    parser = PostcodeResponseParser(limit)
+    for start in range(0, len(body), chunk_length):
+        parser.feed(body[start:start + chunk_length])
+    parser.close()
+    return parser
+
+
+class TestPostcodeResponseParser(TestCase):
+
+    def setUp(self):
+        with open('tests/test_data/address_index/postcode_results.json', 'rb') as fp:
+            self.body = fp.read()
+        self.expected = json.loads(self.body.decode('utf-8'))['response']
+
+    def test_parse_keeps_required_fields(self):
+        for chunk_length in (1, 7, 64, len(self.body)):
+            parser = parse(self.body, chunk_length)
+            self.assertEqual(parser.total, self.expected['total'])
+            self.assertEqual(parser.addresses, [
+                {'uprn': address['uprn'], 'formattedAddress': address['formattedAddress']}
+                for address in self.expected['addresses']
+            ])
+
+    def test_parse_result_shape(self):
+        result = parse(self.body, 100).result()
+        self.assertEqual(result['response']['total'], 27)
+        self.assertEqual(result['response']['addresses'][0]['uprn'], '10023122451')
+
+    def test_parse_no_results(self):
+        with open('tests/test_data/address_index/postcode_no_results.json', 'rb') as fp:
+            result = parse(fp.read(), 10).result()
+        self.assertEqual(result, {'response': {'addresses': [], 'total': 0}})
+
+    def test_parse_stops_decoding_at_limit(self):
+        parser = parse(self.body, 5, limit=2)
+        self.assertEqual([address['uprn'] for address in parser.addresses], ['10023122451', '10023122452'])
+        self.assertEqual(parser.total, 27)
+
+    def test_parse_skips_brackets_in_strings(self):
+        body = json.dumps({'response': {
+            'addresses': [
+                {'uprn': '1', 'formattedAddress': 'Flat [A], 1 Road'},
+                {'uprn': '2', 'formattedAddress': 'Unit {"2"] \\ Road', 'nested': {'list': [1, [2]]}},
+            ],
+            'total': 2
+        }}).encode('utf-8')
+        for chunk_length in (1, 3, len(body)):
+            parser = parse(body, chunk_length, limit=1)
+            self.assertEqual(parser.addresses, [{'uprn': '1', 'formattedAddress': 'Flat [A], 1 Road'}])
+            self.assertEqual(parser.total, 2)
+            self.assertTrue(parser.done)
+
+    def test_parse_total_before_addresses(self):
+        body = b'{"response": {"total": 1, "addresses": [{"uprn": "1", "formattedAddress": "A"}]}}'
+        parser = parse(body, 4)
+        self.assertEqual(parser.total, 1)
+        self.assertEqual(len(parser.addresses), 1)
+
+    def test_parse_multibyte_characters_split_across_chunks(self):
+        body = json.dumps({'response': {
+            'addresses': [{'uprn': '1', 'formattedAddress': 'Tŷ Newydd, Caerdydd'}],
+            'total': 1
+        }}, ensure_ascii=False).encode('utf-8')
+        parser = parse(body, 1)
+        self.assertEqual(parser.addresses[0]['formattedAddress'], 'Tŷ Newydd, Caerdydd')
+
+    def test_parse_truncated_body(self):
+        with self.assertRaises(ValueError):
+            parse(self.body[:len(self.body) // 2], 10)
+
+    def test_parse_missing_addresses(self):
+        result = parse(b'{"response": {"total": 0}}', 3).result()
+        self.assertNotIn('addresses', result['response'])
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import random
+import tempfile
+import threading
+
+from unittest import mock
+
+from app import support_centres
+from app.lookup_cache import LookupCache
+from app.request import BackgroundRequest
+from app.support_centres import KDTree, PostcodeCentroids, SupportCentreIndex
+from app.utils import ADLookUp
+
+from . import AsyncTestCase
+
+
+def centre(name, postcode, latitude, longitude, location_id=None):
+    found = {'locationName': name, 'postcode': postcode, 'latitude': str(latitude), 'longitude': str(longitude)}
+    if location_id is not None:
+        found['locationID'] = location_id
+    return found
+
+
+class TestSupportCentreIndex(AsyncTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.centroids = PostcodeCentroids([('S1 1XZ', 53.3806, -1.4670), ('EX2 6GA', 50.7093, -3.5117),
+                                            ('SW1A 1AA', 51.5010, -0.1416)])
+        self.index = SupportCentreIndex([
+            centre('Sheffield Central Library', 'S1 1XZ', 53.380582, -1.466986),
+            centre('Exeter Library', 'EX4 3PQ', 50.7254, -3.5275, '1002'),
+            centre('Westminster Library', 'SW1Y 4HH', 51.5094, -0.1322),
+            centre('No location', 'AB1 1AA', '', ''),
+        ], self.centroids)
+
+    def test_nearest_matches_brute_force(self):
+        rng = random.Random(2021)
+        points = [support_centres.to_unit_vector(rng.uniform(50, 58), rng.uniform(-6, 2)) for _ in range(500)]
+        tree = KDTree(points)
+        for _ in range(50):
+            point = support_centres.to_unit_vector(rng.uniform(50, 58), rng.uniform(-6, 2))
+            expected = sorted(sum((a - b) ** 2 for a, b in zip(point, other)) ** 0.5 for other in points)[:10]
+            self.assertEqual([round(distance, 12) for distance, _ in tree.nearest(point, 10)],
+                             [round(distance, 12) for distance in expected])
+
+    def test_postcode_centroids(self):
+        self.assertAlmostEqual(self.centroids.get('EX2 6GA')[0], 50.7093, places=4)
+        self.assertAlmostEqual(self.centroids.get('SW1A1AA')[1], -0.1416, places=4)
+        self.assertIsNone(self.centroids.get('GU34 6DU'))
+        self.assertIsNone(self.centroids.get('not a postcode'))
+
+    def test_load_postcode_centroids(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as centroids_file:
+            centroids_file.write('EX2 6GA,50.7093,-3.5117\nZZ99 9ZZ,,\nS1 1XZ,53.3806,-1.4670\n')
+        try:
+            centroids = PostcodeCentroids.load(centroids_file.name)
+        finally:
+            os.remove(centroids_file.name)
+        self.assertEqual(len(centroids), 2)
+        self.assertIsNotNone(centroids.get('S1 1XZ'))
+
+    def test_nearest_to_postcode(self):
+        ad_response = self.index.nearest_to_postcode('EX2 6GA', limit=2)
+        self.assertEqual([found['locationName'] for found in ad_response['centres']],
+                         ['Exeter Library', 'Westminster Library'])
+        self.assertEqual(ad_response['centres'][0]['distanceInMiles'], 1.3)
+        self.assertEqual(ad_response['centres'][1]['distanceInMiles'], 156.7)
+        self.assertEqual(len(self.index.nearest_to_postcode('SW1A 1AA')['centres']), 3)
+
+    def test_unknown_postcode_left_to_ad_lookup(self):
+        self.assertIsNone(self.index.nearest_to_postcode('GU34 6DU'))
+
+    def test_update_from_ad_lookup(self):
+        ad_response = {'centres': [dict(centre('Exeter Library', 'EX4 3PQ', 50.7254, -3.5275, '1002'),
+                                        distanceInMiles=1.3),
+                                   dict(centre('Exeter Phoenix', 'EX4 3LS', 50.7259, -3.5309), distanceInMiles=1.4)]}
+        self.run_async(self.index.update(ad_response))
+        self.assertEqual(len(self.index.indexed), 4)
+        self.assertNotIn('distanceInMiles', self.index.centres[('Exeter Phoenix', 'EX4 3LS')])
+
+    def test_moved_centre_replaced(self):
+        self.run_async(self.index.update({'centres': [
+            centre('Exeter Central Library', 'EX2 4AN', 50.7180, -3.5200, '1002')]}))
+        self.assertEqual(len(self.index.indexed), 3)
+        names = [found['locationName'] for found in self.index.nearest_to_postcode('EX2 6GA')['centres']]
+        self.assertEqual(names, ['Exeter Central Library', 'Westminster Library', 'Sheffield Central Library'])
+
+    def test_index_updated_from_fresh_responses_only(self):
+        cache = LookupCache('ad_lookup', ttl=60)
+        request = BackgroundRequest({'support_centre_index': self.index, 'ad_lookup_cache': cache,
+                                     'AD_LOOK_UP_SVC_URL': 'http://ad', 'AD_LOOK_UP_SVC_APIKEY': 'key',
+                                     'AD_LOOK_UP_SVC_APPID': 'app', 'AD_LOOK_UP_SVC_AUTH': None})
+        cached = {'centres': [centre('Exeter Library', 'EX4 3PQ', 50.0, -3.0, '1002')]}
+        fresh = {'centres': [centre('Alton Library', 'GU34 1HN', 51.1497, -0.9769, '1005')]}
+        urls = []
+
+        async def make_request(request, method, url, **_):
+            urls.append(url)
+            return fresh
+
+        self.run_async(cache.set('GU34 6DU', cached))
+        with mock.patch('app.utils.View._make_request', make_request):
+            self.assertEqual(self.run_async(ADLookUp.get_ad_lookup_by_postcode(request, 'GU34 6DU')), cached)
+            self.assertEqual(self.index.centres['1002']['latitude'], '50.7254')
+            self.assertEqual(self.run_async(ADLookUp.get_ad_lookup_by_postcode(request, 'GU34 1HN')), fresh)
+        self.assertEqual(urls, ['http://ad/centres/postcode?postcode=GU34 1HN&limit=10'])
+        self.assertIn('1005', self.index.centres)
+
+    def test_searches_use_current_index_while_rebuilding(self):
+        build = SupportCentreIndex._build
+        first_build, release = threading.Event(), threading.Event()
+
+        def held_build(centres):
+            # The first rebuild waits until the second has been swapped in
+            if not first_build.is_set():
+                first_build.set()
+                release.wait(5)
+            return build(centres)
+
+        tree = self.index.tree
+        phoenix = centre('Exeter Phoenix', 'EX4 3LS', 50.7259, -3.5309)
+        quay = centre('Exeter Quay', 'EX2 4AN', 50.7180, -3.5200)
+
+        async def updates():
+            first = asyncio.ensure_future(self.index.update({'centres': [phoenix]}))
+            await asyncio.sleep(0.05)
+            self.assertIs(self.index.tree, tree)
+            self.assertEqual(self.index.nearest_to_postcode('EX2 6GA', limit=1)['centres'][0]['locationName'],
+                             'Exeter Library')
+            await self.index.update({'centres': [quay]})
+            release.set()
+            await first
+
+        with mock.patch.object(SupportCentreIndex, '_build', staticmethod(held_build)):
+            self.run_async(updates())
+        self.assertEqual(len(self.index.indexed), 5)
+        self.assertEqual(self.index.nearest_to_postcode('EX2 6GA', limit=1)['centres'][0]['locationName'],
+                         'Exeter Quay')
+
+    def test_ad_lookup_answered_locally(self):
+        request = BackgroundRequest({'support_centre_index': self.index})
+        ad_response = self.run_async(ADLookUp.get_ad_lookup_by_postcode(request, 'S1 1XZ'))
+        self.assertEqual(ad_response['centres'][0]['locationName'], 'Sheffield Central Library')
+        self.assertEqual(ad_response['centres'][0]['distanceInMiles'], 0.0)
@@ -0,0 +1,127 @@
+import io
+import json
+
+from unittest import TestCase, mock
+
+from aiohttp.test_utils import unittest_run_loop
+from aioresponses import aioresponses
+
+from app import config, tracing
+from app.tracing import Span, StreamExporter
+
+from . import RHTestCase
+
+
+class MemoryExporter:
+    spans = []
+
+    def __init__(self, options):
+        pass
+
+    def export(self, spans):
+        MemoryExporter.spans.extend(spans)
+
+    def close(self):
+        pass
+
+
+class TestTraceContext(TestCase):
+
+    def test_parse_traceparent(self):
+        headers = {'traceparent': '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'}
+        self.assertEqual(tracing.parse_trace_context(headers), ('0af7651916cd43dd8448eb211c80319c', 'b7ad6b7169203331'))
+
+    def test_parse_cloud_trace_context(self):
+        headers = {'X-Cloud-Trace-Context': '105445AA7843BC8BF206B12000100000/1;o=1'}
+        self.assertEqual(tracing.parse_trace_context(headers), ('105445aa7843bc8bf206b12000100000', '0000000000000001'))
+
+    def test_parse_no_context(self):
+        trace_id, parent_id = tracing.parse_trace_context({'X-Cloud-Trace-Context': 'nonsense'})
+        self.assertEqual(len(trace_id), 32)
+        self.assertIsNone(parent_id)
+
+    def test_inject(self):
+        span = Span('test', '0af7651916cd43dd8448eb211c80319c')
+        headers = {'Accept': 'application/json'}
+        injected = tracing.inject(span, headers)
+        self.assertEqual(injected['traceparent'], f'00-0af7651916cd43dd8448eb211c80319c-{span.span_id}-01')
+        self.assertEqual(injected['X-Cloud-Trace-Context'],
+                         f'0af7651916cd43dd8448eb211c80319c/{int(span.span_id, 16)};o=1')
+        self.assertEqual(headers, {'Accept': 'application/json'})
+        self.assertIs(tracing.inject(None, headers), headers)
+
+    def test_span_nesting(self):
+        root = Span('root', tracing.new_trace_id())
+        request = {tracing.CURRENT_SPAN: root, tracing.FINISHED_SPANS: []}
+        with tracing.span(request, 'outer') as outer:
+            with self.assertRaises(KeyError):
+                with tracing.span(request, 'inner', key='value') as inner:
+                    raise KeyError('key')
+            self.assertIs(request[tracing.CURRENT_SPAN], outer)
+        self.assertIs(request[tracing.CURRENT_SPAN], root)
+        self.assertEqual(request[tracing.FINISHED_SPANS], [inner, outer])
+        self.assertEqual(inner.parent_id, outer.span_id)
+        self.assertEqual(outer.parent_id, root.span_id)
+        self.assertEqual(inner.error, 'KeyError')
+        self.assertIsNone(outer.error)
+
+    def test_span_untraced_request(self):
+        with tracing.span({}, 'untraced') as span:
+            self.assertIsNone(span)
+
+    def test_stream_exporter(self):
+        stream = io.StringIO()
+        span = Span('test', tracing.new_trace_id(), 'b7ad6b7169203331', {'attempt': 1})
+        span.end()
+        StreamExporter(stream).export([span])
+        exported = json.loads(stream.getvalue())
+        self.assertEqual(exported['name'], 'test')
+        self.assertEqual(exported['parentSpanId'], 'b7ad6b7169203331')
+        self.assertEqual(exported['attributes'], [{'key': 'attempt', 'value': {'stringValue': '1'}}])
+        self.assertGreaterEqual(exported['endTimeUnixNano'], exported['startTimeUnixNano'])
+
+    def test_unknown_exporter(self):
+        with self.assertRaises(ValueError):
+            tracing.make_exporter('nonsense')
+
+
+class TestTracedRequests(RHTestCase):
+
+    async def get_application(self):
+        with mock.patch.object(config.TestingConfig, 'TRACING_EXPORTER', 'tests.unit.test_tracing.MemoryExporter'):
+            return await super().get_application()
+
+    def setUp(self):
+        super().setUp()
+        MemoryExporter.spans = []
+
+    @unittest_run_loop
+    async def test_request_spans(self):
+        trace_id = '105445aa7843bc8bf206b12000100000'
+        with aioresponses(passthrough=[str(self.server._root)]) as mocked:
+            mocked.get(self.rhsvc_url, status=503)
+            mocked.get(self.rhsvc_url, payload=self.uac_json_e)
+
+            response = await self.client.request('POST',
+                                                 self.post_start_en,
+                                                 allow_redirects=False,
+                                                 data=self.start_data_valid,
+                                                 headers={'X-Cloud-Trace-Context': trace_id + '/1;o=1'})
+
+            outbound_headers = [call.kwargs['headers'] for call in next(iter(mocked.requests.values()))]
+
+        self.assertEqual(response.status, 302)
+        spans = {span.name: span for span in MemoryExporter.spans}
+        root = spans['POST Start:post']
+        self.assertEqual(root.parent_id, '0000000000000001')
+        self.assertEqual(root.attributes['http.status_code'], 302)
+        self.assertTrue(all(span.trace_id == trace_id for span in MemoryExporter.spans))
+        self.assertEqual(spans['middleware nonce'].parent_id, root.span_id)
+        self.assertEqual(spans['middleware session'].parent_id, spans['middleware nonce'].span_id)
+        self.assertEqual(spans['handler Start:post'].parent_id, spans['middleware trace'].span_id)
+
+        attempts = [span for span in MemoryExporter.spans if span.name == 'GET rhsvc']
+        self.assertEqual([span.attributes['http.status_code'] for span in attempts], ['503', '200'])
+        self.assertEqual(attempts[0].error, 'ClientResponseError')
+        self.assertEqual([headers['traceparent'] for headers in outbound_headers],
+                         [f'00-{trace_id}-{span.span_id}-01' for span in attempts])
@@ -1,10 +1,19 @@
 from app.utils import ProcessPostcode, ProcessMobileNumber, InvalidDataError, InvalidDataErrorWelsh, FlashMessage, View
 
 from . import RHTestCase
+import asyncio
 import datetime
+import time
 
 from unittest import mock
 
+from aiohttp.client_exceptions import ClientResponseError
+from aiohttp.test_utils import unittest_run_loop
+from aiohttp.web import HTTPFound
+
+from app import normalise
+from app.exceptions import TooManyRequestsEQLaunch
+
 
 class TestUtils(RHTestCase):
 
@@ -378,3 +387,82 @@ class TestUtils(RHTestCase):
             str(cm.exception)
         )
         # With the correct message
+
+    def test_batch_checks_match_validators(self):
+        postcodes = ['PO15 5RR', 'BS２ ０FW', '', 'PO15-5RR', 'PO15', 'PO15 5RRR', 'BFPO 105']
+        numbers = ['07700 900345', '+44 7700 900345', '0044', '07700 9OO345', '01234 567890', '077009003456']
+
+        for values, check_all, validate in (
+            (postcodes, normalise.check_postcodes, ProcessPostcode.validate_postcode),
+            (numbers, normalise.check_uk_mobile_numbers, ProcessMobileNumber.validate_uk_mobile_phone_number),
+        ):
+            for value, normalised, error in zip(values, *check_all(values)):
+                if error is None:
+                    self.assertEqual(validate(value, 'en'), normalised)
+                else:
+                    with self.assertRaises(InvalidDataError) as cm:
+                        validate(value, 'en')
+                    self.assertEqual(cm.exception.message_type == 'empty', error == normalise.EMPTY)
+
+
+class TestCallQuestionnaire(RHTestCase):
+
+    tracking = {'client_ip': '10.0.0.1', 'client_id': '36be6b97-b4de-4718-8a74-8b27fb03ca8c', 'trace': None}
+
+    @staticmethod
+    def encrypt(payload, **_):
+        time.sleep(0.2)
+        return 'token'
+
+    async def call_questionnaire(self, post_surveylaunched, encrypt=None):
+        async def build():
+            return {}
+
+        with mock.patch('app.utils.encrypt', encrypt or self.encrypt), \
+                mock.patch('app.utils.EqPayloadConstructor') as payload_constructor, \
+                mock.patch('app.utils.RHService.post_surveylaunched', post_surveylaunched):
+            payload_constructor.return_value.build = build
+            await View.call_questionnaire(self.tracking, self.uac_json_e, {}, self.app, None)
+
+    @unittest_run_loop
+    async def test_call_questionnaire_overlaps_survey_launched(self):
+        async def post_surveylaunched(*_):
+            await asyncio.sleep(0.2)
+
+        start = time.perf_counter()
+        with self.assertRaises(HTTPFound) as cm:
+            await self.call_questionnaire(post_surveylaunched)
+        self.assertLess(time.perf_counter() - start, 0.35)
+        self.assertEqual(cm.exception.location, f'{self.app["EQ_URL"]}/session?token=token')
+
+    @unittest_run_loop
+    async def test_call_questionnaire_survey_launched_429(self):
+        async def post_surveylaunched(*_):
+            raise ClientResponseError(None, None, status=429)
+
+        with self.assertRaises(TooManyRequestsEQLaunch):
+            await self.call_questionnaire(post_surveylaunched)
+
+    @unittest_run_loop
+    async def test_call_questionnaire_survey_launched_error(self):
+        async def post_surveylaunched(*_):
+            raise ClientResponseError(None, None, status=500)
+
+        with self.assertRaises(ClientResponseError):
+            await self.call_questionnaire(post_surveylaunched)
+
+    @unittest_run_loop
+    async def test_call_questionnaire_encrypt_error(self):
+        posted = []
+
+        def encrypt(payload, **_):
+            raise ValueError('no key')
+
+        async def post_surveylaunched(*_):
+            await asyncio.sleep(0.2)
+            posted.append(True)
+
+        with self.assertRaises(ValueError):
+            await self.call_questionnaire(post_surveylaunched, encrypt)
+        await asyncio.sleep(0.3)
+        self.assertEqual(posted, [])
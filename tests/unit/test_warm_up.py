@@ -0,0 +1,99 @@
+import asyncio
+import json
+import os
+import re
+import tempfile
+
+from unittest import TestCase, mock
+
+from aiohttp.test_utils import unittest_run_loop
+from aioresponses import aioresponses
+
+from app import config
+from app.utils import AddressIndex
+from app.warm_up import Pacer, WarmUp, read_hot_keys
+
+from . import RHTestCase
+
+
+class TestPacer(TestCase):
+
+    def test_spaces_calls(self):
+        loop = asyncio.new_event_loop()
+        pacer = Pacer(4, 1.0, clock=mock.Mock(return_value=10.0))
+        delays = []
+
+        async def sleep(delay):
+            delays.append(delay)
+
+        with mock.patch('app.warm_up.asyncio.sleep', sleep):
+            for _ in range(3):
+                loop.run_until_complete(pacer.wait())
+        loop.close()
+        self.assertEqual(delays, [0.25, 0.5])
+
+
+class TestWarmUp(RHTestCase):
+
+    async def get_application(self):
+        with mock.patch.object(config.TestingConfig, 'AIMS_POSTCODE_CACHE_TTL', '60'), \
+                mock.patch.object(config.TestingConfig, 'FULFILMENT_CACHE_TTL', '60'):
+            return await super().get_application()
+
+    def setUp(self):
+        super().setUp()
+        hot_keys = {
+            'postcodes': ['ex2 6ga', 'EX2 6GA', 'not a postcode'],
+            'fulfilments': [{'case_type': 'HH', 'region': 'E', 'delivery_channel': 'SMS', 'product_group': 'UAC',
+                             'individual': False}],
+        }
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as hot_keys_file:
+            json.dump(hot_keys, hot_keys_file)
+        self.hot_keys_path = hot_keys_file.name
+        with open('tests/test_data/address_index/postcode_results.json') as fp:
+            self.postcode_results = json.load(fp)
+        with open('tests/test_data/rhsvc/get_fulfilment_single_sms.json') as fp:
+            self.fulfilments = json.load(fp)
+
+    def tearDown(self):
+        os.remove(self.hot_keys_path)
+        super().tearDown()
+
+    def test_read_hot_keys(self):
+        postcodes, fulfilments = read_hot_keys(self.hot_keys_path)
+        self.assertEqual(postcodes, ['EX2 6GA'])
+        self.assertEqual(fulfilments, [('HH', 'E', 'SMS', 'UAC', 'false')])
+
+    @unittest_run_loop
+    async def test_caches_warmed(self):
+        warm_up = WarmUp(self.app, self.hot_keys_path, rate=(1000, 1.0))
+        with aioresponses(passthrough=[str(self.server._root)]) as mocked:
+            mocked.get(re.compile(re.escape(self.addressindexsvc_url) + '.*'), payload=self.postcode_results)
+            mocked.get(re.compile(re.escape(self.rhsvc_url_fulfilments) + '.*'), payload=self.fulfilments)
+            with self.assertLogs('respondent-home', 'INFO') as cm:
+                self.assertEqual(await warm_up.run(), 2)
+            self.assertLogEvent(cm, 'cache warm-up complete', lookups=2, warmed=2)
+            self.assertEqual(len(mocked.requests), 2)
+
+            # Respondents' lookups are answered from the caches
+            request = mock.MagicMock(app=self.app)
+            postcode_return = await AddressIndex.get_ai_postcode(request, 'EX2 6GA')
+            self.assertEqual(postcode_return['response']['total'], self.postcode_results['response']['total'])
+            self.assertEqual(len(mocked.requests), 2)
+
+    @unittest_run_loop
+    async def test_failed_lookups_logged(self):
+        warm_up = WarmUp(self.app, self.hot_keys_path, rate=(1000, 1.0))
+        with aioresponses(passthrough=[str(self.server._root)]) as mocked:
+            mocked.get(re.compile(re.escape(self.addressindexsvc_url) + '.*'), status=500, repeat=True)
+            mocked.get(re.compile(re.escape(self.rhsvc_url_fulfilments) + '.*'), payload=self.fulfilments)
+            with self.assertLogs('respondent-home', 'WARNING') as cm:
+                self.assertEqual(await warm_up.run(), 1)
+        self.assertLogEvent(cm, 'cache warm-up lookup failed', lookup='aims_postcode')
+
+    @unittest_run_loop
+    async def test_missing_file(self):
+        warm_up = WarmUp(self.app, self.hot_keys_path + '.missing')
+        with self.assertLogs('respondent-home', 'ERROR') as cm:
+            self.assertEqual(await warm_up.run(), 0)
+        self.assertLogEvent(cm, 'could not read cache warm-up keys')
@@ -0,0 +1,72 @@
+import logging
+import os
+import signal
+import socket
+
+from unittest import TestCase, mock
+
+from aiohttp_session import SimpleCookieStorage, session_middleware
+
+from app import app_logging, config, jwt, workers
+from app.app import load_config, template_cache
+from app.workers import Workers, reuse_port_socket, worker_pool_sizes
+
+
+class TestWorkers(TestCase):
+
+    def setUp(self):
+        self.app_config = load_config('TestingConfig')
+
+    def test_worker_pool_sizes(self):
+        self.assertEqual(worker_pool_sizes(self.app_config, 4), {'REDIS_POOL_MIN': '13', 'REDIS_POOL_MAX': '125'})
+        self.assertEqual(worker_pool_sizes(self.app_config, 1), {'REDIS_POOL_MIN': '50', 'REDIS_POOL_MAX': '500'})
+
+    def test_reuse_port_socket(self):
+        first = reuse_port_socket('127.0.0.1', 0)
+        port = first.getsockname()[1]
+        second = reuse_port_socket('127.0.0.1', port)
+        try:
+            self.assertEqual(second.getsockname()[1], port)
+            self.assertTrue(second.getsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT))
+        finally:
+            first.close()
+            second.close()
+
+    def test_preload(self):
+        keys = self.app_config['JSON_SECRET_KEYS']
+        try:
+            workers.preload(self.app_config)
+            self.assertIs(jwt.key_store(keys), jwt.key_store(keys))
+            self.assertTrue(template_cache.compiled)
+        finally:
+            jwt.preloaded_key_stores.clear()
+
+    def test_stops_when_worker_cannot_start(self):
+        handlers = signal.getsignal(signal.SIGINT), signal.getsignal(signal.SIGTERM)
+        try:
+            with mock.patch('app.workers.serve_worker', lambda *_: os._exit(workers.boot_error_status)):
+                launcher = Workers('TestingConfig', self.app_config, 2)
+                self.assertEqual(launcher.run(), 1)
+            self.assertEqual(launcher.children, {})
+        finally:
+            signal.signal(signal.SIGINT, handlers[0])
+            signal.signal(signal.SIGTERM, handlers[1])
+
+    def test_run_configures_log_filters(self):
+        root_logger = logging.getLogger()
+        handlers = root_logger.handlers[:]
+        root_logger.handlers = []
+        try:
+            with mock.patch.object(config.TestingConfig, 'LOG_QUEUE', True), \
+                    mock.patch.object(config.TestingConfig, 'LOG_RATE_LIMIT', '50'), \
+                    mock.patch('app.session.setup', lambda app_config: session_middleware(SimpleCookieStorage())), \
+                    mock.patch('app.workers.web.run_app') as run_app:
+                workers.run('TestingConfig')
+            run_app.assert_called_once()
+            root_handler, = root_logger.handlers
+            self.assertIsInstance(root_handler, app_logging.LogQueueHandler)
+            log_filter, = root_handler.filters
+            self.assertEqual(log_filter.rate_limit, 50.0)
+        finally:
+            app_logging.stop_queue_listener()
+            root_logger.handlers = handlers